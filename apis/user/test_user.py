@@ -1,8 +1,14 @@
+import csv
+import io
+import json
 import unittest
 from flask import Flask
 from user import user
 from auth.auth_service import AuthService
 from config import TestingConfig
+from database import setup_db
+from database.models import db, Role, User
+from database.testing import assert_max_queries
 from unittest.mock import MagicMock
 
 
@@ -71,6 +77,7 @@ class UserBlueprintTestCase(unittest.TestCase):
         self.assertIn('new-fake-token', response.json['data']['access_token'])
 
     def test_get_groups(self):
+        self.auth_service_mock.get_roles_version.return_value = 'v1'
         self.auth_service_mock.get_roles_list.return_value = [
             'group1', 'group2'
         ]
@@ -79,14 +86,66 @@ class UserBlueprintTestCase(unittest.TestCase):
 
         self.assertEqual(response.status_code, 200)
         self.assertEqual(response.json['data'], ['group1', 'group2'])
+        self.assertEqual(response.headers['ETag'], '"v1"')
+
+    def test_get_groups_not_modified(self):
+        self.auth_service_mock.get_roles_version.return_value = 'v1'
+
+        response = self.client.get('/groups',
+                                   headers={'If-None-Match': '"v1"'})
+
+        self.assertEqual(response.status_code, 304)
+        self.auth_service_mock.get_roles_list.assert_not_called()
 
     def test_get_user_list(self):
-        self.auth_service_mock.get_users.return_value = ['user1', 'user2']
+        self.auth_service_mock.get_users.return_value = {
+            'items': ['user1', 'user2'],
+            'next_cursor': None,
+            'total': 2
+        }
 
         response = self.client.get('/user')
 
         self.assertEqual(response.status_code, 200)
-        self.assertEqual(response.json['data'], ['user1', 'user2'])
+        self.assertEqual(response.json['data'], {
+            'items': ['user1', 'user2'],
+            'next_cursor': None,
+            'total': 2
+        })
+
+    def test_get_user_list_with_pagination(self):
+        self.auth_service_mock.get_users.return_value = {
+            'items': ['user1'],
+            'next_cursor': 'abc',
+            'total': None
+        }
+
+        response = self.client.get(
+            '/user?limit=1&role=admin&username_prefix=us&include_total=false')
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json['data']['next_cursor'], 'abc')
+        self.auth_service_mock.get_users.assert_called_once_with(
+            limit=1,
+            cursor=None,
+            role='admin',
+            username_prefix='us',
+            email=None,
+            with_total=False)
+
+    def test_get_user_list_bad_cursor(self):
+        self.auth_service_mock.get_users.side_effect = ValueError(
+            'Invalid cursor.')
+
+        response = self.client.get('/user?cursor=bad')
+
+        self.assertEqual(response.status_code, 400)
+
+    def test_get_user_list_rejects_non_integer_limit(self):
+        response = self.client.get('/user?limit=abc')
+
+        self.assertEqual(response.status_code, 400)
+        self.auth_service_mock.get_users.assert_not_called()
 
     def test_add_user(self):
         self.auth_service_mock.create_user.return_value = {
@@ -135,5 +194,219 @@ class UserBlueprintTestCase(unittest.TestCase):
         self.assertEqual(response.json['data']['username'], 'existinguser')
 
 
+class UserQueryBudgetTestCase(unittest.TestCase):
+    """
+    Runs the blueprint against SQLite and asserts how many queries each
+    endpoint may issue, so lazy loads per user do not creep back in.
+    """
+
+    def setUp(self):
+        self.app = Flask(__name__)
+        self.app.register_blueprint(user)
+        self.app.config.from_object(TestingConfig)
+        self.app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite://'
+        setup_db(self.app)
+        self.app.config['AUTH_SERVICE'] = AuthService(
+            self.app.config['AUTH_CONFIG'])
+        self.client = self.app.test_client()
+
+        with self.app.app_context():
+            self.role_id = Role.query.filter_by(name='user').one().id
+            db.session.execute(User.__table__.insert(), [{
+                'id': f'user-{i:03d}',
+                'username': f'user{i:03d}',
+                'email': f'user{i:03d}@example.com',
+                'role_id': self.role_id,
+                'pw_hash': 'unused',
+            } for i in range(20)])
+            db.session.commit()
+
+        self.ctx = self.app.app_context()
+        self.ctx.push()
+
+    def tearDown(self):
+        self.ctx.pop()
+        with self.app.app_context():
+            db.drop_all()
+
+    def test_login_and_refresh(self):
+        with assert_max_queries(self, 2):
+            response = self.client.post('/login',
+                                        json={
+                                            'username': 'admin',
+                                            'password': 'admin123'
+                                        })
+        self.assertEqual(response.status_code, 200)
+
+        with assert_max_queries(self, 3):
+            response = self.client.post('/refresh')
+        self.assertEqual(response.status_code, 200)
+
+    def test_login_is_throttled_with_429(self):
+        throttle = self.app.config['AUTH_SERVICE'].login_throttle
+        throttle.user_limiter.limit = 1
+        self.client.post('/login',
+                         json={
+                             'username': 'admin',
+                             'password': 'wrong'
+                         })
+
+        with assert_max_queries(self, 0):
+            response = self.client.post('/login',
+                                        json={
+                                            'username': 'admin',
+                                            'password': 'admin123'
+                                        })
+
+        self.assertEqual(response.status_code, 429)
+        self.assertGreater(int(response.headers['Retry-After']), 0)
+
+    def test_get_groups_served_from_catalog(self):
+        with assert_max_queries(self, 0):
+            response = self.client.get('/groups')
+
+        self.assertEqual([g['name'] for g in response.json['data']],
+                         ['admin', 'user'])
+
+    def test_get_user_list(self):
+        with assert_max_queries(self, 2):
+            response = self.client.get('/user')
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.json['data']['items']), 21)
+
+    def test_user_crud(self):
+        with assert_max_queries(self, 2):
+            response = self.client.post('/user',
+                                        json={
+                                            'username': 'newuser',
+                                            'password': 'password123',
+                                            'email': 'new@example.com',
+                                            'role_id': self.role_id
+                                        })
+        self.assertEqual(response.json['data']['role'], 'user')
+        userid = response.json['data']['id']
+
+        with assert_max_queries(self, 1):
+            self.client.get(f'/user/{userid}')
+        with assert_max_queries(self, 3):
+            self.client.put(f'/user/{userid}',
+                            json={
+                                'username': 'renamed',
+                                'email': 'renamed@example.com'
+                            })
+        with assert_max_queries(self, 2):
+            response = self.client.delete(f'/user/{userid}')
+        self.assertEqual(response.status_code, 200)
+
+    def test_user_changes(self):
+        self.app.config['AUTH_SERVICE'].user_changes_settle_seconds = 0
+        seen, cursor, has_more = set(), None, True
+        while has_more:
+            with assert_max_queries(self, 2):
+                response = self.client.get('/user/changes',
+                                           query_string={
+                                               'limit': 8,
+                                               **({'cursor': cursor}
+                                                  if cursor else {})
+                                           })
+            data = response.json['data']
+            seen.update(item['id'] for item in data['items'])
+            cursor, has_more = data['next_cursor'], data['has_more']
+        self.assertEqual(len(seen), 21)
+
+        self.client.put('/user/user-003', json={'email': 'new@example.com'})
+        self.client.delete('/user/user-004')
+        response = self.client.get('/user/changes',
+                                   query_string={'cursor': cursor})
+
+        data = response.json['data']
+        self.assertEqual([item['id'] for item in data['items']], ['user-003'])
+        self.assertEqual([item['id'] for item in data['deleted']],
+                         ['user-004'])
+        self.assertFalse(data['has_more'])
+
+        response = self.client.get(
+            '/user/changes', query_string={'cursor': data['next_cursor']})
+        self.assertEqual(response.json['data']['items'], [])
+        self.assertEqual(response.json['data']['deleted'], [])
+
+    def test_user_changes_rejects_bad_cursor(self):
+        response = self.client.get('/user/changes',
+                                   query_string={'cursor': 'bm9wZQ'})
+
+        self.assertEqual(response.status_code, 400)
+
+        response = self.client.get('/user/changes',
+                                   query_string={'limit': 'abc'})
+        self.assertEqual(response.status_code, 400)
+
+    def test_bulk_endpoints(self):
+        users = [{
+            'username': f'bulk{i}',
+            'email': f'bulk{i}@example.com',
+            'password': 'password123',
+            'role_id': self.role_id
+        } for i in range(3)]
+
+        with assert_max_queries(self, 2):
+            response = self.client.post('/user/bulk', json={'users': users})
+        ids = [r['id'] for r in response.json['data']['results']]
+        self.assertEqual(response.json['data']['succeeded'], 3)
+
+        with assert_max_queries(self, 3):
+            response = self.client.put('/user/bulk',
+                                       json={
+                                           'users': [{
+                                               'id': user_id,
+                                               'experiments': 1
+                                           } for user_id in ids]
+                                       })
+        self.assertEqual(response.json['data']['failed'], 0)
+
+        with assert_max_queries(self, 3):
+            response = self.client.post('/user/bulk/delete',
+                                        json={'ids': ids})
+        self.assertEqual(response.json['data']['succeeded'], 3)
+
+        response = self.client.post('/user/bulk', json={'users': 'nope'})
+        self.assertEqual(response.status_code, 400)
+        response = self.client.post('/user/bulk', json=users)
+        self.assertEqual(response.status_code, 400)
+        response = self.client.put('/user/bulk', data='users')
+        self.assertEqual(response.status_code, 400)
+        response = self.client.post('/user/bulk/delete')
+        self.assertEqual(response.status_code, 400)
+
+    def test_export_ndjson(self):
+        self.app.config['AUTH_SERVICE'].user_export_batch_size = 8
+        with assert_max_queries(self, 1):
+            response = self.client.get('/user/export')
+            lines = response.data.decode().splitlines()
+
+        self.assertEqual(response.mimetype, 'application/x-ndjson')
+        rows = [json.loads(line) for line in lines]
+        self.assertEqual(len(rows), 21)
+        self.assertEqual(rows[1]['username'], 'user000')
+        self.assertEqual(rows[1]['role'], 'user')
+        self.assertNotIn('pw_hash', rows[1])
+
+    def test_export_csv(self):
+        self.app.config['AUTH_SERVICE'].user_export_batch_size = 8
+        with assert_max_queries(self, 1):
+            response = self.client.get('/user/export?format=csv')
+            rows = list(csv.DictReader(io.StringIO(response.data.decode())))
+
+        self.assertEqual(response.mimetype, 'text/csv')
+        self.assertEqual(len(rows), 21)
+        self.assertEqual(rows[-1]['email'], 'user019@example.com')
+        self.assertEqual(rows[-1]['role'], 'user')
+
+    def test_export_rejects_unknown_format(self):
+        response = self.client.get('/user/export?format=xml')
+
+        self.assertEqual(response.status_code, 400)
+
+
 if __name__ == '__main__':
     unittest.main()
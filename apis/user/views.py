@@ -1,17 +1,43 @@
-from flask import Blueprint, jsonify, request, current_app
+from flask import Blueprint, jsonify, request, current_app, \
+    stream_with_context
+from auth.auth_service import USER_EXPORT_COLUMNS
+from auth.login_throttle import LoginThrottled
+from utils.http_layer import etag_matches
+from utils.streaming import csv_chunks, ndjson_chunks
 from utils.utils import make_response
 from log import logging
 
 user = Blueprint('user', __name__)
 
 
+def _int_arg(name):
+    # 非整数参数按客户端错误处理，而不是静默回退为默认值
+    value = request.args.get(name)
+    if value is None:
+        return None
+    try:
+        return int(value)
+    except ValueError:
+        raise ValueError(f'{name} must be an integer') from None
+
+
+def _json_object():
+    # 请求体缺失、不是 JSON 或顶层不是对象都属于客户端错误
+    body = request.get_json(silent=True)
+    if not isinstance(body, dict):
+        raise ValueError('request body must be a JSON object')
+    return body
+
+
 @user.route('/login', methods=['POST'])
 def login():
     try:
         username = request.json.get('username')
         password = request.json.get('password')
         auth_service = current_app.config['AUTH_SERVICE']
-        response = auth_service.authenticate(username, password)
+        response = auth_service.authenticate(username,
+                                             password,
+                                             client_ip=request.remote_addr)
 
         if 'error' in response:
             return make_response(500, data=None, message=response['message'])
@@ -43,6 +69,11 @@ def login():
 
         logging.info(f'login success: username:{username}')
         return resp
+    except LoginThrottled as e:
+        logging.warning(f'login username:{username} throttled by {e.scope}')
+        resp = make_response(429, data=None, message=str(e))
+        resp[0].headers['Retry-After'] = str(e.retry_after)
+        return resp
     except Exception as e:
         logging.error(f'login username:{username} error : {e}')
         return make_response(500, data=None, message=str(e))
@@ -52,8 +83,9 @@ def login():
 def logout():
     try:
         refresh_token = request.cookies.get('refresh_token')
+        access_token = request.cookies.get('access_token')
         auth_service = current_app.config['AUTH_SERVICE']
-        username = auth_service.logout(refresh_token)
+        username = auth_service.logout(refresh_token, access_token)
         logging.info(f"logout success, username：{username}")
 
         resp = make_response(200,
@@ -122,12 +154,21 @@ def refresh():
 def get_groups():
     try:
         auth_service = current_app.config['AUTH_SERVICE']
+        # 角色目录版本作为 ETag，未变化时直接返回 304
+        etag = auth_service.get_roles_version()
+        if etag_matches(etag):
+            resp = current_app.response_class(status=304)
+            resp.set_etag(etag)
+            return resp
+
         groups = auth_service.get_roles_list()
 
         # 返回包含两个组的列表
-        return make_response(200,
+        resp = make_response(200,
                              data=groups,
                              message="Groups fetched successfully")
+        resp[0].set_etag(etag)
+        return resp
     except Exception as e:
         logging.error(f'Error fetching groups: {e}')
         return make_response(500,
@@ -139,11 +180,21 @@ def get_groups():
 def get_user_list():
     try:
         auth_service = current_app.config['AUTH_SERVICE']
-        user_list = auth_service.get_users()
+        user_list = auth_service.get_users(
+            limit=_int_arg('limit'),
+            cursor=request.args.get('cursor'),
+            role=request.args.get('role'),
+            username_prefix=request.args.get('username_prefix'),
+            email=request.args.get('email'),
+            with_total=request.args.get('include_total', 'true') != 'false')
         logging.info('get user list success')
         return make_response(200,
                              data=user_list,
                              message="get user list success")
+    except ValueError as e:
+        return make_response(400,
+                             data=None,
+                             message=f'get user list error: {str(e)}')
     except Exception as e:
         logging.error(f'logout error: {e}')
         return make_response(500,
@@ -151,6 +202,59 @@ def get_user_list():
                              message=f'get user list error: {str(e)}')
 
 
+@user.route('/user/changes', methods=['GET'])
+def get_user_changes():
+    try:
+        auth_service = current_app.config['AUTH_SERVICE']
+        changes = auth_service.get_user_changes(
+            cursor=request.args.get('cursor'),
+            limit=_int_arg('limit'))
+        logging.info('get user changes success')
+        return make_response(200,
+                             data=changes,
+                             message="get user changes success")
+    except ValueError as e:
+        return make_response(400,
+                             data=None,
+                             message=f'get user changes error: {str(e)}')
+    except Exception as e:
+        logging.error(f'get user changes error: {e}')
+        return make_response(500,
+                             data=None,
+                             message=f'get user changes error: {str(e)}')
+
+
+@user.route('/user/export', methods=['GET'])
+def export_users():
+    export_format = request.args.get('format', 'ndjson')
+    if export_format not in ('ndjson', 'csv'):
+        return make_response(400,
+                             data=None,
+                             message=f'unsupported export format: '
+                             f'{export_format}')
+    try:
+        auth_service = current_app.config['AUTH_SERVICE']
+        batches = auth_service.export_users()
+        # 逐批写出，内存占用与用户总数无关
+        if export_format == 'csv':
+            chunks = csv_chunks(batches, USER_EXPORT_COLUMNS)
+            mimetype = 'text/csv'
+        else:
+            chunks = ndjson_chunks(batches)
+            mimetype = 'application/x-ndjson'
+        resp = current_app.response_class(stream_with_context(chunks),
+                                          mimetype=mimetype)
+        resp.headers['Content-Disposition'] = \
+            f'attachment; filename=users.{export_format}'
+        logging.info(f'export users start, format:{export_format}')
+        return resp
+    except Exception as e:
+        logging.error(f'export users error: {e}')
+        return make_response(500,
+                             data=None,
+                             message=f'export users error: {str(e)}')
+
+
 @user.route('/user', methods=['POST'])
 def add_user():
     try:
@@ -170,6 +274,69 @@ def add_user():
                              message=f'User creation error: {str(e)}')
 
 
+@user.route('/user/bulk', methods=['POST'])
+def bulk_create_users():
+    try:
+        auth_service = current_app.config['AUTH_SERVICE']
+        summary = auth_service.bulk_create_users(_json_object().get('users'))
+        logging.info(f'bulk create users, succeeded:{summary["succeeded"]}, '
+                     f'failed:{summary["failed"]}')
+        return make_response(200,
+                             data=summary,
+                             message="bulk create users finished")
+    except ValueError as e:
+        return make_response(400,
+                             data=None,
+                             message=f'bulk create users error: {str(e)}')
+    except Exception as e:
+        logging.error(f'bulk create users error: {e}')
+        return make_response(500,
+                             data=None,
+                             message=f'bulk create users error: {str(e)}')
+
+
+@user.route('/user/bulk', methods=['PUT'])
+def bulk_update_users():
+    try:
+        auth_service = current_app.config['AUTH_SERVICE']
+        summary = auth_service.bulk_update_users(_json_object().get('users'))
+        logging.info(f'bulk update users, succeeded:{summary["succeeded"]}, '
+                     f'failed:{summary["failed"]}')
+        return make_response(200,
+                             data=summary,
+                             message="bulk update users finished")
+    except ValueError as e:
+        return make_response(400,
+                             data=None,
+                             message=f'bulk update users error: {str(e)}')
+    except Exception as e:
+        logging.error(f'bulk update users error: {e}')
+        return make_response(500,
+                             data=None,
+                             message=f'bulk update users error: {str(e)}')
+
+
+@user.route('/user/bulk/delete', methods=['POST'])
+def bulk_delete_users():
+    try:
+        auth_service = current_app.config['AUTH_SERVICE']
+        summary = auth_service.bulk_delete_users(_json_object().get('ids'))
+        logging.info(f'bulk delete users, succeeded:{summary["succeeded"]}, '
+                     f'failed:{summary["failed"]}')
+        return make_response(200,
+                             data=summary,
+                             message="bulk delete users finished")
+    except ValueError as e:
+        return make_response(400,
+                             data=None,
+                             message=f'bulk delete users error: {str(e)}')
+    except Exception as e:
+        logging.error(f'bulk delete users error: {e}')
+        return make_response(500,
+                             data=None,
+                             message=f'bulk delete users error: {str(e)}')
+
+
 @user.route('/user/<string:userid>', methods=['PUT'])
 def update_user(userid):
     try:
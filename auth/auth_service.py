@@ -1,9 +1,148 @@
+import base64
+import datetime
 import time
+import uuid
 import jwt
 from jwt import ExpiredSignatureError
-from database.models import User, db, Token, Role
+from database.models import User, UserTombstone, db, db_now, db_now_minus, \
+    role_catalog, USERNAME_UNIQUE_INDEX, EMAIL_UNIQUE_INDEX
+from sqlalchemy import bindparam, inspect, or_, select, tuple_
 from sqlalchemy.exc import IntegrityError
 from sqlalchemy.orm.exc import NoResultFound
+from auth.login_throttle import create_login_throttle
+from auth.password_hasher import password_hasher
+from auth.revocation import create_revocation_list
+from auth.token_cache import TokenCache
+from auth.token_store import UPSERT_DIALECTS, create_token_store
+from database.replicas import primary_reads
+from metrics import login_attempts, token_verifications
+
+# 导出的字段，与 User.to_dict 一致
+USER_EXPORT_COLUMNS = [
+    'id', 'username', 'email', 'role_id', 'role', 'experiments', 'created_at',
+    'updated_at'
+]
+
+
+def encode_cursor(value):
+    return base64.urlsafe_b64encode(str(value).encode()).decode().rstrip('=')
+
+
+def decode_cursor(cursor):
+    try:
+        padding = '=' * (-len(cursor) % 4)
+        return base64.b64decode(cursor + padding, altchars=b'-_',
+                                validate=True).decode()
+    except (ValueError, UnicodeDecodeError):
+        raise ValueError("Invalid cursor.")
+
+
+# 批量接口允许写入的字段及其长度上限（与 User 表定义一致）
+USER_BULK_FIELDS = {
+    'username': 16,
+    'email': 120,
+    'password': None,
+    'role_id': None,
+    'experiments': None,
+}
+
+
+def validate_user_item(item, partial=False):
+    """
+    Check one item of a bulk payload. Returns an error message, or None if
+    the item is valid. With ``partial`` only the given fields are checked.
+    """
+    if not isinstance(item, dict):
+        return "Each item must be an object."
+    allowed = set(USER_BULK_FIELDS) | ({'id'} if partial else set())
+    unknown = sorted(set(item) - allowed)
+    if unknown:
+        return f"Unknown fields: {', '.join(unknown)}."
+    if not partial:
+        missing = [
+            field for field in ('username', 'email', 'password', 'role_id')
+            if field not in item
+        ]
+        if missing:
+            return f"Missing fields: {', '.join(missing)}."
+    for field in ('username', 'email', 'password'):
+        if field not in item:
+            continue
+        value = item[field]
+        if not isinstance(value, str) or not value:
+            return f"{field} must be a non-empty string."
+        max_length = USER_BULK_FIELDS[field]
+        if max_length is not None and len(value) > max_length:
+            return f"{field} must be at most {max_length} characters."
+    if 'role_id' in item and (type(item['role_id']) is not int
+                              or role_catalog.get(item['role_id']) is None):
+        return "Unknown role_id."
+    experiments = item.get('experiments')
+    if experiments is not None and type(experiments) is not int:
+        return "experiments must be an integer."
+    return None
+
+
+def bulk_result(index, status, user_id=None, message=None):
+    result = {'index': index, 'id': user_id, 'status': status}
+    if message is not None:
+        result['message'] = message
+    return result
+
+
+def bulk_summary(results):
+    failed = sum(1 for result in results if result['status'] == 'failed')
+    return {
+        'results': results,
+        'succeeded': len(results) - failed,
+        'failed': failed
+    }
+
+
+def encode_sync_cursor(user_position, tombstone_position):
+    """
+    Encode the (timestamp, id) reached in the user and tombstone streams.
+    """
+    parts = []
+    for position in (user_position, tombstone_position):
+        if position is None:
+            parts.extend(['', ''])
+        else:
+            parts.extend([position[0].isoformat(), position[1]])
+    return encode_cursor('|'.join(parts))
+
+
+def decode_sync_cursor(cursor):
+    if cursor is None:
+        return None, None
+    parts = decode_cursor(cursor).split('|')
+    if len(parts) != 4:
+        raise ValueError("Invalid cursor.")
+    positions = []
+    for changed_at, key in (parts[:2], parts[2:]):
+        if not changed_at:
+            positions.append(None)
+            continue
+        try:
+            positions.append((datetime.datetime.fromisoformat(changed_at),
+                              key))
+        except ValueError:
+            raise ValueError("Invalid cursor.")
+    return positions[0], positions[1]
+
+
+def unique_violation_message(error):
+    """
+    Translate an IntegrityError from the user unique indexes into the
+    message the API returns.
+    """
+    detail = str(error.orig)
+    if USERNAME_UNIQUE_INDEX in detail:
+        return "Username is already in use."
+    if EMAIL_UNIQUE_INDEX in detail:
+        return "Email is already in use."
+    return f"Database error: {error}"
+
 
 class AuthService:
 
@@ -13,17 +152,56 @@ class AuthService:
         self.access_token_max_age = config.get("ACCESS_TOKEN_MAX_AGE", 10 * 60)
         self.refresh_token_max_age = config.get("REFRESH_TOKEN_MAX_AGE",
                                                 3 * 60 * 60)
-
-    def authenticate(self, username, password):
+        self.user_page_size = config.get("USER_PAGE_SIZE", 50)
+        self.user_page_max = config.get("USER_PAGE_MAX", 500)
+        self.user_export_batch_size = config.get("USER_EXPORT_BATCH_SIZE",
+                                                 1000)
+        self.user_changes_settle_seconds = config.get(
+            "USER_CHANGES_SETTLE_SECONDS", 30)
+        self.user_bulk_max = config.get("USER_BULK_MAX", 1000)
+        self.user_bulk_chunk_size = config.get("USER_BULK_CHUNK_SIZE", 500)
+        self.leeway = 60
+        self.token_store = create_token_store(
+            config,
+            access_ttl=self.access_token_max_age + self.leeway,
+            refresh_ttl=self.refresh_token_max_age + self.leeway)
+        # 本进程内令牌刚变更（登录、刷新、注销）的用户在该时间内读主库校验，
+        # 避免副本复制延迟期间仍接受旧令牌
+        self.token_cache = TokenCache(
+            max_size=config.get("TOKEN_CACHE_SIZE", 10000),
+            ttl=config.get("TOKEN_CACHE_TTL", 60),
+            changed_ttl=config.get("TOKEN_PRIMARY_READ_SECONDS", 5))
+        # 无状态模式：访问令牌只在本地校验签名和有效期，注销的令牌进入撤销列表
+        self.stateless = config.get("STATELESS_ACCESS_TOKENS", False)
+        self.revocations = create_revocation_list(
+            config, ttl=self.access_token_max_age + self.leeway)
+        self.login_throttle = create_login_throttle(config)
+
+    def authenticate(self, username, password, client_ip=None):
+        # 超出限流的尝试在查询数据库和校验密码之前拒绝
+        if self.login_throttle is not None:
+            self.login_throttle.check(username, client_ip)
+
+        # 缺少用户名或类型不对时按用户不存在处理
+        if not isinstance(username, str):
+            login_attempts.inc(result='unknown_user')
+            raise Exception(f"username:{username} not found.")
         # 查询数据库以获取用户
         try:
-            user = User.query.filter_by(username=username).one()
+            user = User.query.filter(
+                User.username_key == username.lower()).one()
         except NoResultFound as e:
+            login_attempts.inc(result='unknown_user')
             raise Exception(f"username:{username} not found.{e}")
+        # 令牌统一使用数据库中的用户名
+        username = user.username
 
         # 检查密码是否匹配
         if not user.check_password(password):
+            login_attempts.inc(result='bad_password')
             raise Exception("The provided password is incorrect.")
+        # 在提交前序列化，避免提交后重新加载用户
+        userinfo = user.to_dict()
 
         # 如果认证成功，生成访问令牌和刷新令牌
         access_token = self.generate_token(
@@ -31,19 +209,20 @@ class AuthService:
         refresh_token = self.generate_token(
             username, expiration=self.refresh_token_max_age)
 
-        # 将刷新令牌存储到数据库中
-        self.store_refresh_token(username, refresh_token)
-        self.store_token(username, access_token)
+        # 将访问令牌和刷新令牌一次性存储到数据库中
+        self.store_tokens(username, access_token, refresh_token)
+        login_attempts.inc(result='success')
 
         return {
             'access_token': access_token,
             'refresh_token': refresh_token,
-            'userinfo': user.to_dict()
+            'userinfo': userinfo
         }
 
     def generate_token(self, username, expiration=10 * 60):
         payload = {
             'sub': username,
+            'jti': uuid.uuid4().hex,
             'iat': time.time(),
             'exp': time.time() + expiration
         }
@@ -65,10 +244,14 @@ class AuthService:
         payload = self.decode_token(refresh_token)
         username = payload.get('sub')
 
+        if not isinstance(username, str):
+            raise Exception("Username not found.")
         try:
-            user = User.query.filter_by(username=username).one()
+            user = User.query.filter(
+                User.username_key == username.lower()).one()
         except NoResultFound:
             raise Exception("Username not found.")
+        userinfo = user.to_dict()
 
         # 检查刷新令牌是否在数据库中并且是有效的
         if not self.is_valid_refresh_token(username, refresh_token):
@@ -77,23 +260,38 @@ class AuthService:
         # 如果刷新令牌是有效的，生成新的访问令牌
         access_token = self.generate_token(
             username, expiration=self.access_token_max_age)
-        self.store_token(username, access_token)
+        if not self.stateless:
+            self.store_token(username, access_token)
 
         return {
             'access_token': access_token,
             'refresh_token': refresh_token,
-            'userinfo': user.to_dict()
+            'userinfo': userinfo
         }
 
-    def logout(self, refresh_token):
+    def logout(self, refresh_token, access_token=None):
         payload = self.decode_token(refresh_token, verify_exp=False)
         username = payload.get('sub')
 
         # 删除刷新令牌
         self.delete_refresh_token(username)
+        if access_token:
+            self.revoke_access_token(access_token)
 
         return username
 
+    def revoke_access_token(self, access_token):
+        """
+        Put the token's jti on the revocation list until it expires.
+        """
+        try:
+            payload = self.decode_token(access_token, verify_exp=False)
+        except Exception:
+            return
+        if payload.get('jti'):
+            self.revocations.revoke(payload['jti'],
+                                    payload.get('exp', 0) + self.leeway)
+
     def is_valid_refresh_token(self, username, refresh_token):
         token = self.get_token_from_db(username)
         if token is None or token.refresh_token != refresh_token:
@@ -108,89 +306,225 @@ class AuthService:
 
     def verify_token_expiration(self, token):
         try:
-            leeway = 60
             payload = jwt.decode(token,
                                  self.secret,
                                  algorithms=[self.algorithm],
                                  options={'verify_exp': True},
-                                 leeway=leeway)
+                                 leeway=self.leeway)
             username = payload.get('sub')
-            if not self.is_valid_token(username, token):
+            if self.stateless and payload.get('jti'):
+                if self.revocations.is_revoked(payload['jti']):
+                    raise Exception("Token has expired.")
+                token_verifications.inc(result='stateless')
+                return True, payload
+            # 命中缓存时跳过数据库查询
+            if self.token_cache.get(token) == username:
+                token_verifications.inc(result='cache_hit')
+                return True, payload
+            if self.token_cache.recently_changed(username):
+                with primary_reads():
+                    is_valid = self.is_valid_token(username, token)
+            else:
+                is_valid = self.is_valid_token(username, token)
+            if not is_valid:
                 raise Exception("Token has expired.")
+            self.token_cache.set(token, username, payload.get('exp'))
+            token_verifications.inc(result='cache_miss')
             return True, payload
         except ExpiredSignatureError:
+            token_verifications.inc(result='failure')
             raise Exception("Token has expired.")
+        except Exception:
+            token_verifications.inc(result='failure')
+            raise
 
-    def store_refresh_token(self, username, refresh_token):
-        token = self.get_token_from_db(username)
-
-        if token:
-            # 如果已存在具有相同用户名的记录，则更新它
-            token.refresh_token = refresh_token
-        else:
-            # 如果不存在具有相同用户名的记录，则创建一个新的记录
-            token = Token(username=username, refresh_token=refresh_token)
+    def store_tokens(self, username, access_token, refresh_token):
+        self.token_store.save(username,
+                              token=access_token,
+                              refresh_token=refresh_token)
+        self.token_cache.invalidate(username)
 
-        db.session.add(token)
-        db.session.commit()
+    def store_refresh_token(self, username, refresh_token):
+        self.token_store.set_refresh_token(username, refresh_token)
 
     def store_token(self, username, access_token):
-        token = self.get_token_from_db(username)
-
-        if token:
-            # 如果已存在具有相同用户名的记录，则更新它
-            token.token = access_token
-        else:
-            # 如果不存在具有相同用户名的记录，则创建一个新的记录
-            token = Token(username=username, token=access_token)
-
-        db.session.add(token)
-        db.session.commit()
+        self.token_store.set_token(username, access_token)
+        self.token_cache.invalidate(username)
 
     def delete_refresh_token(self, username):
-        token = self.get_token_from_db(username)
-        if token:
-            db.session.delete(token)
-            db.session.commit()
+        self.token_store.delete(username)
+        self.token_cache.invalidate(username)
 
     def get_token_from_db(self, username):
         try:
-            token = Token.query.filter_by(username=username).first()
+            token = self.token_store.get(username)
         except Exception:
             raise Exception("Invalid refresh token.")
 
         return token
 
+    def reload_user(self, user):
+        """
+        Reload a user expired by commit in one query.
+        """
+        # 通过 identity 取主键，访问 user.id 本身会触发一次刷新查询
+        user_id = inspect(user).identity[0]
+        return User.query.filter_by(id=user_id).one()
+
     def get_roles_list(self):
-        # 使用 SQLAlchemy 查询来获取所有role记录
-        roles = Role.query.all()
+        # 角色从进程内的角色目录读取，不查询数据库
+        roles = role_catalog.roles()
 
         # 将role记录转换为字典列表，以便于序列化为 JSON 格式
         role_list = [role.to_dict() for role in roles]
 
         return role_list
 
-    def get_users(self):
-        users = User.query.all()
+    def get_roles_version(self):
+        return role_catalog.get_version()
+
+    def get_users(self,
+                  limit=None,
+                  cursor=None,
+                  role=None,
+                  username_prefix=None,
+                  email=None,
+                  with_total=True):
+        """
+        Return one page of users ordered by id (keyset pagination).
+
+        ``cursor`` is the ``next_cursor`` of the previous page; ``limit`` is
+        capped at ``USER_PAGE_MAX``.
+        """
+        limit = self._page_limit(limit)
+
+        query = User.query
+        if role is not None:
+            catalog_role = role_catalog.get_by_name(role)
+            query = query.filter(
+                User.role_id == (catalog_role.id if catalog_role else None))
+        if username_prefix:
+            query = query.filter(
+                User.username.startswith(username_prefix, autoescape=True))
+        if email is not None:
+            query = query.filter(User.email_key == email.lower())
+
+        total = query.order_by(None).count() if with_total else None
+
+        if cursor is not None:
+            query = query.filter(User.id > decode_cursor(cursor))
+        # 多取一条用于判断是否还有下一页
+        users = query.order_by(User.id).limit(limit + 1).all()
+        next_cursor = None
+        if len(users) > limit:
+            users = users[:limit]
+            next_cursor = encode_cursor(users[-1].id)
 
         # 将user记录转换为字典列表，以便于序列化为 JSON 格式
         user_list = [user.to_dict() for user in users]
 
-        return user_list
+        return {'items': user_list, 'next_cursor': next_cursor, 'total': total}
+
+    def _page_limit(self, limit):
+        if limit is None:
+            return self.user_page_size
+        if limit < 1:
+            raise ValueError("limit must be a positive integer.")
+        return min(limit, self.user_page_max)
+
+    def get_user_changes(self, cursor=None, limit=None):
+        """
+        Return the users changed and deleted since ``cursor``, oldest first.
+
+        Users are read in (updated_at, id) order and tombstones in
+        (deleted_at, id) order, up to ``limit`` of each. ``next_cursor``
+        always holds the position reached, so a client keeps it for the next
+        poll; ``has_more`` means it should fetch again right away. Without a
+        cursor every user and tombstone is returned. A user that was deleted
+        and re-created can appear in both lists; the later timestamp wins.
+
+        Timestamps come from the writing transaction's start (``now()`` on
+        PostgreSQL), not from its commit, so a slow transaction can commit
+        rows older than a position a client already passed. Only rows older
+        than ``user_changes_settle_seconds`` are therefore returned; the
+        setting must exceed the longest write transaction (e.g. a bulk
+        chunk), and changes reach clients that much later.
+        """
+        limit = self._page_limit(limit)
+        user_position, tombstone_position = decode_sync_cursor(cursor)
+
+        settle = self.user_changes_settle_seconds
+        users = self._changed_since(User.query, User.updated_at, User.id,
+                                    user_position, limit, settle)
+        tombstones = self._changed_since(UserTombstone.query,
+                                         UserTombstone.deleted_at,
+                                         UserTombstone.id, tombstone_position,
+                                         limit, settle)
+        has_more = len(users) > limit or len(tombstones) > limit
+        users, tombstones = users[:limit], tombstones[:limit]
+
+        if users:
+            user_position = (users[-1].updated_at, users[-1].id)
+        if tombstones:
+            tombstone_position = (tombstones[-1].deleted_at, tombstones[-1].id)
+        return {
+            'items': [user.to_dict() for user in users],
+            'deleted': [tombstone.to_dict() for tombstone in tombstones],
+            'next_cursor': encode_sync_cursor(user_position,
+                                              tombstone_position),
+            'has_more': has_more
+        }
+
+    @staticmethod
+    def _changed_since(query, changed_at, key, position, limit, settle):
+        if position is not None:
+            # 行值比较可以直接使用 (changed_at, id) 上的复合索引
+            query = query.filter(
+                tuple_(changed_at, key) > tuple_(*position))
+        if settle > 0:
+            # 尚未超过结算窗口的行可能还有更早时间戳的事务未提交，暂不返回
+            query = query.filter(changed_at < db_now_minus(settle))
+        # 多取一条用于判断是否还有下一页
+        return query.order_by(changed_at, key).limit(limit + 1).all()
+
+    def export_users(self):
+        """
+        Stream every user as plain dicts, in batches of
+        ``user_export_batch_size``.
+
+        Rows are read as Core rows through a server-side cursor, so neither
+        ORM objects nor the whole table are held in memory. The query runs
+        before this returns, so database errors surface immediately; the
+        returned generator must be consumed inside the app context.
+        """
+        table = User.__table__
+        query = select(*[table.c[name] for name in USER_EXPORT_COLUMNS
+                         if name != 'role']).order_by(table.c.id)
+        result = db.session.execute(
+            query.execution_options(stream_results=True,
+                                    max_row_buffer=self.user_export_batch_size))
+        return self._export_batches(result)
+
+    def _export_batches(self, result):
+        try:
+            for rows in result.partitions(self.user_export_batch_size):
+                yield [
+                    dict(row._mapping, role=role_catalog.name_of(row.role_id))
+                    for row in rows
+                ]
+        finally:
+            result.close()
 
     def create_user(self, user_info):
         try:
-            if User.query.filter(User.username ==
-                                 user_info['username']).first() is not None:
-                raise Exception("Username is already in use.")
-            if User.query.filter(
-                    User.email == user_info['email']).first() is not None:
-                raise Exception("Email is already in use.")
-
             user = User(**user_info)
             db.session.add(user)
+            # 唯一性由数据库索引保证，冲突时从 IntegrityError 中识别
             db.session.commit()
-            return user.to_dict()
+            return self.reload_user(user).to_dict()
+        except IntegrityError as e:
+            db.session.rollback()
+            raise Exception(unique_violation_message(e))
         except Exception as e:
             raise Exception(e)
 
@@ -200,16 +534,6 @@ class AuthService:
             if not user:
                 raise Exception("User not found.")
 
-            if 'username' in user_info:
-                if User.query.filter(User.username == user_info['username'],
-                                     User.id != user_id).first() is not None:
-                    raise Exception("Username is already in use.")
-
-            if 'email' in user_info:
-                if User.query.filter(User.email == user_info['email'], User.id
-                                     != user_id).first() is not None:
-                    raise Exception("Email is already in use.")
-
             if 'password' in user_info:
                 user.set_password(user_info['password'])
 
@@ -218,20 +542,303 @@ class AuthService:
                     setattr(user, field, user_info[field])
 
             db.session.commit()
-            return user.to_dict()
+            return self.reload_user(user).to_dict()
 
         except IntegrityError as e:
             db.session.rollback()
-            raise Exception(f"Database error: {e}")
+            raise Exception(unique_violation_message(e))
 
     def delete_user(self, user_id):
-        user = User.query.filter_by(id=user_id).first()
-        if user is None:
+        deleted = db.session.execute(
+            User.__table__.delete().where(User.id == user_id))
+        if deleted.rowcount == 0:
+            db.session.rollback()
             raise Exception("User not found.")
-        db.session.delete(user)
+        # 删除与墓碑在同一事务中提交，增量同步不会漏掉删除
+        self._record_tombstones([user_id])
         db.session.commit()
         return user_id
 
+    def _record_tombstones(self, user_ids):
+        table = UserTombstone.__table__
+        rows = [{'id': user_id} for user_id in user_ids]
+        dialect = db.session.get_bind(mapper=UserTombstone).dialect.name
+        if dialect in UPSERT_DIALECTS:
+            # 以相同 id 重新创建后再次删除时刷新已有墓碑
+            stmt = UPSERT_DIALECTS[dialect](table).values(rows)
+            stmt = stmt.on_conflict_do_update(
+                index_elements=[table.c.id],
+                set_={'deleted_at': db_now()})
+        else:
+            stmt = table.insert().values(rows)
+        db.session.execute(stmt)
+
+    def bulk_create_users(self, users):
+        """
+        Create many users and return one result per item, in input order.
+
+        The whole payload is validated first and uniqueness is checked with a
+        single query. Passwords are hashed in parallel and the rows are
+        written with executemany, committing every ``user_bulk_chunk_size``
+        rows. A failing item does not stop the others.
+        """
+        self._check_bulk_payload(users)
+        results = [None] * len(users)
+        pending = {}
+        for index, item in enumerate(users):
+            error = validate_user_item(item)
+            if error:
+                results[index] = bulk_result(index, 'failed', message=error)
+            else:
+                pending[index] = item
+        self._check_bulk_unique(pending, results)
+
+        hashes = password_hasher.generate_many(
+            item['password'] for item in pending.values())
+        rows = {}
+        for (index, item), pw_hash in zip(pending.items(), hashes):
+            rows[index] = {
+                'id': str(uuid.uuid4()),
+                'username': item['username'],
+                'email': item['email'],
+                'role_id': item['role_id'],
+                'experiments': item.get('experiments'),
+                'pw_hash': pw_hash
+            }
+        self._write_bulk(User.__table__.insert(), rows, results, 'created',
+                         lambda row: row['id'])
+        return bulk_summary(results)
+
+    def bulk_update_users(self, users):
+        """
+        Update many users, each item holding the ``id`` and the fields to
+        change. Works like ``bulk_create_users``; items with the same set of
+        fields share one executemany UPDATE.
+        """
+        self._check_bulk_payload(users)
+        results = [None] * len(users)
+        pending = {}
+        for index, item in enumerate(users):
+            error = validate_user_item(item, partial=True)
+            if error is None and not isinstance(item.get('id'), str):
+                error = "id must be a string."
+            if error:
+                results[index] = bulk_result(index,
+                                             'failed',
+                                             message=error)
+            else:
+                pending[index] = item
+
+        existing = self._existing_user_ids(
+            [item['id'] for item in pending.values()])
+        seen = set()
+        for index, item in list(pending.items()):
+            if item['id'] not in existing or item['id'] in seen:
+                message = ("User not found." if item['id'] not in existing
+                           else "User is duplicated in the request.")
+                results[index] = bulk_result(index, 'failed', item['id'],
+                                             message)
+                del pending[index]
+            else:
+                seen.add(item['id'])
+        self._check_bulk_unique(pending, results)
+
+        with_password = [
+            index for index, item in pending.items() if 'password' in item
+        ]
+        hashes = password_hasher.generate_many(
+            pending[index]['password'] for index in with_password)
+        pw_hashes = dict(zip(with_password, hashes))
+        rows = {}
+        for index, item in pending.items():
+            row = {
+                field: value
+                for field, value in item.items()
+                if field not in ('id', 'password')
+            }
+            if index in pw_hashes:
+                row['pw_hash'] = pw_hashes[index]
+            row['user_id'] = item['id']
+            rows[index] = row
+
+        table = User.__table__
+        stmt = table.update().where(table.c.id == bindparam('user_id'))
+        # 校验之后被并发删除的用户不会被 UPDATE 匹配，按未找到处理
+        self._write_bulk(stmt,
+                         rows,
+                         results,
+                         'updated',
+                         lambda row: row['user_id'],
+                         unmatched="User not found.")
+        return bulk_summary(results)
+
+    def bulk_delete_users(self, user_ids):
+        """
+        Delete many users by id, writing their tombstones in the same
+        transactions, and return one result per id, in input order.
+        """
+        self._check_bulk_payload(user_ids)
+        results = [None] * len(user_ids)
+        existing = self._existing_user_ids(
+            [user_id for user_id in user_ids if isinstance(user_id, str)])
+        pending = []
+        for index, user_id in enumerate(user_ids):
+            if isinstance(user_id, str) and user_id in existing:
+                existing.discard(user_id)
+                pending.append(index)
+            else:
+                results[index] = bulk_result(index,
+                                             'failed',
+                                             user_id,
+                                             message="User not found.")
+
+        table = User.__table__
+        for start in range(0, len(pending), self.user_bulk_chunk_size):
+            chunk = pending[start:start + self.user_bulk_chunk_size]
+            ids = [user_ids[index] for index in chunk]
+            db.session.execute(table.delete().where(table.c.id.in_(ids)))
+            self._record_tombstones(ids)
+            db.session.commit()
+            for index in chunk:
+                results[index] = bulk_result(index, 'deleted',
+                                             user_ids[index])
+        return bulk_summary(results)
+
+    def _check_bulk_payload(self, items):
+        if not isinstance(items, list) or not items:
+            raise ValueError("Expected a non-empty list.")
+        if len(items) > self.user_bulk_max:
+            raise ValueError(
+                f"At most {self.user_bulk_max} items per request.")
+
+    def _existing_user_ids(self, user_ids):
+        if not user_ids:
+            return set()
+        return set(
+            db.session.execute(select(User.id).where(
+                User.id.in_(set(user_ids)))).scalars())
+
+    def _check_bulk_unique(self, pending, results):
+        """
+        Fail the items in ``pending`` whose username or email repeats within
+        the request or belongs to another user, using one query for all of
+        them. Failed items are removed from ``pending``.
+        """
+        claimed = {'username': {}, 'email': {}}
+        for index, item in list(pending.items()):
+            keys = {
+                field: item[field].lower()
+                for field in claimed if field in item
+            }
+            duplicated = [
+                field for field, key in keys.items()
+                if key in claimed[field]
+            ]
+            if duplicated:
+                results[index] = bulk_result(
+                    index,
+                    'failed',
+                    item.get('id'),
+                    message=f"{duplicated[0].capitalize()} is duplicated "
+                    f"in the request.")
+                del pending[index]
+                continue
+            for field, key in keys.items():
+                claimed[field][key] = index
+        if not claimed['username'] and not claimed['email']:
+            return
+
+        rows = db.session.execute(
+            select(User.id, User.username_key.label('username'),
+                   User.email_key.label('email')).where(
+                       or_(User.username_key.in_(claimed['username']),
+                           User.email_key.in_(claimed['email']))))
+        for row in rows:
+            for field in ('username', 'email'):
+                index = claimed[field].get(getattr(row, field))
+                if index in pending and pending[index].get('id') != row.id:
+                    results[index] = bulk_result(
+                        index,
+                        'failed',
+                        pending[index].get('id'),
+                        message=f"{field.capitalize()} is already in use.")
+                    del pending[index]
+
+    def _write_bulk(self,
+                    stmt,
+                    rows,
+                    results,
+                    status,
+                    id_of,
+                    unmatched=None):
+        """
+        Execute ``stmt`` for ``rows`` ({index: params}) with executemany,
+        one transaction per chunk. If a chunk hits a unique index (another
+        request wrote the same name meanwhile), its rows are retried one by
+        one so only the conflicting items fail. With ``unmatched``, rows the
+        statement did not match (e.g. users deleted meanwhile) fail with
+        that message instead of being reported as ``status``.
+        """
+        indexes = list(rows)
+        for start in range(0, len(indexes), self.user_bulk_chunk_size):
+            chunk = indexes[start:start + self.user_bulk_chunk_size]
+            try:
+                # executemany 要求参数的键一致，按字段组合分组执行
+                groups = {}
+                for index in chunk:
+                    groups.setdefault(tuple(sorted(rows[index])),
+                                      []).append(rows[index])
+                matched = 0
+                for params in groups.values():
+                    result = db.session.execute(stmt, params)
+                    if matched is not None and \
+                            result.supports_sane_multi_rowcount():
+                        matched += result.rowcount
+                    else:
+                        matched = None
+                lost = set()
+                if unmatched is not None and matched != len(chunk):
+                    # 行数不符或驱动不报告行数时，在同一事务内按 id 复查
+                    present = self._existing_user_ids(
+                        [id_of(rows[index]) for index in chunk])
+                    lost = {
+                        index for index in chunk
+                        if id_of(rows[index]) not in present
+                    }
+                db.session.commit()
+            except IntegrityError:
+                db.session.rollback()
+                for index in chunk:
+                    try:
+                        result = db.session.execute(stmt, rows[index])
+                        db.session.commit()
+                    except IntegrityError as e:
+                        db.session.rollback()
+                        results[index] = bulk_result(
+                            index,
+                            'failed',
+                            id_of(rows[index]),
+                            message=unique_violation_message(e))
+                    else:
+                        if unmatched is not None and result.rowcount == 0:
+                            results[index] = bulk_result(index,
+                                                         'failed',
+                                                         id_of(rows[index]),
+                                                         message=unmatched)
+                        else:
+                            results[index] = bulk_result(
+                                index, status, id_of(rows[index]))
+                continue
+            for index in chunk:
+                if index in lost:
+                    results[index] = bulk_result(index,
+                                                 'failed',
+                                                 id_of(rows[index]),
+                                                 message=unmatched)
+                else:
+                    results[index] = bulk_result(index, status,
+                                                 id_of(rows[index]))
+
     def get_user_info(self, user_id):
         user = User.query.filter_by(id=user_id).first()
         if user is None:
@@ -0,0 +1,150 @@
+import math
+import threading
+import time
+from collections import OrderedDict
+
+from metrics import login_throttled
+
+
+class LoginThrottled(Exception):
+    """
+    Raised when a login attempt exceeds a rate limit; ``retry_after`` is
+    the number of seconds after which the client may try again.
+    """
+
+    def __init__(self, scope, retry_after):
+        super().__init__(
+            f"Too many login attempts, retry in {retry_after} seconds.")
+        self.scope = scope
+        self.retry_after = retry_after
+
+
+def _estimate(previous, current, elapsed, window):
+    # 滑动窗口计数：上一窗口按剩余比例加权，加上当前窗口的计数
+    return previous * (1 - elapsed / window) + current
+
+
+class SlidingWindowLimiter:
+    """
+    Approximate sliding-window rate limit kept in process memory.
+
+    Every key costs one small list (window index and two counters) instead
+    of a timestamp per attempt. At most ``max_keys`` keys are tracked; the
+    least recently used are dropped first.
+    """
+
+    def __init__(self, limit, window, max_keys=100000):
+        self.limit = limit
+        self.window = window
+        self.max_keys = max_keys
+        # key -> [窗口序号, 上一窗口计数, 当前窗口计数]
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def hit(self, key):
+        """
+        Count an attempt for ``key``. Returns 0 if it is within the limit,
+        otherwise the seconds until the client may retry. Rejected attempts
+        are counted too, so a client that keeps trying stays blocked.
+        """
+        now = time.time()
+        index, elapsed = divmod(now, self.window)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                entry = self._entries[key] = [index, 0, 0]
+                if len(self._entries) > self.max_keys:
+                    self._entries.popitem(last=False)
+            else:
+                self._entries.move_to_end(key)
+            if entry[0] != index:
+                # 进入新窗口，只有紧邻的上一窗口参与计算
+                entry[1] = entry[2] if entry[0] == index - 1 else 0
+                entry[2] = 0
+                entry[0] = index
+            entry[2] += 1
+            estimate = _estimate(entry[1], entry[2], elapsed, self.window)
+        if estimate <= self.limit:
+            return 0
+        return max(1, math.ceil(self.window - elapsed))
+
+
+class RedisSlidingWindowLimiter:
+    """
+    The same sliding-window limit kept in Redis, so every worker process
+    and host shares the counters. One round trip per attempt.
+    """
+
+    def __init__(self, client, limit, window, prefix='login_throttle:'):
+        self.client = client
+        self.limit = limit
+        self.window = window
+        self.prefix = prefix
+
+    def hit(self, key):
+        now = time.time()
+        index, elapsed = divmod(now, self.window)
+        current_key = f'{self.prefix}{key}:{int(index)}'
+        previous_key = f'{self.prefix}{key}:{int(index) - 1}'
+        pipe = self.client.pipeline()
+        pipe.incr(current_key)
+        pipe.expire(current_key, int(self.window * 2))
+        pipe.get(previous_key)
+        current, _, previous = pipe.execute()
+        estimate = _estimate(int(previous or 0), current, elapsed,
+                             self.window)
+        if estimate <= self.limit:
+            return 0
+        return max(1, math.ceil(self.window - elapsed))
+
+
+class LoginThrottle:
+    """
+    Limits login attempts per username and per client IP.
+
+    ``check`` only touches the limiters, so a throttled attempt is refused
+    before the user lookup and the password hash.
+    """
+
+    def __init__(self, user_limiter, ip_limiter):
+        self.user_limiter = user_limiter
+        self.ip_limiter = ip_limiter
+
+    def check(self, username, client_ip=None):
+        checks = []
+        if client_ip:
+            checks.append(('ip', self.ip_limiter, client_ip))
+        if isinstance(username, str):
+            checks.append(('user', self.user_limiter, username.lower()))
+        for scope, limiter, key in checks:
+            retry_after = limiter.hit(f'{scope}:{key}')
+            if retry_after:
+                login_throttled.inc(scope=scope)
+                raise LoginThrottled(scope, retry_after)
+
+
+def create_login_throttle(config):
+    """
+    Build the login throttle from the LOGIN_THROTTLE_* settings, or None
+    if it is disabled. The "redis" backend shares limits between processes
+    through ``REDIS_URL``; "memory" keeps them per process.
+    """
+    if not config.get('LOGIN_THROTTLE_ENABLED', True):
+        return None
+    window = config.get('LOGIN_THROTTLE_WINDOW', 60)
+    user_limit = config.get('LOGIN_THROTTLE_USER_LIMIT', 10)
+    ip_limit = config.get('LOGIN_THROTTLE_IP_LIMIT', 50)
+    backend = config.get('LOGIN_THROTTLE_BACKEND', 'memory')
+    if backend == 'memory':
+        max_keys = config.get('LOGIN_THROTTLE_MAX_KEYS', 100000)
+        return LoginThrottle(
+            SlidingWindowLimiter(user_limit, window, max_keys),
+            SlidingWindowLimiter(ip_limit, window, max_keys))
+    if backend == 'redis':
+        import redis
+        client = redis.Redis.from_url(
+            config.get('REDIS_URL', 'redis://localhost:6379/0'))
+        return LoginThrottle(
+            RedisSlidingWindowLimiter(client, user_limit, window),
+            RedisSlidingWindowLimiter(client, ip_limit, window))
+    raise ValueError(f"Unknown login throttle backend: {backend}")
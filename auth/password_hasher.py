@@ -0,0 +1,141 @@
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import greenlet
+from werkzeug.security import generate_password_hash, check_password_hash
+
+try:
+    from eventlet import greenpool, greenthread, tpool
+except ImportError:
+    greenpool = greenthread = tpool = None
+
+
+class PasswordHasher:
+    """
+    Runs PBKDF2 hashing in a bounded pool of native threads.
+
+    hashlib releases the GIL while hashing, so moving the work off the
+    calling greenlet keeps the eventlet hub serving other requests.
+
+    Backends:
+    - tpool: eventlet's native thread pool, for requests served by eventlet
+    - thread: a ThreadPoolExecutor, for threaded servers and tests
+    - inline: hash in the calling thread
+    - auto: tpool inside an eventlet green thread, thread otherwise
+    """
+
+    def __init__(self, pool_size=4, backend='auto'):
+        self._executor = None
+        self._lock = threading.Lock()
+        self.in_flight = 0
+        self.calls = 0
+        self.hash_seconds_total = 0.0
+        self.hash_seconds_max = 0.0
+        self.configure(pool_size=pool_size, backend=backend)
+
+    def configure(self, pool_size=None, backend=None):
+        if pool_size is not None:
+            self.pool_size = pool_size
+            if tpool is not None:
+                # 只在 tpool 首次使用前生效
+                tpool.set_num_threads(pool_size)
+            if self._executor is not None:
+                self._executor.shutdown(wait=False)
+                self._executor = None
+        if backend is not None:
+            if backend not in ('auto', 'tpool', 'thread', 'inline'):
+                raise ValueError(f"Unknown password hash backend: {backend}")
+            if backend == 'tpool' and tpool is None:
+                raise ValueError("The tpool backend requires eventlet.")
+            self.backend = backend
+
+    def generate(self, password):
+        return self._run(generate_password_hash, password)
+
+    def check(self, pw_hash, password):
+        return self._run(check_password_hash, pw_hash, password)
+
+    def generate_many(self, passwords):
+        """
+        Hash ``passwords`` concurrently, at most ``pool_size`` at a time,
+        and return the hashes in the same order.
+        """
+        passwords = list(passwords)
+        backend = self._resolve_backend()
+        if backend == 'tpool':
+            # 每个 green thread 占用一个 tpool 线程
+            pool = greenpool.GreenPool(self.pool_size)
+            return list(pool.imap(self.generate, passwords))
+        if backend == 'thread':
+            executor = self._get_executor()
+            futures = []
+            for password in passwords:
+                start = self._enter()
+                future = executor.submit(generate_password_hash, password)
+                future.add_done_callback(
+                    lambda _, start=start: self._exit(start))
+                futures.append(future)
+            return [future.result() for future in futures]
+        return [self.generate(password) for password in passwords]
+
+    def stats(self):
+        return {
+            'pool_size': self.pool_size,
+            'in_flight': self.in_flight,
+            'queue_depth': max(0, self.in_flight - self.pool_size),
+            'calls': self.calls,
+            'hash_seconds_total': self.hash_seconds_total,
+            'hash_seconds_max': self.hash_seconds_max,
+        }
+
+    def _run(self, func, *args):
+        start = self._enter()
+        try:
+            return self._dispatch(func, *args)
+        finally:
+            self._exit(start)
+
+    def _enter(self):
+        with self._lock:
+            self.in_flight += 1
+        return time.perf_counter()
+
+    def _exit(self, start):
+        elapsed = time.perf_counter() - start
+        with self._lock:
+            self.in_flight -= 1
+            self.calls += 1
+            self.hash_seconds_total += elapsed
+            self.hash_seconds_max = max(self.hash_seconds_max, elapsed)
+
+    def _resolve_backend(self):
+        if self.backend == 'auto':
+            return 'tpool' if _in_green_thread() else 'thread'
+        return self.backend
+
+    def _dispatch(self, func, *args):
+        backend = self._resolve_backend()
+        if backend == 'tpool':
+            return tpool.execute(func, *args)
+        if backend == 'thread':
+            return self._get_executor().submit(func, *args).result()
+        return func(*args)
+
+    def _get_executor(self):
+        if self._executor is None:
+            with self._lock:
+                if self._executor is None:
+                    self._executor = ThreadPoolExecutor(
+                        max_workers=self.pool_size,
+                        thread_name_prefix='password-hasher')
+        return self._executor
+
+
+def _in_green_thread():
+    if greenthread is None:
+        return False
+    return isinstance(greenlet.getcurrent(), greenthread.GreenThread)
+
+
+password_hasher = PasswordHasher()
@@ -0,0 +1,122 @@
+import hashlib
+import math
+import threading
+import time
+
+
+class BloomFilter:
+    """
+    Fixed-size Bloom filter over string keys.
+    """
+
+    def __init__(self, capacity=100000, error_rate=0.001):
+        self.size = max(8, int(-capacity * math.log(error_rate) /
+                               (math.log(2)**2)))
+        self.hashes = max(1, round(self.size / capacity * math.log(2)))
+        self._bits = bytearray((self.size + 7) // 8)
+
+    def _positions(self, key):
+        digest = hashlib.blake2b(key.encode('utf-8'), digest_size=16).digest()
+        h1 = int.from_bytes(digest[:8], 'little')
+        h2 = int.from_bytes(digest[8:], 'little') | 1
+        return ((h1 + i * h2) % self.size for i in range(self.hashes))
+
+    def add(self, key):
+        for position in self._positions(key):
+            self._bits[position >> 3] |= 1 << (position & 7)
+
+    def __contains__(self, key):
+        return all(self._bits[position >> 3] & (1 << (position & 7))
+                   for position in self._positions(key))
+
+
+class RevocationList:
+    """
+    In-memory denylist of revoked access-token ids (``jti``).
+
+    A pair of rotating Bloom filters answers the common "not revoked" case
+    without touching the exact set; the exact set removes false positives.
+    Entries are only kept until the token they revoke would have expired,
+    so memory is bounded by the number of logouts per ``ttl`` seconds.
+    """
+
+    def __init__(self, ttl, capacity=100000, error_rate=0.001):
+        self.ttl = ttl
+        self.capacity = capacity
+        self.error_rate = error_rate
+        self._current = self._new_filter()
+        self._previous = self._new_filter()
+        self._rotated_at = time.monotonic()
+        self._revoked = {}    # jti -> expires_at (unix timestamp)
+        self._lock = threading.Lock()
+
+    def _new_filter(self):
+        return BloomFilter(self.capacity, self.error_rate)
+
+    def revoke(self, jti, expires_at):
+        with self._lock:
+            self._rotate()
+            self._current.add(jti)
+            self._revoked[jti] = expires_at
+
+    def is_revoked(self, jti):
+        with self._lock:
+            self._rotate()
+            if jti not in self._current and jti not in self._previous:
+                return False
+            expires_at = self._revoked.get(jti)
+            return expires_at is not None and expires_at > time.time()
+
+    def __len__(self):
+        return len(self._revoked)
+
+    def _rotate(self):
+        # 每个过滤器至少保留 ttl 秒，足够覆盖访问令牌的有效期
+        if time.monotonic() - self._rotated_at < self.ttl:
+            return
+        self._previous = self._current
+        self._current = self._new_filter()
+        self._rotated_at = time.monotonic()
+        now = time.time()
+        self._revoked = {
+            jti: expires_at
+            for jti, expires_at in self._revoked.items() if expires_at > now
+        }
+
+
+class RedisRevocationList:
+    """
+    Revoked access-token ids kept in Redis, so a logout in one worker
+    process or host is seen by all of them. Every key expires together with
+    the token it revokes; each check is one EXISTS round trip.
+    """
+
+    def __init__(self, client, prefix='revoked:'):
+        self.client = client
+        self.prefix = prefix
+
+    def revoke(self, jti, expires_at):
+        ttl = math.ceil(expires_at - time.time())
+        if ttl > 0:
+            self.client.set(f'{self.prefix}{jti}', 1, ex=ttl)
+
+    def is_revoked(self, jti):
+        return bool(self.client.exists(f'{self.prefix}{jti}'))
+
+
+def create_revocation_list(config, ttl):
+    """
+    Build the revocation list selected by ``REVOCATION_BACKEND``: "memory"
+    keeps it per process, "redis" shares it through ``REDIS_URL``.
+    """
+    backend = config.get('REVOCATION_BACKEND', 'memory')
+    if backend == 'memory':
+        return RevocationList(ttl=ttl,
+                              capacity=config.get('REVOCATION_CAPACITY',
+                                                  100000))
+    if backend == 'redis':
+        import redis
+        client = redis.Redis.from_url(
+            config.get('REDIS_URL', 'redis://localhost:6379/0'))
+        return RedisRevocationList(client)
+    raise ValueError(f"Unknown revocation backend: {backend}")
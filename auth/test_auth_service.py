@@ -0,0 +1,486 @@
+import time
+import unittest
+from unittest.mock import patch
+from flask import Flask
+from auth.auth_service import AuthService
+from auth.login_throttle import LoginThrottle, LoginThrottled, \
+    RedisSlidingWindowLimiter, SlidingWindowLimiter
+from auth.password_hasher import PasswordHasher, password_hasher
+from auth.revocation import RedisRevocationList, RevocationList, \
+    create_revocation_list
+from auth.token_cache import TokenCache
+from auth.token_store import RedisTokenStore
+from config import TestingConfig
+from database import setup_db
+from database.models import db, Role, User
+from database.testing import assert_max_queries
+
+try:
+    import fakeredis
+except ImportError:
+    fakeredis = None
+
+
+class DatabaseTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.app = Flask(__name__)
+        self.app.config.from_object(TestingConfig)
+        self.app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite://'
+        setup_db(self.app)
+        self.auth_service = AuthService(self.app.config['AUTH_CONFIG'])
+
+        self.ctx = self.app.app_context()
+        self.ctx.push()
+
+    def tearDown(self):
+        db.session.remove()
+        db.drop_all()
+        self.ctx.pop()
+
+
+class AuthServiceTestCase(DatabaseTestCase):
+
+    def test_verify_token_uses_cache(self):
+        response = self.auth_service.authenticate('admin', 'admin123')
+        access_token = response['access_token']
+
+        self.auth_service.verify_token_expiration(access_token)
+        self.auth_service.verify_token_expiration(access_token)
+
+        stats = self.auth_service.token_cache.stats()
+        self.assertEqual(stats['misses'], 1)
+        self.assertEqual(stats['hits'], 1)
+
+    def test_repeated_login_overwrites_tokens(self):
+        self.auth_service.authenticate('admin', 'admin123')
+        response = self.auth_service.authenticate('admin', 'admin123')
+
+        record = self.auth_service.get_token_from_db('admin')
+        self.assertEqual(record.token, response['access_token'])
+        self.assertEqual(record.refresh_token, response['refresh_token'])
+
+    def test_logout_invalidates_cached_token(self):
+        response = self.auth_service.authenticate('admin', 'admin123')
+        access_token = response['access_token']
+        self.auth_service.verify_token_expiration(access_token)
+
+        self.auth_service.logout(response['refresh_token'])
+
+        self.assertEqual(len(self.auth_service.token_cache), 0)
+        with self.assertRaises(Exception):
+            self.auth_service.verify_token_expiration(access_token)
+
+    def _seed_users(self, count):
+        role = Role.query.filter_by(name='user').one()
+        db.session.execute(User.__table__.insert(), [{
+            'id': f'user-{i:03d}',
+            'username': f'user{i:03d}',
+            'email': f'user{i:03d}@example.com',
+            'role_id': role.id,
+            'pw_hash': 'unused',
+        } for i in range(count)])
+        db.session.commit()
+
+    def test_get_users_pages_with_cursor(self):
+        self._seed_users(5)
+
+        first = self.auth_service.get_users(limit=4)
+        second = self.auth_service.get_users(limit=4,
+                                             cursor=first['next_cursor'],
+                                             with_total=False)
+
+        self.assertEqual(first['total'], 6)
+        self.assertEqual(len(first['items']), 4)
+        self.assertEqual(len(second['items']), 2)
+        self.assertIsNone(second['next_cursor'])
+        self.assertIsNone(second['total'])
+        ids = [u['id'] for u in first['items'] + second['items']]
+        self.assertEqual(ids, sorted(set(ids)))
+
+    def test_get_users_filters(self):
+        self._seed_users(3)
+
+        by_role = self.auth_service.get_users(role='admin')
+        by_prefix = self.auth_service.get_users(username_prefix='user00')
+        by_email = self.auth_service.get_users(email='user002@example.com')
+
+        self.assertEqual([u['username'] for u in by_role['items']], ['admin'])
+        self.assertEqual(by_prefix['total'], 3)
+        self.assertEqual(by_email['items'][0]['username'], 'user002')
+
+    def test_username_and_email_are_unique_ignoring_case(self):
+        role_id = Role.query.filter_by(name='user').one().id
+
+        with self.assertRaisesRegex(Exception, 'Username is already in use'):
+            self.auth_service.create_user({
+                'username': 'ADMIN',
+                'password': 'secret',
+                'email': 'other@example.com',
+                'role_id': role_id
+            })
+        with self.assertRaisesRegex(Exception, 'Email is already in use'):
+            self.auth_service.create_user({
+                'username': 'other',
+                'password': 'secret',
+                'email': 'Admin@Example.com',
+                'role_id': role_id
+            })
+
+    def test_login_ignores_username_case(self):
+        response = self.auth_service.authenticate('Admin', 'admin123')
+
+        self.assertEqual(response['userinfo']['username'], 'admin')
+        self.assertIsNotNone(self.auth_service.get_token_from_db('admin'))
+
+    def test_get_users_rejects_bad_cursor(self):
+        with self.assertRaises(ValueError):
+            self.auth_service.get_users(cursor='%%%')
+
+    def test_login_without_username_is_not_found(self):
+        for username in (None, 42):
+            with self.assertRaisesRegex(Exception, 'not found'):
+                self.auth_service.authenticate(username, 'secret')
+
+    def test_refresh_without_subject_is_not_found(self):
+        token = self.auth_service.generate_token(None)
+
+        with self.assertRaisesRegex(Exception, 'Username not found'):
+            self.auth_service.refresh(token)
+
+
+class BulkUsersTestCase(DatabaseTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.role_id = Role.query.filter_by(name='user').one().id
+        self.auth_service.user_bulk_chunk_size = 2
+
+    def _user(self, name, **kwargs):
+        user = {
+            'username': name,
+            'email': f'{name}@example.com',
+            'password': 'secret',
+            'role_id': self.role_id
+        }
+        user.update(kwargs)
+        return user
+
+    def test_bulk_create_reports_each_item(self):
+        users = [
+            self._user('amy'),
+            self._user('bob'),
+            self._user('Admin'),
+            self._user('BOB'),
+            {'username': 'carl'},
+            self._user('dan', role_id=999),
+            self._user('eve'),
+        ]
+
+        with assert_max_queries(self, 4):
+            summary = self.auth_service.bulk_create_users(users)
+
+        self.assertEqual([r['status'] for r in summary['results']], [
+            'created', 'created', 'failed', 'failed', 'failed', 'failed',
+            'created'
+        ])
+        self.assertEqual(summary['succeeded'], 3)
+        self.assertIn('already in use', summary['results'][2]['message'])
+        self.assertIn('duplicated', summary['results'][3]['message'])
+        self.assertIn('Missing fields', summary['results'][4]['message'])
+        amy = User.query.filter_by(username='amy').one()
+        self.assertEqual(amy.id, summary['results'][0]['id'])
+        self.assertTrue(amy.check_password('secret'))
+
+    def test_bulk_create_retries_chunk_on_conflict(self):
+        # 模拟校验之后、写入之前其他请求创建了同名用户
+        check = self.auth_service._check_bulk_unique
+        self.auth_service._check_bulk_unique = lambda *args: None
+        self.addCleanup(setattr, self.auth_service, '_check_bulk_unique',
+                        check)
+
+        summary = self.auth_service.bulk_create_users(
+            [self._user('amy'), self._user('admin')])
+
+        self.assertEqual([r['status'] for r in summary['results']],
+                         ['created', 'failed'])
+        self.assertIn('already in use', summary['results'][1]['message'])
+
+    def test_bulk_update_and_delete(self):
+        created = self.auth_service.bulk_create_users(
+            [self._user('amy'), self._user('bob'),
+             self._user('cat')])['results']
+        amy, bob, cat = [r['id'] for r in created]
+
+        summary = self.auth_service.bulk_update_users([
+            {'id': amy, 'email': 'AMY@example.com', 'password': 'changed'},
+            {'id': bob, 'username': 'cat'},
+            {'id': cat, 'experiments': 7},
+            {'id': 'missing', 'experiments': 1},
+        ])
+
+        self.assertEqual([r['status'] for r in summary['results']],
+                         ['updated', 'failed', 'updated', 'failed'])
+        self.assertTrue(db.session.get(User, amy).check_password('changed'))
+        self.assertEqual(db.session.get(User, cat).experiments, 7)
+
+        summary = self.auth_service.bulk_delete_users([amy, bob, amy, 'x'])
+
+        self.assertEqual([r['status'] for r in summary['results']],
+                         ['deleted', 'deleted', 'failed', 'failed'])
+        self.assertEqual(User.query.filter(User.id.in_([amy, bob])).count(),
+                         0)
+        self.auth_service.user_changes_settle_seconds = 0
+        changes = self.auth_service.get_user_changes()
+        self.assertEqual({d['id'] for d in changes['deleted']}, {amy, bob})
+
+    def test_bulk_update_reports_concurrently_deleted_user(self):
+        created = self.auth_service.bulk_create_users(
+            [self._user('amy'), self._user('bob')])['results']
+        amy, bob = [r['id'] for r in created]
+        # 模拟校验之后、UPDATE 之前其他请求删除了 bob
+        existing = self.auth_service._existing_user_ids
+        User.query.filter_by(id=bob).delete()
+        db.session.commit()
+
+        with patch.object(self.auth_service,
+                          '_existing_user_ids',
+                          side_effect=[{amy, bob}, existing([amy, bob])]):
+            summary = self.auth_service.bulk_update_users([
+                {'id': amy, 'experiments': 1},
+                {'id': bob, 'experiments': 2},
+            ])
+
+        self.assertEqual([r['status'] for r in summary['results']],
+                         ['updated', 'failed'])
+        self.assertEqual(summary['results'][1]['message'], 'User not found.')
+
+    def test_changes_hold_back_unsettled_rows(self):
+        self.auth_service.bulk_create_users([self._user('amy')])
+
+        changes = self.auth_service.get_user_changes()
+        self.assertNotIn('amy', [u['username'] for u in changes['items']])
+
+        # 游标停在已结算的位置，结算窗口过后仍能读到这条变更
+        self.auth_service.user_changes_settle_seconds = 0
+        changes = self.auth_service.get_user_changes(changes['next_cursor'])
+        self.assertIn('amy', [u['username'] for u in changes['items']])
+
+    def test_bulk_rejects_oversized_payload(self):
+        self.auth_service.user_bulk_max = 2
+
+        with self.assertRaises(ValueError):
+            self.auth_service.bulk_delete_users(['a', 'b', 'c'])
+        with self.assertRaises(ValueError):
+            self.auth_service.bulk_create_users([])
+
+
+class StatelessAuthServiceTestCase(DatabaseTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.auth_service.stateless = True
+
+    def test_verify_does_not_query_database(self):
+        first = self.auth_service.authenticate('admin', 'admin123')
+        second = self.auth_service.authenticate('admin', 'admin123')
+
+        with assert_max_queries(self, 0):
+            self.auth_service.verify_token_expiration(first['access_token'])
+            self.auth_service.verify_token_expiration(second['access_token'])
+
+    def test_logout_revokes_access_token(self):
+        response = self.auth_service.authenticate('admin', 'admin123')
+        self.auth_service.logout(response['refresh_token'],
+                                 response['access_token'])
+
+        with self.assertRaises(Exception):
+            self.auth_service.verify_token_expiration(
+                response['access_token'])
+
+
+    @unittest.skipUnless(fakeredis, 'fakeredis is not installed')
+    def test_logout_is_seen_by_other_workers_with_redis(self):
+        client = fakeredis.FakeStrictRedis()
+        other = AuthService(self.app.config['AUTH_CONFIG'])
+        other.stateless = True
+        self.auth_service.revocations = RedisRevocationList(client)
+        other.revocations = RedisRevocationList(client)
+        response = self.auth_service.authenticate('admin', 'admin123')
+
+        self.auth_service.logout(response['refresh_token'],
+                                 response['access_token'])
+
+        with self.assertRaises(Exception):
+            other.verify_token_expiration(response['access_token'])
+
+
+class RevocationListTestCase(unittest.TestCase):
+
+    @unittest.skipUnless(fakeredis, 'fakeredis is not installed')
+    def test_redis_revocations_are_shared(self):
+        client = fakeredis.FakeStrictRedis()
+        first = RedisRevocationList(client)
+        second = RedisRevocationList(client)
+        first.revoke('live', expires_at=time.time() + 600)
+        first.revoke('expired', expires_at=time.time() - 1)
+
+        self.assertTrue(second.is_revoked('live'))
+        self.assertFalse(second.is_revoked('expired'))
+        self.assertTrue(0 < client.ttl('revoked:live') <= 600)
+
+    def test_create_revocation_list_rejects_unknown_backend(self):
+        with self.assertRaises(ValueError):
+            create_revocation_list({'REVOCATION_BACKEND': 'disk'}, ttl=60)
+
+    def test_revoked_until_expiry(self):
+        revocations = RevocationList(ttl=600, capacity=1000)
+        revocations.revoke('live', expires_at=2**31)
+        revocations.revoke('expired', expires_at=0)
+
+        self.assertTrue(revocations.is_revoked('live'))
+        self.assertFalse(revocations.is_revoked('expired'))
+        self.assertFalse(revocations.is_revoked('unknown'))
+
+    def test_rotation_drops_expired_entries(self):
+        revocations = RevocationList(ttl=0, capacity=1000)
+        revocations.revoke('expired', expires_at=0)
+        revocations.revoke('live', expires_at=2**31)
+
+        self.assertEqual(len(revocations), 1)
+
+
+class TokenCacheTestCase(unittest.TestCase):
+
+    def test_evicts_least_recently_used(self):
+        cache = TokenCache(max_size=2)
+        cache.set('a', 'alice', expires_at=2**31)
+        cache.set('b', 'bob', expires_at=2**31)
+        cache.get('a')
+        cache.set('c', 'carol', expires_at=2**31)
+
+        self.assertEqual(cache.get('a'), 'alice')
+        self.assertIsNone(cache.get('b'))
+        self.assertEqual(cache.stats()['evictions'], 1)
+
+    def test_expired_entry_is_a_miss(self):
+        cache = TokenCache()
+        cache.set('a', 'alice', expires_at=0)
+
+        self.assertIsNone(cache.get('a'))
+        self.assertEqual(len(cache), 0)
+
+
+class LoginThrottleTestCase(DatabaseTestCase):
+
+    def test_rejects_after_limit(self):
+        limiter = SlidingWindowLimiter(limit=2, window=60)
+
+        self.assertEqual([limiter.hit('a'), limiter.hit('a')], [0, 0])
+        self.assertGreater(limiter.hit('a'), 0)
+        self.assertEqual(limiter.hit('b'), 0)
+
+    def test_previous_window_is_weighted(self):
+        limiter = SlidingWindowLimiter(limit=4, window=60)
+        with patch('auth.login_throttle.time.time', return_value=6030.0):
+            for _ in range(4):
+                limiter.hit('a')
+
+        # 新窗口过去一半，上一窗口的 4 次按 2 次计算
+        with patch('auth.login_throttle.time.time', return_value=6090.0):
+            self.assertEqual([limiter.hit('a'), limiter.hit('a')], [0, 0])
+            self.assertGreater(limiter.hit('a'), 0)
+        with patch('auth.login_throttle.time.time', return_value=6210.0):
+            self.assertEqual(limiter.hit('a'), 0)
+
+    def test_memory_is_bounded(self):
+        limiter = SlidingWindowLimiter(limit=1, window=60, max_keys=2)
+        for key in ('a', 'b', 'c'):
+            limiter.hit(key)
+
+        self.assertEqual(list(limiter._entries), ['b', 'c'])
+
+    def test_throttled_login_skips_database_and_hashing(self):
+        self.auth_service.login_throttle = LoginThrottle(
+            SlidingWindowLimiter(limit=1, window=60),
+            SlidingWindowLimiter(limit=100, window=60))
+        with self.assertRaises(Exception):
+            self.auth_service.authenticate('admin', 'wrong', '10.0.0.1')
+        calls = password_hasher.stats()['calls']
+
+        with assert_max_queries(self, 0):
+            with self.assertRaises(LoginThrottled) as raised:
+                self.auth_service.authenticate('ADMIN', 'admin123',
+                                               '10.0.0.2')
+
+        self.assertEqual(raised.exception.scope, 'user')
+        self.assertEqual(password_hasher.stats()['calls'], calls)
+
+    @unittest.skipUnless(fakeredis, 'fakeredis is not installed')
+    def test_redis_limiter_is_shared(self):
+        client = fakeredis.FakeStrictRedis()
+        first = RedisSlidingWindowLimiter(client, limit=2, window=60)
+        second = RedisSlidingWindowLimiter(client, limit=2, window=60)
+
+        self.assertEqual([first.hit('ip:1'), second.hit('ip:1')], [0, 0])
+        self.assertGreater(first.hit('ip:1'), 0)
+
+
+class PasswordHasherTestCase(unittest.TestCase):
+
+    def test_thread_backend_records_stats(self):
+        hasher = PasswordHasher(pool_size=2, backend='thread')
+        pw_hash = hasher.generate('secret')
+
+        self.assertTrue(hasher.check(pw_hash, 'secret'))
+        self.assertFalse(hasher.check(pw_hash, 'wrong'))
+        stats = hasher.stats()
+        self.assertEqual(stats['calls'], 3)
+        self.assertEqual(stats['in_flight'], 0)
+
+    def test_generate_many_keeps_order(self):
+        hasher = PasswordHasher(pool_size=2, backend='thread')
+
+        hashes = hasher.generate_many(['a', 'b', 'c'])
+
+        self.assertEqual(
+            [hasher.check(h, p) for h, p in zip(hashes, 'abc')],
+            [True, True, True])
+        self.assertEqual(hasher.stats()['calls'], 6)
+        self.assertEqual(hasher.stats()['in_flight'], 0)
+
+    def test_rejects_unknown_backend(self):
+        with self.assertRaises(ValueError):
+            PasswordHasher(backend='gpu')
+
+
+@unittest.skipUnless(fakeredis, 'fakeredis is not installed')
+class RedisTokenStoreTestCase(AuthServiceTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.client = fakeredis.FakeStrictRedis()
+        self.auth_service.token_store = RedisTokenStore(self.client,
+                                                        access_ttl=660,
+                                                        refresh_ttl=10860)
+
+    def test_tokens_are_stored_with_ttl(self):
+        response = self.auth_service.authenticate('admin', 'admin123')
+
+        record = self.auth_service.get_token_from_db('admin')
+        self.assertEqual(record.token, response['access_token'])
+        self.assertEqual(record.refresh_token, response['refresh_token'])
+        self.assertTrue(0 < self.client.ttl('token:access:admin') <= 660)
+        self.assertTrue(0 < self.client.ttl('token:refresh:admin') <= 10860)
+
+    def test_refresh_after_logout_fails(self):
+        response = self.auth_service.authenticate('admin', 'admin123')
+        self.auth_service.logout(response['refresh_token'])
+
+        self.assertIsNone(self.auth_service.get_token_from_db('admin'))
+        with self.assertRaises(Exception):
+            self.auth_service.refresh(response['refresh_token'])
+
+
+if __name__ == '__main__':
+    unittest.main()
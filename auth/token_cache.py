@@ -0,0 +1,119 @@
+import threading
+import time
+from collections import OrderedDict
+
+
+class TokenCache:
+    """
+    Bounded, per-process LRU cache of access tokens that have already been
+    verified against the token store.
+
+    Each entry expires together with the token it caches, or after ``ttl``
+    seconds if that comes first, so a token revoked by another process is
+    never trusted for longer than ``ttl``.
+
+    Users whose tokens were invalidated within the last ``changed_ttl``
+    seconds are remembered, so their next checks can skip lagging replicas.
+    """
+
+    def __init__(self, max_size=10000, ttl=None, changed_ttl=0):
+        self.max_size = max_size
+        self.ttl = ttl
+        self.changed_ttl = changed_ttl
+        self._entries = OrderedDict()    # token -> (username, expires_at)
+        self._user_tokens = {}    # username -> set of cached tokens
+        self._changed = {}    # username -> 令牌变更记录的过期时间
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, token):
+        """
+        Return the username cached for ``token`` or None on a miss.
+        """
+        now = time.time()
+        with self._lock:
+            entry = self._entries.get(token)
+            if entry is None:
+                self.misses += 1
+                return None
+
+            username, expires_at = entry
+            if expires_at <= now:
+                self._remove(token)
+                self.misses += 1
+                return None
+
+            self._entries.move_to_end(token)
+            self.hits += 1
+            return username
+
+    def set(self, token, username, expires_at):
+        """
+        Cache ``token`` for ``username`` until ``expires_at`` (unix timestamp).
+        """
+        if self.max_size <= 0:
+            return
+        if self.ttl is not None:
+            expires_at = min(expires_at, time.time() + self.ttl)
+
+        with self._lock:
+            if token in self._entries:
+                self._remove(token)
+            self._entries[token] = (username, expires_at)
+            self._user_tokens.setdefault(username, set()).add(token)
+
+            while len(self._entries) > self.max_size:
+                oldest = next(iter(self._entries))
+                self._remove(oldest)
+                self.evictions += 1
+
+    def invalidate(self, username):
+        """
+        Drop every cached token that belongs to ``username``.
+        """
+        with self._lock:
+            for token in list(self._user_tokens.get(username, ())):
+                self._remove(token)
+            if self.changed_ttl > 0:
+                now = time.time()
+                if len(self._changed) >= self.max_size:
+                    self._changed = {
+                        name: until
+                        for name, until in self._changed.items() if until > now
+                    }
+                self._changed[username] = now + self.changed_ttl
+
+    def recently_changed(self, username):
+        """
+        Whether ``username``'s tokens were invalidated in this process within
+        the last ``changed_ttl`` seconds.
+        """
+        until = self._changed.get(username)
+        return until is not None and until > time.time()
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._user_tokens.clear()
+            self._changed.clear()
+
+    def stats(self):
+        return {
+            'size': len(self._entries),
+            'hits': self.hits,
+            'misses': self.misses,
+            'evictions': self.evictions,
+        }
+
+    def _remove(self, token):
+        username, _ = self._entries.pop(token)
+        tokens = self._user_tokens.get(username)
+        if tokens is not None:
+            tokens.discard(token)
+            if not tokens:
+                del self._user_tokens[username]
+
+    def __len__(self):
+        return len(self._entries)
@@ -0,0 +1,165 @@
+from sqlalchemy.dialects import postgresql, sqlite
+from database.models import db, Token, db_now
+
+
+class TokenRecord:
+    """
+    The access/refresh token pair currently stored for a user.
+    """
+
+    def __init__(self, username, token=None, refresh_token=None):
+        self.username = username
+        self.token = token
+        self.refresh_token = refresh_token
+
+    def __repr__(self):
+        return f'<TokenRecord {self.username}>'
+
+
+class TokenStore:
+    """
+    Storage backend for the per-user session tokens used by AuthService.
+    """
+
+    def get(self, username):
+        """
+        Return an object with ``token`` and ``refresh_token`` attributes,
+        or None if nothing is stored for ``username``.
+        """
+        raise NotImplementedError
+
+    def save(self, username, token=None, refresh_token=None):
+        """
+        Store whichever of ``token``/``refresh_token`` is given for
+        ``username`` in a single atomic write, creating the record if needed.
+        """
+        raise NotImplementedError
+
+    def set_token(self, username, token):
+        self.save(username, token=token)
+
+    def set_refresh_token(self, username, refresh_token):
+        self.save(username, refresh_token=refresh_token)
+
+    def delete(self, username):
+        raise NotImplementedError
+
+
+class SQLTokenStore(TokenStore):
+    """
+    Stores tokens in the ``token`` table through the Token model.
+    """
+
+    def get(self, username):
+        return Token.query.filter_by(username=username).first()
+
+    def save(self, username, token=None, refresh_token=None):
+        values = _token_values(token, refresh_token)
+        dialect = db.session.get_bind(mapper=Token).dialect.name
+
+        if dialect in UPSERT_DIALECTS:
+            # INSERT ... ON CONFLICT (username) DO UPDATE，一次往返完成
+            insert = UPSERT_DIALECTS[dialect]
+            stmt = insert(Token.__table__).values(username=username, **values)
+            stmt = stmt.on_conflict_do_update(
+                index_elements=[Token.username],
+                set_=dict(values, updated_at=db_now()))
+            db.session.execute(stmt)
+        else:
+            record = self.get(username)
+            if record:
+                # 如果已存在具有相同用户名的记录，则更新它
+                for field, value in values.items():
+                    setattr(record, field, value)
+            else:
+                # 如果不存在具有相同用户名的记录，则创建一个新的记录
+                record = Token(username=username, **values)
+            db.session.add(record)
+
+        db.session.commit()
+
+    def delete(self, username):
+        record = self.get(username)
+        if record:
+            db.session.delete(record)
+            db.session.commit()
+
+
+class RedisTokenStore(TokenStore):
+    """
+    Stores tokens as plain Redis keys that expire on their own through
+    native TTLs, so no cleanup of stale sessions is needed.
+    """
+
+    def __init__(self, client, access_ttl, refresh_ttl, prefix='token:'):
+        self.client = client
+        self.access_ttl = access_ttl
+        self.refresh_ttl = refresh_ttl
+        self.prefix = prefix
+
+    def _access_key(self, username):
+        return f'{self.prefix}access:{username}'
+
+    def _refresh_key(self, username):
+        return f'{self.prefix}refresh:{username}'
+
+    def get(self, username):
+        token, refresh_token = self.client.mget(self._access_key(username),
+                                                self._refresh_key(username))
+        if token is None and refresh_token is None:
+            return None
+        return TokenRecord(username,
+                           token=_decode(token),
+                           refresh_token=_decode(refresh_token))
+
+    def save(self, username, token=None, refresh_token=None):
+        pipe = self.client.pipeline(transaction=True)
+        if token is not None:
+            pipe.set(self._access_key(username), token, ex=self.access_ttl)
+        if refresh_token is not None:
+            pipe.set(self._refresh_key(username),
+                     refresh_token,
+                     ex=self.refresh_ttl)
+        pipe.execute()
+
+    def delete(self, username):
+        self.client.delete(self._access_key(username),
+                           self._refresh_key(username))
+
+
+UPSERT_DIALECTS = {
+    'postgresql': postgresql.insert,
+    'sqlite': sqlite.insert,
+}
+
+
+def _token_values(token, refresh_token):
+    values = {}
+    if token is not None:
+        values['token'] = token
+    if refresh_token is not None:
+        values['refresh_token'] = refresh_token
+    return values
+
+
+def _decode(value):
+    if isinstance(value, bytes):
+        return value.decode('utf-8')
+    return value
+
+
+def create_token_store(config, access_ttl, refresh_ttl):
+    """
+    Build the token store selected by ``TOKEN_STORE`` ("sql" or "redis").
+    """
+    backend = config.get('TOKEN_STORE', 'sql')
+    if backend == 'sql':
+        return SQLTokenStore()
+    if backend == 'redis':
+        import redis
+        client = redis.Redis.from_url(
+            config.get('REDIS_URL', 'redis://localhost:6379/0'))
+        return RedisTokenStore(client,
+                               access_ttl=access_ttl,
+                               refresh_ttl=refresh_ttl)
+    raise ValueError(f"Unknown token store: {backend}")
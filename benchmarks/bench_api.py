@@ -0,0 +1,309 @@
+"""
+Load benchmark for the auth and user endpoints.
+
+Runs ``create_app()`` in-process against a local database (a fresh SQLite
+file by default, or any URL given with --database-url), seeds it with
+--users accounts and drives every scenario with --concurrency threads, each
+logged in as its own user. Results are printed (or written with --output)
+as JSON; --baseline compares them with an earlier run and exits with status
+1 on a regression.
+
+    python -m benchmarks.bench_api --users 1000 --concurrency 8 \\
+        --requests 2000 --output bench.json
+    python -m benchmarks.bench_api --baseline bench.json --max-regression 0.2
+"""
+import argparse
+import json
+import os
+import platform
+import sys
+import tempfile
+import threading
+import time
+import uuid
+
+# 与 wsgi.py 一致，在 config 和 log 读取环境变量之前加载 .env
+import load_env  # noqa: F401
+from sqlalchemy import or_
+from werkzeug.security import generate_password_hash
+
+from database.models import db, role_catalog, Token, User
+from database.session import request_stats
+from wsgi import create_app
+
+PREFIX = 'bench'
+PASSWORD = 'bench-password'
+SCENARIOS = ['login', 'refresh', 'user_info', 'list_users', 'groups',
+             'create', 'update', 'delete']
+
+
+def build_app(database_url):
+    settings = {'SQLALCHEMY_DATABASE_URI': database_url}
+    if database_url.startswith('sqlite'):
+        # 并发写入时等待 SQLite 的写锁，而不是立即报错
+        settings['SQLALCHEMY_ENGINE_OPTIONS'] = {
+            'connect_args': {
+                'timeout': 30,
+                'check_same_thread': False
+            }
+        }
+    app = create_app(settings)
+    # 压测反复登录同一批用户，不应被登录限流拦截
+    app.config['AUTH_SERVICE'].login_throttle = None
+
+    @app.after_request
+    def report_queries(response):
+        response.headers['X-DB-Queries'] = str(request_stats()['queries'])
+        return response
+
+    return app
+
+
+def seed_users(app, count):
+    """
+    Replace the benchmark users with ``count`` fresh ones sharing one
+    password hash, so seeding does not pay for ``count`` PBKDF2 runs.
+    """
+    pw_hash = generate_password_hash(PASSWORD)
+    with app.app_context():
+        Token.query.filter(Token.username.like(f'{PREFIX}%')).delete(
+            synchronize_session=False)
+        User.query.filter(
+            or_(User.username.like(f'{PREFIX}%'),
+                User.email.like(f'{PREFIX}%'))).delete(
+                    synchronize_session=False)
+        role_id = role_catalog.get_by_name('user').id
+        rows = [{
+            'id': str(uuid.uuid4()),
+            'username': f'{PREFIX}{i:05d}',
+            'email': f'{PREFIX}{i:05d}@example.com',
+            'role_id': role_id,
+            'pw_hash': pw_hash,
+        } for i in range(count)]
+        for start in range(0, len(rows), 1000):
+            db.session.execute(User.__table__.insert(),
+                               rows[start:start + 1000])
+        db.session.commit()
+        return role_id, {row['username']: row['id'] for row in rows}
+
+
+class Worker:
+    """
+    One benchmark client: its own test client (and so its own cookies),
+    logged in as its own user.
+    """
+
+    def __init__(self, app, index, username, user_id, role_id):
+        self.client = app.test_client()
+        self.index = index
+        self.username = username
+        self.user_id = user_id
+        self.role_id = role_id
+        self.created = []
+        self.sequence = 0
+
+    def login(self):
+        return self.client.post('/api/user/login',
+                                json={
+                                    'username': self.username,
+                                    'password': PASSWORD
+                                })
+
+    def refresh(self):
+        return self.client.post('/api/user/refresh')
+
+    def user_info(self):
+        return self.client.get(f'/api/user/user/{self.user_id}')
+
+    def list_users(self):
+        return self.client.get('/api/user/user?limit=50&include_total=false')
+
+    def groups(self):
+        return self.client.get('/api/user/groups')
+
+    def create(self):
+        self.sequence += 1
+        name = f'{PREFIX}c{self.index:02d}{self.sequence:05d}'
+        response = self.client.post('/api/user/user',
+                                    json={
+                                        'username': name,
+                                        'password': PASSWORD,
+                                        'email': f'{name}@example.com',
+                                        'role_id': self.role_id,
+                                    })
+        if response.status_code == 200:
+            self.created.append(response.json['data']['id'])
+        return response
+
+    def update(self):
+        user_id = self.created[-1] if self.created else self.user_id
+        return self.client.put(f'/api/user/user/{user_id}',
+                               json={'email': f'{PREFIX}u{self.index:02d}'
+                                              f'{self.sequence:05d}@example.com'})
+
+    def delete(self):
+        if not self.created:
+            response = self.create()
+            if not self.created:
+                return response
+            response.close()
+        return self.client.delete(f'/api/user/user/{self.created.pop()}')
+
+
+def percentile(values, fraction):
+    if not values:
+        return None
+    index = min(len(values) - 1, int(round(fraction * (len(values) - 1))))
+    return values[index]
+
+
+def run_scenario(workers, name, total_requests):
+    """
+    Split ``total_requests`` calls of ``name`` between the workers, one
+    thread each, and summarise the latencies in milliseconds.
+    """
+    latencies = []
+    queries = []
+    errors = []
+    lock = threading.Lock()
+    per_worker = max(1, total_requests // len(workers))
+
+    def drive(worker):
+        call = getattr(worker, name)
+        local_latencies, local_queries, local_errors = [], [], 0
+        for _ in range(per_worker):
+            start = time.perf_counter()
+            response = call()
+            local_latencies.append((time.perf_counter() - start) * 1000)
+            if response.status_code >= 400:
+                local_errors += 1
+            if 'X-DB-Queries' in response.headers:
+                local_queries.append(int(response.headers['X-DB-Queries']))
+            # 关闭响应，释放准入控制的名额
+            response.close()
+        with lock:
+            latencies.extend(local_latencies)
+            queries.extend(local_queries)
+            errors.append(local_errors)
+
+    threads = [threading.Thread(target=drive, args=(w, )) for w in workers]
+    start = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - start
+
+    latencies.sort()
+    return {
+        'requests': len(latencies),
+        'errors': sum(errors),
+        'seconds': round(elapsed, 4),
+        'throughput': round(len(latencies) / elapsed, 2),
+        'mean_ms': round(sum(latencies) / len(latencies), 3),
+        'p50_ms': round(percentile(latencies, 0.50), 3),
+        'p95_ms': round(percentile(latencies, 0.95), 3),
+        'p99_ms': round(percentile(latencies, 0.99), 3),
+        'queries_per_request':
+        round(sum(queries) / len(queries), 2) if queries else None,
+    }
+
+
+def compare(results, baseline, max_regression):
+    """
+    Return the scenarios whose p95 latency grew, or throughput dropped, by
+    more than ``max_regression`` (a fraction) against ``baseline``.
+    """
+    regressions = []
+    for name, current in results['scenarios'].items():
+        previous = baseline.get('scenarios', {}).get(name)
+        if previous is None:
+            continue
+        if current['p95_ms'] > previous['p95_ms'] * (1 + max_regression):
+            regressions.append(f"{name}: p95 {previous['p95_ms']}ms -> "
+                               f"{current['p95_ms']}ms")
+        if current['throughput'] < previous['throughput'] * (1 -
+                                                             max_regression):
+            regressions.append(f"{name}: throughput "
+                               f"{previous['throughput']}/s -> "
+                               f"{current['throughput']}/s")
+    return regressions
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--database-url',
+                        help='default: a new SQLite file in a temp folder')
+    parser.add_argument('--users', type=int, default=1000)
+    parser.add_argument('--concurrency', type=int, default=8)
+    parser.add_argument('--requests',
+                        type=int,
+                        default=1000,
+                        help='requests per scenario')
+    parser.add_argument('--scenarios',
+                        default=','.join(SCENARIOS),
+                        help='comma separated subset of: ' +
+                        ', '.join(SCENARIOS))
+    parser.add_argument('--output', help='write the JSON result here')
+    parser.add_argument('--baseline', help='JSON result of an earlier run')
+    parser.add_argument('--max-regression', type=float, default=0.2)
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    scenarios = [name for name in args.scenarios.split(',') if name]
+    unknown = set(scenarios) - set(SCENARIOS)
+    if unknown:
+        sys.exit(f'unknown scenarios: {", ".join(sorted(unknown))}')
+    if args.users < args.concurrency:
+        sys.exit('--users must be at least --concurrency')
+
+    database_url = args.database_url or 'sqlite:///' + os.path.join(
+        tempfile.mkdtemp(prefix='flask-bench-'), 'bench.db')
+    app = build_app(database_url)
+    role_id, user_ids = seed_users(app, args.users)
+
+    usernames = sorted(user_ids)
+    workers = [
+        Worker(app, i, usernames[i], user_ids[usernames[i]], role_id)
+        for i in range(args.concurrency)
+    ]
+    for worker in workers:
+        response = worker.login()
+        response.close()
+        if response.status_code != 200:
+            sys.exit(f'login failed for {worker.username}')
+
+    results = {
+        'meta': {
+            'database': database_url.split('@')[-1],
+            'users': args.users,
+            'concurrency': args.concurrency,
+            'requests_per_scenario': args.requests,
+            'python': platform.python_version(),
+            'time': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        },
+        'scenarios': {}
+    }
+    for name in scenarios:
+        results['scenarios'][name] = run_scenario(workers, name,
+                                                  args.requests)
+
+    output = json.dumps(results, indent=2)
+    if args.output:
+        with open(args.output, 'w') as f:
+            f.write(output + '\n')
+    print(output)
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            regressions = compare(results, json.load(f), args.max_regression)
+        for regression in regressions:
+            print(f'REGRESSION {regression}', file=sys.stderr)
+        if regressions:
+            sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
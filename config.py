@@ -9,11 +9,129 @@ class BaseConfig:
     DEBUG = False
     TESTING = False
     JWT_WHITE_LIST = []
+    # 服务器: SERVER_WORKERS > 1 时使用多进程 pre-fork 模式
+    SERVER_WORKERS = int(os.environ.get('SERVER_WORKERS', 1))
+    SERVER_BACKLOG = int(os.environ.get('SERVER_BACKLOG', 1024))
+    SERVER_KEEPALIVE = os.environ.get('SERVER_KEEPALIVE', 'true') == 'true'
+    SERVER_MAX_GREEN_THREADS = int(
+        os.environ.get('SERVER_MAX_GREEN_THREADS', 1024))
+    SERVER_GRACEFUL_TIMEOUT = int(os.environ.get('SERVER_GRACEFUL_TIMEOUT', 30))
+    # 密码哈希线程池: auto | tpool | thread | inline
+    PASSWORD_HASH_BACKEND = os.environ.get('PASSWORD_HASH_BACKEND', 'auto')
+    PASSWORD_HASH_POOL_SIZE = int(os.environ.get('PASSWORD_HASH_POOL_SIZE', 4))
+    # 数据库连接池（SQLite 不使用）
+    DB_POOL_SIZE = int(os.environ.get('DB_POOL_SIZE', 10))
+    DB_MAX_OVERFLOW = int(os.environ.get('DB_MAX_OVERFLOW', 10))
+    DB_POOL_TIMEOUT = int(os.environ.get('DB_POOL_TIMEOUT', 10))
+    DB_POOL_RECYCLE = int(os.environ.get('DB_POOL_RECYCLE', 1800))
+    DB_POOL_PRE_PING = os.environ.get('DB_POOL_PRE_PING', 'true') == 'true'
+    # 只读副本（逗号分隔的连接串）：GET 请求与令牌校验轮询读取副本，
+    # 出错的副本暂停使用 DB_REPLICA_EJECT_SECONDS 秒；
+    # 客户端写入后 DB_READ_YOUR_WRITES_SECONDS 秒内仍读主库
+    DB_REPLICA_URLS = [
+        url.strip() for url in os.environ.get('DB_REPLICA_URLS', '').split(',')
+        if url.strip()
+    ]
+    DB_REPLICA_EJECT_SECONDS = int(
+        os.environ.get('DB_REPLICA_EJECT_SECONDS', 30))
+    DB_READ_YOUR_WRITES_SECONDS = int(
+        os.environ.get('DB_READ_YOUR_WRITES_SECONDS', 5))
+    # eventlet 服务器下让 psycopg2 协作式等待
+    DB_GREEN_PSYCOPG2 = os.environ.get('DB_GREEN_PSYCOPG2', 'true') == 'true'
+    # 进程内角色目录的刷新间隔（秒）
+    ROLE_CATALOG_TTL = int(os.environ.get('ROLE_CATALOG_TTL', 300))
+    # 指标: 多进程时每个进程把指标快照写入 METRICS_DIR，抓取时汇总
+    METRICS_ENABLED = os.environ.get('METRICS_ENABLED', 'true') == 'true'
+    METRICS_PATH = os.environ.get('METRICS_PATH', '/metrics')
+    METRICS_DIR = os.environ.get('METRICS_DIR', '')
+    METRICS_FLUSH_INTERVAL = int(os.environ.get('METRICS_FLUSH_INTERVAL', 5))
+    # 响应压缩（gzip，安装 brotli 后优先使用 br）与 ETag/304
+    COMPRESS_ENABLED = os.environ.get('COMPRESS_ENABLED', 'true') == 'true'
+    COMPRESS_MIN_SIZE = int(os.environ.get('COMPRESS_MIN_SIZE', 1024))
+    COMPRESS_LEVEL = int(os.environ.get('COMPRESS_LEVEL', 6))
+    COMPRESS_BR_LEVEL = int(os.environ.get('COMPRESS_BR_LEVEL', 4))
+    ETAG_ENABLED = os.environ.get('ETAG_ENABLED', 'true') == 'true'
+    # 准入控制：按路径前缀分为昂贵接口（登录、刷新、批量写入）与其他接口，
+    # 各自限制并发数和排队长度，排队超过 ADMISSION_QUEUE_TIMEOUT 秒返回 503
+    ADMISSION_ENABLED = os.environ.get('ADMISSION_ENABLED', 'true') == 'true'
+    ADMISSION_EXPENSIVE_PATHS = [
+        path for path in os.environ.get(
+            'ADMISSION_EXPENSIVE_PATHS',
+            '/api/user/login,/api/user/refresh,/api/user/user/bulk').split(',')
+        if path
+    ]
+    ADMISSION_EXPENSIVE_LIMIT = int(
+        os.environ.get('ADMISSION_EXPENSIVE_LIMIT', 8))
+    ADMISSION_EXPENSIVE_QUEUE = int(
+        os.environ.get('ADMISSION_EXPENSIVE_QUEUE', 32))
+    ADMISSION_DEFAULT_LIMIT = int(os.environ.get('ADMISSION_DEFAULT_LIMIT', 64))
+    ADMISSION_DEFAULT_QUEUE = int(
+        os.environ.get('ADMISSION_DEFAULT_QUEUE', 256))
+    ADMISSION_QUEUE_TIMEOUT = float(
+        os.environ.get('ADMISSION_QUEUE_TIMEOUT', 2.0))
+    ADMISSION_RETRY_AFTER = int(os.environ.get('ADMISSION_RETRY_AFTER', 1))
+    # 请求性能分析（默认关闭）: 按比例抽样，或匹配请求头、接口名
+    PROFILE_ENABLED = os.environ.get('PROFILE_ENABLED', 'false') == 'true'
+    PROFILE_SAMPLE_RATE = float(os.environ.get('PROFILE_SAMPLE_RATE', 0.0))
+    # 请求头的值须等于 PROFILE_SECRET 才会触发采样，两者任一为空即关闭
+    PROFILE_HEADER = os.environ.get('PROFILE_HEADER', '')
+    PROFILE_SECRET = os.environ.get('PROFILE_SECRET', '')
+    PROFILE_ENDPOINTS = [
+        endpoint for endpoint in os.environ.get('PROFILE_ENDPOINTS', '').split(',')
+        if endpoint
+    ]
+    # pstats | collapsed
+    PROFILE_FORMAT = os.environ.get('PROFILE_FORMAT', 'pstats')
+    PROFILE_FOLDER = os.path.join(os.environ.get('LOG_FOLDER', './'),
+                                  'profiles')
     AUTH_CONFIG = {
         'JWT_SECRET': os.environ.get('JWT_SECRET', 'flask_app'),
         'JWT_ALGORITHM': os.environ.get('JWT_ALGORITHM', 'HS256'),
         'ACCESS_TOKEN_MAX_AGE': 10 * 60,    # 10 minutes
-        'REFRESH_TOKEN_MAX_AGE': 3 * 60 * 60    # 1 hour
+        'REFRESH_TOKEN_MAX_AGE': 3 * 60 * 60,    # 1 hour
+        # 已验证访问令牌的进程内缓存
+        'TOKEN_CACHE_SIZE': int(os.environ.get('TOKEN_CACHE_SIZE', 10000)),
+        'TOKEN_CACHE_TTL': int(os.environ.get('TOKEN_CACHE_TTL', 60)),
+        # 本进程内令牌变更后的这段时间里，该用户的令牌校验读主库而非副本
+        'TOKEN_PRIMARY_READ_SECONDS': int(
+            os.environ.get('TOKEN_PRIMARY_READ_SECONDS', 5)),
+        # 会话令牌存储后端: sql | redis
+        'TOKEN_STORE': os.environ.get('TOKEN_STORE', 'sql'),
+        'REDIS_URL': os.environ.get('REDIS_URL', 'redis://localhost:6379/0'),
+        # 无状态访问令牌：不查询令牌表，注销后的令牌记录在撤销列表中；
+        # memory 为进程内列表，多进程部署须使用 redis（REDIS_URL）共享
+        'STATELESS_ACCESS_TOKENS':
+        os.environ.get('STATELESS_ACCESS_TOKENS', 'false') == 'true',
+        'REVOCATION_BACKEND': os.environ.get('REVOCATION_BACKEND', 'memory'),
+        'REVOCATION_CAPACITY': int(os.environ.get('REVOCATION_CAPACITY',
+                                                  100000)),
+        # 登录限流：滑动窗口内每个用户名、每个客户端 IP 的尝试次数上限；
+        # memory 为进程内计数，多进程部署使用 redis（REDIS_URL）共享计数
+        'LOGIN_THROTTLE_ENABLED':
+        os.environ.get('LOGIN_THROTTLE_ENABLED', 'true') == 'true',
+        'LOGIN_THROTTLE_BACKEND': os.environ.get('LOGIN_THROTTLE_BACKEND',
+                                                 'memory'),
+        'LOGIN_THROTTLE_WINDOW': int(os.environ.get('LOGIN_THROTTLE_WINDOW',
+                                                    60)),
+        'LOGIN_THROTTLE_USER_LIMIT': int(
+            os.environ.get('LOGIN_THROTTLE_USER_LIMIT', 10)),
+        'LOGIN_THROTTLE_IP_LIMIT': int(
+            os.environ.get('LOGIN_THROTTLE_IP_LIMIT', 50)),
+        'LOGIN_THROTTLE_MAX_KEYS': int(
+            os.environ.get('LOGIN_THROTTLE_MAX_KEYS', 100000)),
+        # 用户列表分页
+        'USER_PAGE_SIZE': int(os.environ.get('USER_PAGE_SIZE', 50)),
+        'USER_PAGE_MAX': int(os.environ.get('USER_PAGE_MAX', 500)),
+        # 用户导出时每批读取和写出的行数
+        'USER_EXPORT_BATCH_SIZE': int(
+            os.environ.get('USER_EXPORT_BATCH_SIZE', 1000)),
+        # 增量同步只返回早于该秒数的变更，须大于最长的写事务耗时
+        'USER_CHANGES_SETTLE_SECONDS': int(
+            os.environ.get('USER_CHANGES_SETTLE_SECONDS', 30)),
+        # 批量接口：每个请求的条目上限，以及每个事务写入的行数
+        'USER_BULK_MAX': int(os.environ.get('USER_BULK_MAX', 1000)),
+        'USER_BULK_CHUNK_SIZE': int(os.environ.get('USER_BULK_CHUNK_SIZE',
+                                                   500)),
     }
 
 
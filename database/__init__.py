@@ -1,8 +1,17 @@
 import os
+import uuid
 from flask import Flask
 from string import Template
+from sqlalchemy import select
 
-from database.models import User, db, Role
+from auth.password_hasher import password_hasher
+from database.models import User, db, Role, role_catalog
+from database.migrations import MIGRATIONS, apply_migrations, \
+    applied_versions, lock_schema, read_versions, record_version
+from database.pool import pool_options
+from database.replicas import init_replicas, replica_binds
+from database.session import init_request_session
+from utils.utils import timed
 
 def get_connection_url():
     base_url = Template(
@@ -16,60 +25,113 @@ def get_connection_url():
         engine_name="+psycopg2")    # Use psycopg2 driver
 
 
-def create_all_tables():
+# 记录在 schema_version 表中的种子数据版本
+SEED_VERSION = 'seed_0001_roles_admin'
+DEFAULT_ROLES = [("admin", "Administrator role"), ("user", "Regular user role")]
+
+
+def create_all_tables(conn):
     """
     Create all tables in the database.
     """
-    db.create_all()
+    db.metadata.create_all(conn)
 
 
-def add_role_table():
+def add_role_table(conn):
     """
-    Function to add admin and user roles to the Role table if they do not already exist.
-    Returns the admin role after adding it to the table.
+    Add the admin and user roles to the Role table if they do not already
+    exist. Returns the id of the admin role.
     """
-    admin_role = Role.query.filter_by(name="admin").first()
-    if not admin_role:
-        admin_role = Role(name="admin", description="Administrator role")
-        db.session.add(admin_role)
-        db.session.commit()
+    role_ids = {
+        row.name: row.id
+        for row in conn.execute(select(Role.id, Role.name))
+    }
+    for name, description in DEFAULT_ROLES:
+        if name not in role_ids:
+            role_ids[name] = conn.execute(Role.__table__.insert().values(
+                name=name, description=description)).inserted_primary_key[0]
+    return role_ids["admin"]
 
-    user_role = Role.query.filter_by(name="user").first()
-    if not user_role:
-        user_role = Role(name="user", description="Regular user role")
-        db.session.add(user_role)
-        db.session.commit()
 
-    return admin_role
+def add_admin_user(conn):
+    """
+    Generate a new admin user if one does not already exist in the database.
+    """
+    admin_role_id = add_role_table(conn)
+    admin_exists = conn.execute(
+        select(User.id).where(User.username == "admin")).first()
+    if admin_exists is None:
+        conn.execute(User.__table__.insert().values(
+            id=str(uuid.uuid4()),
+            username="admin",
+            email="admin@example.com",
+            role_id=admin_role_id,
+            pw_hash=password_hasher.generate("admin123")))
 
 
-def add_admin_user():
+def bootstrap_db(engine, timings):
     """
-    Generate a new admin user if one does not already exist in the database.
+    Create the schema, apply pending migrations and seed the database, unless
+    schema_version shows all of it was already done. Normal boots therefore
+    cost one query. The bootstrap runs in a single transaction holding the
+    schema lock, so workers booting together against a new database wait
+    for the first one instead of racing on the seed inserts.
+
+    Returns True if the bootstrap ran.
     """
-    admin_role = add_role_table()
-    admin_user = User.query.filter_by(username="admin").first()
-    if not admin_user:
-        admin_user = User(username="admin",
-                          password="admin123",
-                          email="admin@example.com",
-                          role_id=admin_role.id)
-        db.session.add(admin_user)
-        db.session.commit()
+    required = {version for version, _ in MIGRATIONS} | {SEED_VERSION}
+    with timed(timings, 'version_check'):
+        versions = read_versions(engine)
+    if versions is not None and required <= versions:
+        return False
+
+    with engine.begin() as conn:
+        with timed(timings, 'schema_lock'):
+            lock_schema(conn)
+        with timed(timings, 'create_tables'):
+            create_all_tables(conn)
+        with timed(timings, 'migrations'):
+            apply_migrations(conn)
+        with timed(timings, 'seed'):
+            if SEED_VERSION not in applied_versions(conn):
+                add_admin_user(conn)
+                record_version(conn, SEED_VERSION)
+    return True
+
 
 def setup_db(app: Flask):
     """
-    Set up the database for the Flask app.
+    Set up the database for the Flask app and bootstrap it if needed.
 
     Parameters:
     - app (Flask): The Flask app object.
 
     Returns:
-    None
+    dict: seconds spent in each startup phase.
     """
+    timings = {}
     if not app.config.get('SQLALCHEMY_DATABASE_URI', None):
         app.config['SQLALCHEMY_DATABASE_URI'] = get_connection_url()
-    db.init_app(app)
+    if not app.config['SQLALCHEMY_DATABASE_URI'].startswith('sqlite'):
+        engine_options = app.config.setdefault('SQLALCHEMY_ENGINE_OPTIONS', {})
+        for key, value in pool_options(app.config).items():
+            engine_options.setdefault(key, value)
+    if app.config.get('DB_REPLICA_URLS'):
+        binds = app.config.setdefault('SQLALCHEMY_BINDS', {})
+        binds.update(
+            replica_binds(app.config['DB_REPLICA_URLS'],
+                          app.config.get('SQLALCHEMY_ENGINE_OPTIONS')))
+    with timed(timings, 'db_init'):
+        db.init_app(app)
+    role_catalog.ttl = app.config.get('ROLE_CATALOG_TTL', role_catalog.ttl)
     with app.app_context():
-        create_all_tables()
-        add_admin_user()
+        init_request_session(app, db)
+        init_replicas(app, db)
+        if bootstrap_db(db.engine, timings):
+            # 刚写入的角色直接加载到目录中
+            with timed(timings, 'role_catalog'):
+                role_catalog.load()
+        else:
+            # 角色目录在第一次使用时加载
+            role_catalog.invalidate()
+    return timings
@@ -0,0 +1,27 @@
+from eventlet.hubs import trampoline
+from psycopg2 import extensions, OperationalError
+
+
+def _eventlet_wait_callback(conn, timeout=-1):
+    """
+    psycopg2 wait callback that yields to the eventlet hub while the
+    connection waits on the socket (same approach as psycogreen).
+    """
+    while True:
+        state = conn.poll()
+        if state == extensions.POLL_OK:
+            break
+        elif state == extensions.POLL_READ:
+            trampoline(conn.fileno(), read=True)
+        elif state == extensions.POLL_WRITE:
+            trampoline(conn.fileno(), write=True)
+        else:
+            raise OperationalError(f"Bad result from poll: {state}")
+
+
+def make_psycopg2_green():
+    """
+    Make psycopg2 cooperative under eventlet, so a query waiting on
+    PostgreSQL no longer blocks every other green thread.
+    """
+    extensions.set_wait_callback(_eventlet_wait_callback)
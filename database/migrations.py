@@ -0,0 +1,134 @@
+from sqlalchemy import func, select, text
+from sqlalchemy.exc import DBAPIError
+from database.models import SchemaVersion, User, UserTombstone, db_now, \
+    USERNAME_UNIQUE_INDEX, EMAIL_UNIQUE_INDEX, UPDATED_AT_INDEX
+
+# PostgreSQL advisory lock id shared by every process that bootstraps the schema
+SCHEMA_LOCK_ID = 0x666c61736b
+
+
+def _find_duplicates(conn, column):
+    rows = conn.execute(
+        text(f'SELECT lower({column}) AS value, count(*) AS total '
+             f'FROM "user" GROUP BY lower({column}) HAVING count(*) > 1'))
+    return [row.value for row in rows]
+
+
+def add_user_lookup_indexes(conn):
+    """
+    Add the case-insensitive unique indexes on user.username and user.email
+    and the index on user.role_id to a database created before they were
+    part of the model.
+
+    Fails with the conflicting values if existing rows already differ only
+    by case, so they can be cleaned up before re-running.
+    """
+    for column in ('username', 'email'):
+        duplicates = _find_duplicates(conn, column)
+        if duplicates:
+            raise RuntimeError(
+                f'Cannot add unique index on lower({column}); '
+                f'duplicate values: {", ".join(duplicates)}')
+
+    conn.execute(
+        text(f'CREATE UNIQUE INDEX IF NOT EXISTS {USERNAME_UNIQUE_INDEX} '
+             f'ON "user" (lower(username))'))
+    conn.execute(
+        text(f'CREATE UNIQUE INDEX IF NOT EXISTS {EMAIL_UNIQUE_INDEX} '
+             f'ON "user" (lower(email))'))
+    conn.execute(
+        text('CREATE INDEX IF NOT EXISTS ix_user_role_id ON "user" (role_id)'))
+
+
+def add_user_sync(conn):
+    """
+    Prepare a database created before incremental sync: fill in missing
+    updated_at values, index (updated_at, id) and create the tombstone
+    table. On PostgreSQL the timestamp columns also get their database-side
+    defaults, which earlier versions only set from Python.
+    """
+    users = User.__table__
+    conn.execute(users.update().where(users.c.updated_at.is_(None)).values(
+        updated_at=func.coalesce(users.c.created_at, db_now())))
+    conn.execute(
+        text(f'CREATE INDEX IF NOT EXISTS {UPDATED_AT_INDEX} '
+             f'ON "user" (updated_at, id)'))
+    UserTombstone.__table__.create(conn, checkfirst=True)
+    if conn.dialect.name == 'postgresql':
+        conn.execute(
+            text('ALTER TABLE "user" '
+                 'ALTER COLUMN created_at SET DEFAULT now(), '
+                 'ALTER COLUMN updated_at SET DEFAULT now(), '
+                 'ALTER COLUMN updated_at SET NOT NULL'))
+        conn.execute(
+            text('ALTER TABLE token '
+                 'ALTER COLUMN created_at SET DEFAULT now(), '
+                 'ALTER COLUMN updated_at SET DEFAULT now()'))
+
+
+# 按顺序执行的迁移，每一步都必须可重复执行；版本名写入 schema_version 表
+MIGRATIONS = [
+    ('0001_user_lookup_indexes', add_user_lookup_indexes),
+    ('0002_user_sync', add_user_sync),
+]
+
+
+def read_versions(engine):
+    """
+    Return the set of applied versions with a single query, or None if
+    the schema_version table does not exist yet.
+    """
+    with engine.connect() as conn:
+        try:
+            return set(conn.execute(select(SchemaVersion.version)).scalars())
+        except DBAPIError:
+            return None
+
+
+def applied_versions(conn):
+    return set(conn.execute(select(SchemaVersion.version)).scalars())
+
+
+def record_version(conn, version):
+    conn.execute(SchemaVersion.__table__.insert().values(version=version))
+
+
+def lock_schema(conn):
+    """
+    Serialize schema changes between processes until the transaction of
+    ``conn`` ends. Only PostgreSQL has advisory locks; other databases are
+    expected to be bootstrapped by a single process.
+    """
+    if conn.dialect.name == 'postgresql':
+        conn.execute(text('SELECT pg_advisory_xact_lock(:id)'),
+                     {'id': SCHEMA_LOCK_ID})
+
+
+def apply_migrations(conn):
+    """
+    Apply the migrations that are not recorded yet, inside the transaction
+    of ``conn``. Returns the versions applied.
+    """
+    SchemaVersion.__table__.create(conn, checkfirst=True)
+    applied = applied_versions(conn)
+    pending = [(version, migrate) for version, migrate in MIGRATIONS
+               if version not in applied]
+    for version, migrate in pending:
+        migrate(conn)
+        record_version(conn, version)
+    return [version for version, _ in pending]
+
+
+def run_migrations(engine):
+    """
+    Apply every pending migration in MIGRATIONS, each in its own locked
+    transaction.
+    """
+    with engine.begin() as conn:
+        SchemaVersion.__table__.create(conn, checkfirst=True)
+    for version, migrate in MIGRATIONS:
+        with engine.begin() as conn:
+            lock_schema(conn)
+            if version not in applied_versions(conn):
+                migrate(conn)
+                record_version(conn, version)
@@ -1,11 +1,20 @@
 import time
 from datetime import datetime, timezone, timedelta
 import uuid
-from werkzeug.security import generate_password_hash, check_password_hash
 from flask_sqlalchemy import SQLAlchemy
-from sqlalchemy import DateTime, String
+from sqlalchemy import DateTime, String, func
+from sqlalchemy.ext.compiler import compiles
+from sqlalchemy.ext.hybrid import hybrid_property
+from sqlalchemy.sql.functions import FunctionElement
+from auth.password_hasher import password_hasher
+from database.role_catalog import RoleCatalog
+from database.session import RequestSession
 
-db = SQLAlchemy()
+db = SQLAlchemy(session_options={'class_': RequestSession})
+
+USERNAME_UNIQUE_INDEX = 'uq_user_username_lower'
+EMAIL_UNIQUE_INDEX = 'uq_user_email_lower'
+UPDATED_AT_INDEX = 'ix_user_updated_at_id'
 
 
 def get_current_time(time_delta=8):
@@ -24,6 +33,60 @@ def current_millis():
     return int(round(time.time() * 1000))
 
 
+class db_now(FunctionElement):
+    """
+    The database's current timestamp, used for server-side defaults so
+    every row is stamped by one clock rather than by each app server's.
+    """
+    type = DateTime(timezone=True)
+    inherit_cache = True
+
+
+@compiles(db_now)
+def _db_now_default(element, compiler, **kw):
+    return 'CURRENT_TIMESTAMP'
+
+
+@compiles(db_now, 'postgresql')
+def _db_now_postgresql(element, compiler, **kw):
+    return 'now()'
+
+
+@compiles(db_now, 'sqlite')
+def _db_now_sqlite(element, compiler, **kw):
+    # 与 SQLAlchemy 在 SQLite 中存储 DateTime 的格式一致（微秒六位），
+    # 否则同一秒内的时间按字符串比较会出错
+    return "strftime('%Y-%m-%d %H:%M:%f000', 'now')"
+
+
+class db_now_minus(FunctionElement):
+    """
+    The database's current timestamp minus a number of seconds, e.g.
+    ``db_now_minus(30)``, compared against timestamps stamped by ``db_now``.
+    """
+    type = DateTime(timezone=True)
+    inherit_cache = True
+
+
+@compiles(db_now_minus)
+def _db_now_minus_default(element, compiler, **kw):
+    seconds = compiler.process(element.clauses, **kw)
+    return f"CURRENT_TIMESTAMP - {seconds} * INTERVAL '1' SECOND"
+
+
+@compiles(db_now_minus, 'postgresql')
+def _db_now_minus_postgresql(element, compiler, **kw):
+    seconds = compiler.process(element.clauses, **kw)
+    return f"now() - {seconds} * interval '1 second'"
+
+
+@compiles(db_now_minus, 'sqlite')
+def _db_now_minus_sqlite(element, compiler, **kw):
+    seconds = compiler.process(element.clauses, **kw)
+    return (f"strftime('%Y-%m-%d %H:%M:%f000', 'now', "
+            f"'-' || {seconds} || ' seconds')")
+
+
 class Role(db.Model):
     """
     Role table
@@ -41,6 +104,9 @@ class Role(db.Model):
         }
 
 
+role_catalog = RoleCatalog(lambda: Role.query.all())
+
+
 class User(db.Model):
     """
     User table
@@ -53,36 +119,89 @@ class User(db.Model):
                    nullable=False)
     username = db.Column(db.String(16), nullable=False)
     email = db.Column(db.String(120), nullable=False)
-    role_id = db.Column(db.Integer, db.ForeignKey('role.id'), nullable=False)
+    role_id = db.Column(db.Integer,
+                        db.ForeignKey('role.id'),
+                        index=True,
+                        nullable=False)
     role = db.relationship('Role', backref='users')
     pw_hash = db.Column(db.String(1000), nullable=False)
     experiments = db.Column(db.BigInteger, nullable=True)
-    created_at = db.Column(DateTime(timezone=True), default=get_current_time())
-    updated_at = db.Column(DateTime(timezone=True), default=get_current_time())
+    created_at = db.Column(DateTime(timezone=True), server_default=db_now())
+    # 每次更新由数据库刷新，增量同步按 (updated_at, id) 排序读取
+    updated_at = db.Column(DateTime(timezone=True),
+                           server_default=db_now(),
+                           onupdate=db_now(),
+                           nullable=False)
 
     def __init__(self, password, **kwargs):
         super(User, self).__init__(**kwargs)
         self.set_password(password)
 
+    @hybrid_property
+    def username_key(self):
+        """
+        Case-insensitive lookup key, matching the unique index on lower(username).
+        """
+        return self.username.lower()
+
+    @username_key.expression
+    def username_key(cls):
+        return func.lower(cls.username)
+
+    @hybrid_property
+    def email_key(self):
+        """
+        Case-insensitive lookup key, matching the unique index on lower(email).
+        """
+        return self.email.lower()
+
+    @email_key.expression
+    def email_key(cls):
+        return func.lower(cls.email)
+
     def set_password(self, password):
-        self.pw_hash = generate_password_hash(password)
+        self.pw_hash = password_hasher.generate(password)
 
     def check_password(self, password):
-        return check_password_hash(self.pw_hash, password)
+        return password_hasher.check(self.pw_hash, password)
 
     def to_dict(self):
         return {
-            'id': str(self.id),
+            'id': self.id,
             'username': self.username,
             'email': self.email,
             'role_id': self.role_id,
-            'role': self.role.name if self.role else None,
+            'role': role_catalog.name_of(self.role_id),
             'experiments': self.experiments,
-            'created_at': self.created_at.isoformat(),
-            'updated_at': self.updated_at.isoformat()
+            # 日期由 JSON provider 序列化为 ISO 8601
+            'created_at': self.created_at,
+            'updated_at': self.updated_at
         }
 
 
+db.Index(USERNAME_UNIQUE_INDEX, func.lower(User.username), unique=True)
+db.Index(EMAIL_UNIQUE_INDEX, func.lower(User.email), unique=True)
+db.Index(UPDATED_AT_INDEX, User.updated_at, User.id)
+
+
+class UserTombstone(db.Model):
+    """
+    One row per deleted user, so incremental sync can report deletions.
+    """
+    __tablename__ = "user_tombstone"
+    id = db.Column(String(36), primary_key=True)
+    deleted_at = db.Column(DateTime(timezone=True),
+                           server_default=db_now(),
+                           nullable=False)
+
+    def to_dict(self):
+        return {'id': self.id, 'deleted_at': self.deleted_at}
+
+
+db.Index('ix_user_tombstone_deleted_at_id', UserTombstone.deleted_at,
+         UserTombstone.id)
+
+
 class Token(db.Model):
     id = db.Column(String(36),
                    primary_key=True,
@@ -93,8 +212,22 @@ class Token(db.Model):
                          nullable=False)
     token = db.Column(db.String(255), unique=True, nullable=True)
     refresh_token = db.Column(db.String(255), unique=True, nullable=True)
-    created_at = db.Column(DateTime(timezone=True), default=get_current_time())
-    updated_at = db.Column(DateTime(timezone=True), default=get_current_time())
+    created_at = db.Column(DateTime(timezone=True), server_default=db_now())
+    updated_at = db.Column(DateTime(timezone=True),
+                           server_default=db_now(),
+                           onupdate=db_now())
 
     def __repr__(self):
         return f'<RefreshToken {self.username}>'
+
+
+class SchemaVersion(db.Model):
+    """
+    One row per applied migration or seed step, so a boot can tell with a
+    single query whether the database is already up to date.
+    """
+    __tablename__ = "schema_version"
+    version = db.Column(db.String(64), primary_key=True)
+    applied_at = db.Column(DateTime(timezone=True),
+                           server_default=func.now(),
+                           nullable=False)
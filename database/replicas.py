@@ -0,0 +1,166 @@
+import itertools
+import threading
+import time
+from contextlib import contextmanager
+from flask import g, has_app_context, request
+from sqlalchemy import event
+from sqlalchemy.exc import OperationalError
+
+from metrics import replica_ejections
+
+REPLICA_BIND_PREFIX = 'replica_'
+# 客户端最近一次写入后、读主库截止的时间戳
+PRIMARY_UNTIL_COOKIE = 'db_primary_until'
+
+
+def replica_binds(urls, engine_options=None):
+    """
+    Build the SQLALCHEMY_BINDS entries for the replica ``urls``.
+    Flask-SQLAlchemy does not apply SQLALCHEMY_ENGINE_OPTIONS to binds, so
+    ``engine_options`` (e.g. the pool settings) are given per bind.
+    """
+    return {
+        f'{REPLICA_BIND_PREFIX}{i}': dict(engine_options or {}, url=url)
+        for i, url in enumerate(urls)
+    }
+
+
+class ReplicaRouter:
+    """
+    Picks the replica engine for a read, round-robin, skipping replicas
+    that failed within the last ``eject_seconds``. Returns None when every
+    replica is ejected, so reads fall back to the primary.
+    """
+
+    def __init__(self, engines, eject_seconds=30):
+        self.engines = dict(engines)
+        self.eject_seconds = eject_seconds
+        self._keys = sorted(self.engines)
+        self._counter = itertools.count()
+        self._ejected_until = {}
+        self._lock = threading.Lock()
+
+    def choose(self):
+        now = time.monotonic()
+        for _ in range(len(self._keys)):
+            key = self._keys[next(self._counter) % len(self._keys)]
+            if self._ejected_until.get(key, 0) <= now:
+                return self.engines[key]
+        return None
+
+    def eject(self, key):
+        with self._lock:
+            self._ejected_until[key] = time.monotonic() + self.eject_seconds
+        replica_ejections.inc(replica=key)
+
+    def stats(self):
+        now = time.monotonic()
+        return {
+            key: {'ejected': self._ejected_until.get(key, 0) > now}
+            for key in self._keys
+        }
+
+
+def read_engine():
+    """
+    The replica engine reads of the current request may use, or None.
+    """
+    if not has_app_context() or not g.get('db_replica_reads'):
+        return None
+    return g.get('db_replica')
+
+
+def mark_write():
+    if has_app_context():
+        g.db_wrote = True
+
+
+@contextmanager
+def replica_reads():
+    """
+    Let reads inside the block use the request's replica, also in requests
+    that otherwise read from the primary (e.g. the token check of a POST).
+    """
+    previous = g.get('db_replica_reads', False)
+    g.db_replica_reads = True
+    try:
+        yield
+    finally:
+        g.db_replica_reads = previous
+
+
+@contextmanager
+def primary_reads():
+    """
+    Send reads inside the block to the primary, e.g. the token check of a
+    user whose tokens just changed and may not have replicated yet.
+    """
+    if not has_app_context():
+        yield
+        return
+    previous = g.get('db_replica_reads', False)
+    g.db_replica_reads = False
+    try:
+        yield
+    finally:
+        g.db_replica_reads = previous
+
+
+def init_replicas(app, db):
+    """
+    Route the reads of GET/HEAD requests to the replica binds configured in
+    ``DB_REPLICA_URLS``. A client that wrote through the primary gets a
+    cookie that keeps its reads on the primary for
+    ``DB_READ_YOUR_WRITES_SECONDS``, so it sees its own writes despite
+    replication lag. Does nothing when no replica is configured.
+    """
+    with app.app_context():
+        engines = {
+            key: engine
+            for key, engine in db.engines.items()
+            if key and key.startswith(REPLICA_BIND_PREFIX)
+        }
+    if not engines:
+        return None
+    # 副本没有自己的表，去掉 init_app 为其创建的空 MetaData，
+    # 否则 db.create_all()/drop_all() 会对所有应用查找副本引擎
+    for key in engines:
+        db.metadatas.pop(key, None)
+
+    router = ReplicaRouter(engines,
+                           app.config.get('DB_REPLICA_EJECT_SECONDS', 30))
+    app.extensions['db_replicas'] = router
+    window = app.config.get('DB_READ_YOUR_WRITES_SECONDS', 5)
+
+    for key, engine in engines.items():
+
+        def eject_on_error(context, key=key):
+            # 连接断开或数据库不可用时暂停使用该副本
+            if context.is_disconnect or isinstance(
+                    context.sqlalchemy_exception, OperationalError):
+                router.eject(key)
+
+        event.listen(engine, 'handle_error', eject_on_error)
+
+    @app.before_request
+    def route_reads():
+        try:
+            primary_until = float(request.cookies.get(PRIMARY_UNTIL_COOKIE, 0))
+        except ValueError:
+            primary_until = 0
+        if primary_until > time.time():
+            return
+        g.db_replica = router.choose()
+        g.db_replica_reads = request.method in ('GET', 'HEAD')
+
+    @app.after_request
+    def pin_to_primary(response):
+        if g.get('db_wrote') and window > 0:
+            response.set_cookie(PRIMARY_UNTIL_COOKIE,
+                                f'{time.time() + window:.3f}',
+                                max_age=window,
+                                path='/',
+                                httponly=True)
+        return response
+
+    return router
@@ -0,0 +1,93 @@
+import hashlib
+import threading
+import time
+from collections import namedtuple
+
+
+class CatalogRole(namedtuple('CatalogRole', ['id', 'name', 'description'])):
+    """
+    Detached, read-only copy of a Role row.
+    """
+
+    def to_dict(self):
+        return {
+            'id': str(self.id),
+            'name': self.name,
+            'description': self.description,
+        }
+
+
+class RoleCatalog:
+    """
+    Process-local copy of the role table, keyed by id and by name.
+
+    The table is tiny and nearly static, so it is loaded once at startup
+    and reloaded when it is older than ``ttl`` seconds, when it is
+    invalidated after a local write, or when an unknown role id shows up.
+    Reloads for unknown ids happen at most once per ``miss_interval``
+    seconds, so a burst of bogus ids cannot turn into a burst of queries.
+    ``version`` is a hash of the contents, so it is identical in every
+    process that has loaded the same roles.
+    """
+
+    def __init__(self, loader, ttl=300, miss_interval=1):
+        self._loader = loader
+        self.ttl = ttl
+        self.miss_interval = miss_interval
+        self.version = None
+        self._by_id = {}
+        self._by_name = {}
+        self._loaded_at = None
+        self._lock = threading.Lock()
+
+    def load(self):
+        roles = [
+            CatalogRole(role.id, role.name, role.description)
+            for role in self._loader()
+        ]
+        roles.sort(key=lambda role: role.id)
+        digest = hashlib.sha1(repr(roles).encode('utf-8')).hexdigest()
+
+        with self._lock:
+            self._by_id = {role.id: role for role in roles}
+            self._by_name = {role.name: role for role in roles}
+            self.version = digest[:16]
+            self._loaded_at = time.monotonic()
+
+    def invalidate(self):
+        self._loaded_at = None
+
+    def get(self, role_id):
+        self._ensure_fresh()
+        role = self._by_id.get(role_id)
+        if role is None and role_id is not None and self._may_reload():
+            # 其他进程可能新增了角色
+            self.load()
+            role = self._by_id.get(role_id)
+        return role
+
+    def get_by_name(self, name):
+        self._ensure_fresh()
+        return self._by_name.get(name)
+
+    def name_of(self, role_id):
+        role = self.get(role_id)
+        return role.name if role else None
+
+    def roles(self):
+        self._ensure_fresh()
+        return list(self._by_id.values())
+
+    def get_version(self):
+        self._ensure_fresh()
+        return self.version
+
+    def _may_reload(self):
+        loaded_at = self._loaded_at
+        return loaded_at is None or \
+            time.monotonic() - loaded_at >= self.miss_interval
+
+    def _ensure_fresh(self):
+        loaded_at = self._loaded_at
+        if loaded_at is None or time.monotonic() - loaded_at > self.ttl:
+            self.load()
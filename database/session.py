@@ -0,0 +1,97 @@
+import time
+from flask import g, has_app_context
+from flask_sqlalchemy.session import Session
+from sqlalchemy import event
+from database.replicas import mark_write, read_engine
+
+
+class RequestSession(Session):
+    """
+    The class behind ``db.session``.
+
+    The scoped ``db.session`` only builds one of these the first time it is
+    used in an app context, so requests that never touch the database never
+    open a session. Each construction is counted in the request stats.
+    """
+
+    def __init__(self, db, **kwargs):
+        super().__init__(db, **kwargs)
+        stats = request_stats()
+        if stats is not None:
+            stats['sessions'] += 1
+
+    def get_bind(self, mapper=None, clause=None, bind=None, **kwargs):
+        """
+        Send plain SELECTs to the request's read replica, if it has one.
+        Flushes, DML and SELECT ... FOR UPDATE always go to the primary.
+        """
+        if bind is None:
+            if self._flushing or getattr(clause, 'is_dml', False):
+                mark_write()
+            elif getattr(clause, 'is_select', False) and \
+                    getattr(clause, '_for_update_arg', None) is None:
+                replica = read_engine()
+                if replica is not None:
+                    return replica
+        return super().get_bind(mapper=mapper,
+                                clause=clause,
+                                bind=bind,
+                                **kwargs)
+
+
+def request_stats():
+    """
+    Return the database counters of the current request (or app context):
+    sessions opened, queries executed and seconds spent in the database.
+    Returns None outside an app context.
+    """
+    if not has_app_context():
+        return None
+    stats = g.get('db_stats')
+    if stats is None:
+        stats = g.db_stats = {'sessions': 0, 'queries': 0, 'db_time': 0.0}
+    return stats
+
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context,
+                           executemany):
+    conn.info.setdefault('query_start', []).append(time.perf_counter())
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context,
+                          executemany):
+    start = conn.info['query_start'].pop()
+    stats = request_stats()
+    if stats is not None:
+        stats['queries'] += 1
+        stats['db_time'] += time.perf_counter() - start
+
+
+def _handle_error(context):
+    if context.connection is not None:
+        starts = context.connection.info.get('query_start')
+        if starts:
+            starts.pop()
+
+
+def init_request_session(app, db):
+    """
+    Count queries on every engine of ``db`` and close the request session
+    in ``teardown_request`` so it is also released when a view raises.
+    """
+    for engine in db.engines.values():
+        if not event.contains(engine, 'before_cursor_execute',
+                              _before_cursor_execute):
+            event.listen(engine, 'before_cursor_execute',
+                         _before_cursor_execute)
+            event.listen(engine, 'after_cursor_execute',
+                         _after_cursor_execute)
+            event.listen(engine, 'handle_error', _handle_error)
+
+    @app.teardown_request
+    def close_request_session(exc):
+        # 只有本次请求实际打开过会话时才需要清理
+        if db.session.registry.has():
+            if exc is not None:
+                db.session.rollback()
+            db.session.remove()
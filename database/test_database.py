@@ -0,0 +1,326 @@
+import os
+import shutil
+import tempfile
+import unittest
+from flask import Flask
+from config import TestingConfig
+from database import setup_db
+from sqlalchemy import create_engine, event, text
+from sqlalchemy.engine import Engine
+from database.migrations import run_migrations
+from database.pool import InstrumentedQueuePool, pool_stats
+from database.role_catalog import RoleCatalog
+from database.replicas import PRIMARY_UNTIL_COOKIE, ReplicaRouter, \
+    replica_reads
+from database.models import db, Role, SchemaVersion, User
+from database.session import request_stats
+
+
+class RequestSessionTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.app = Flask(__name__)
+        self.app.config.from_object(TestingConfig)
+        self.app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite://'
+        setup_db(self.app)
+
+        @self.app.route('/ping')
+        def ping():
+            return dict(request_stats())
+
+        @self.app.route('/count')
+        def count():
+            User.query.count()
+            return dict(request_stats())
+
+        self.client = self.app.test_client()
+
+    def tearDown(self):
+        with self.app.app_context():
+            db.drop_all()
+
+    def test_session_is_not_opened_without_queries(self):
+        response = self.client.get('/ping')
+
+        self.assertEqual(response.json['sessions'], 0)
+        self.assertEqual(response.json['queries'], 0)
+
+    def test_session_is_opened_on_first_use(self):
+        response = self.client.get('/count')
+
+        self.assertEqual(response.json['sessions'], 1)
+        self.assertEqual(response.json['queries'], 1)
+
+
+class MigrationsTestCase(unittest.TestCase):
+
+    def setUp(self):
+        # 模拟添加索引之前创建的旧表结构
+        self.engine = create_engine('sqlite://')
+        with self.engine.begin() as conn:
+            conn.execute(
+                text('CREATE TABLE "user" (id VARCHAR(36) PRIMARY KEY, '
+                     'username VARCHAR(16), email VARCHAR(120), '
+                     'role_id INTEGER, created_at DATETIME, '
+                     'updated_at DATETIME)'))
+
+    def test_adds_user_lookup_indexes(self):
+        run_migrations(self.engine)
+        run_migrations(self.engine)
+
+        with self.engine.connect() as conn:
+            rows = conn.execute(
+                text("SELECT name, sql FROM sqlite_master "
+                     "WHERE type = 'index' AND tbl_name = 'user'"))
+            indexes = {row.name: row.sql for row in rows}
+        self.assertIn('UNIQUE', indexes['uq_user_username_lower'])
+        self.assertIn('UNIQUE', indexes['uq_user_email_lower'])
+        self.assertIn('ix_user_role_id', indexes)
+
+    def test_prepares_user_sync(self):
+        with self.engine.begin() as conn:
+            conn.execute(
+                text('INSERT INTO "user" VALUES '
+                     "('1', 'bob', 'a@example.com', 1, "
+                     "'2023-05-01 00:00:00.000000', NULL), "
+                     "('2', 'amy', 'b@example.com', 1, NULL, NULL)"))
+
+        run_migrations(self.engine)
+
+        with self.engine.connect() as conn:
+            rows = conn.execute(
+                text('SELECT id, updated_at FROM "user" ORDER BY id')).all()
+            indexes = set(
+                conn.execute(
+                    text("SELECT name FROM sqlite_master "
+                         "WHERE type = 'index'")).scalars())
+        self.assertEqual(rows[0].updated_at, '2023-05-01 00:00:00.000000')
+        self.assertIsNotNone(rows[1].updated_at)
+        self.assertIn('ix_user_updated_at_id', indexes)
+        self.assertIn('ix_user_tombstone_deleted_at_id', indexes)
+
+    def test_refuses_case_duplicates(self):
+        with self.engine.begin() as conn:
+            conn.execute(
+                text('INSERT INTO "user" VALUES '
+                     "('1', 'bob', 'a@example.com', 1, NULL, NULL), "
+                     "('2', 'Bob', 'b@example.com', 1, NULL, NULL)"))
+
+        with self.assertRaisesRegex(RuntimeError, 'bob'):
+            run_migrations(self.engine)
+
+
+class BootstrapTestCase(unittest.TestCase):
+
+    def setUp(self):
+        fd, self.path = tempfile.mkstemp(suffix='.db')
+        os.close(fd)
+        self.addCleanup(os.remove, self.path)
+
+    def _setup_app(self):
+        app = Flask(__name__)
+        app.config.from_object(TestingConfig)
+        app.config['SQLALCHEMY_DATABASE_URI'] = f'sqlite:///{self.path}'
+        timings = setup_db(app)
+        return app, timings
+
+    def _count_statements(self):
+        statements = []
+
+        def record(conn, cursor, statement, *args):
+            statements.append(statement)
+
+        event.listen(Engine, 'before_cursor_execute', record)
+        self.addCleanup(event.remove, Engine, 'before_cursor_execute', record)
+        return statements
+
+    def test_first_boot_bootstraps_and_records_versions(self):
+        app, timings = self._setup_app()
+
+        self.assertIn('seed', timings)
+        with app.app_context():
+            versions = {row.version for row in SchemaVersion.query.all()}
+            self.assertIn('0001_user_lookup_indexes', versions)
+            self.assertIn('seed_0001_roles_admin', versions)
+            self.assertEqual(User.query.filter_by(username='admin').count(),
+                             1)
+            self.assertEqual(Role.query.count(), 2)
+
+    def test_later_boots_run_a_single_query(self):
+        self._setup_app()
+        statements = self._count_statements()
+
+        app, timings = self._setup_app()
+
+        self.assertEqual(len(statements), 1)
+        self.assertNotIn('seed', timings)
+        self.assertIn('version_check', timings)
+
+    def test_database_without_version_table_is_bootstrapped_once(self):
+        app, _ = self._setup_app()
+        with app.app_context():
+            SchemaVersion.__table__.drop(db.engine)
+
+        app, timings = self._setup_app()
+
+        self.assertIn('seed', timings)
+        with app.app_context():
+            self.assertEqual(User.query.filter_by(username='admin').count(),
+                             1)
+            self.assertEqual(Role.query.count(), 2)
+
+
+class ReplicaRoutingTestCase(unittest.TestCase):
+
+    def setUp(self):
+        paths = []
+        for _ in range(2):
+            fd, path = tempfile.mkstemp(suffix='.db')
+            os.close(fd)
+            self.addCleanup(os.remove, path)
+            paths.append(path)
+        primary, replica = paths
+        self.primary_path, self.replica_path = paths
+
+        self.app = Flask(__name__)
+        self.app.config.from_object(TestingConfig)
+        self.app.config['SQLALCHEMY_DATABASE_URI'] = f'sqlite:///{primary}'
+        self.app.config['DB_REPLICA_URLS'] = [f'sqlite:///{replica}']
+        setup_db(self.app)
+        # 副本是主库此刻的快照，之后主库的写入不会同步过去
+        shutil.copyfile(primary, replica)
+
+        @self.app.route('/count')
+        def count():
+            return str(User.query.count())
+
+        @self.app.route('/users', methods=['POST'])
+        def create():
+            db.session.add(
+                User(password='secret',
+                     username='new',
+                     email='new@example.com',
+                     role_id=1))
+            db.session.commit()
+            return str(User.query.count())
+
+        self.client = self.app.test_client()
+        self.router = self.app.extensions['db_replicas']
+
+    def tearDown(self):
+        with self.app.app_context():
+            for engine in db.engines.values():
+                engine.dispose()
+
+    def test_get_reads_replica_until_own_write(self):
+        self.assertEqual(self.client.get('/count').data, b'1')
+
+        response = self.client.post('/users')
+
+        self.assertEqual(response.data, b'2')
+        self.assertIn(PRIMARY_UNTIL_COOKIE, response.headers['Set-Cookie'])
+        self.assertEqual(self.client.get('/count').data, b'2')
+
+        self.client.delete_cookie('localhost', PRIMARY_UNTIL_COOKIE)
+        self.assertEqual(self.client.get('/count').data, b'1')
+
+    def test_failing_replica_is_ejected(self):
+        with self.app.app_context():
+            with db.engines['replica_0'].begin() as conn:
+                conn.execute(text('DROP TABLE "user"'))
+
+        with self.assertRaises(Exception):
+            self.client.get('/count')
+
+        self.assertTrue(self.router.stats()['replica_0']['ejected'])
+        self.assertEqual(self.client.get('/count').data, b'1')
+
+    def test_token_check_reads_primary_after_logout(self):
+        from auth.auth_service import AuthService
+        auth_service = AuthService(self.app.config['AUTH_CONFIG'])
+        with self.app.app_context():
+            tokens = auth_service.authenticate('admin', 'admin123')
+        # 副本同步到登录之后的状态，注销只写入主库
+        with self.app.app_context():
+            db.engines['replica_0'].dispose()
+        shutil.copyfile(self.primary_path, self.replica_path)
+
+        @self.app.route('/verify')
+        def verify():
+            with replica_reads():
+                try:
+                    auth_service.verify_token_expiration(
+                        tokens['access_token'])
+                except Exception:
+                    return 'invalid'
+            return 'valid'
+
+        with self.app.app_context():
+            auth_service.logout(tokens['refresh_token'])
+
+        self.assertEqual(self.client.get('/verify').data, b'invalid')
+
+        # 其他进程中的注销不会让本进程改读主库，副本仍认可旧令牌
+        auth_service.token_cache.clear()
+        self.assertEqual(self.client.get('/verify').data, b'valid')
+
+    def test_round_robin_skips_ejected(self):
+        router = ReplicaRouter({'a': 'engine-a', 'b': 'engine-b'})
+
+        self.assertEqual({router.choose(), router.choose()},
+                         {'engine-a', 'engine-b'})
+        router.eject('a')
+        self.assertEqual({router.choose(), router.choose()}, {'engine-b'})
+        router.eject('b')
+        self.assertIsNone(router.choose())
+
+
+class RoleCatalogTestCase(unittest.TestCase):
+
+    def test_unknown_ids_reload_at_most_once_per_interval(self):
+        loads = []
+
+        def loader():
+            loads.append(1)
+            return [Role(id=1, name='user', description=None)]
+
+        catalog = RoleCatalog(loader, miss_interval=60)
+        catalog.load()
+        for _ in range(1000):
+            self.assertIsNone(catalog.get(999))
+        self.assertEqual(len(loads), 1)
+
+        catalog.miss_interval = 0
+        self.assertIsNone(catalog.get(999))
+        self.assertEqual(len(loads), 2)
+        self.assertEqual(catalog.get(1).name, 'user')
+
+
+class PoolStatsTestCase(unittest.TestCase):
+
+    def test_reports_checkouts_and_in_use(self):
+        fd, path = tempfile.mkstemp(suffix='.db')
+        os.close(fd)
+        self.addCleanup(os.remove, path)
+        engine = create_engine(f'sqlite:///{path}',
+                               poolclass=InstrumentedQueuePool,
+                               pool_size=2,
+                               max_overflow=1)
+        self.addCleanup(engine.dispose)
+
+        first = engine.connect()
+        second = engine.connect()
+        third = engine.connect()
+        stats = pool_stats(engine)
+        first.close()
+        second.close()
+        third.close()
+
+        self.assertEqual(stats['in_use'], 3)
+        self.assertEqual(stats['overflow'], 1)
+        self.assertEqual(stats['checkouts'], 3)
+        self.assertEqual(pool_stats(engine)['in_use'], 0)
+
+
+if __name__ == '__main__':
+    unittest.main()
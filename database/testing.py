@@ -0,0 +1,36 @@
+from contextlib import contextmanager
+from sqlalchemy import event
+from database.models import db
+
+
+@contextmanager
+def count_queries(engine=None):
+    """
+    Count the SQL statements executed on ``engine`` (default: ``db.engine``)
+    inside the ``with`` block. Yields a list that collects the statements.
+    """
+    if engine is None:
+        engine = db.engine
+    statements = []
+
+    def _record(conn, cursor, statement, parameters, context, executemany):
+        statements.append(statement)
+
+    event.listen(engine, 'after_cursor_execute', _record)
+    try:
+        yield statements
+    finally:
+        event.remove(engine, 'after_cursor_execute', _record)
+
+
+@contextmanager
+def assert_max_queries(testcase, max_queries, engine=None):
+    """
+    Fail ``testcase`` if the ``with`` block runs more than ``max_queries``
+    SQL statements.
+    """
+    with count_queries(engine) as statements:
+        yield statements
+    if len(statements) > max_queries:
+        testcase.fail(f'{len(statements)} queries executed, expected at most '
+                      f'{max_queries}:\n' + '\n'.join(statements))
@@ -1,9 +1,34 @@
+import atexit
 import os
 import logging as logging_alia
-from log.flask_logger import Flask_Logger
+from log.flask_logger import Flask_Logger, parse_level
 
 log_folder = os.environ.get('LOG_FOLDER', './')
 
-logging = Flask_Logger('flask_app',
-                       logging_level=logging_alia.INFO,
-                       log_folder=log_folder).get()
+# 每个级别的采样比例，例如 LOG_SAMPLE_DEBUG=0.01 只保留约 1% 的 debug 日志
+sample_rates = {
+    level: float(os.environ[f'LOG_SAMPLE_{name}'])
+    for level, name in ((logging_alia.DEBUG, 'DEBUG'),
+                        (logging_alia.INFO, 'INFO'),
+                        (logging_alia.WARNING, 'WARNING'))
+    if f'LOG_SAMPLE_{name}' in os.environ
+}
+
+flask_logger = Flask_Logger(
+    'flask_app',
+    logging_level=parse_level(os.environ.get('LOG_LEVEL')),
+    log_folder=log_folder,
+    use_queue=os.environ.get('LOG_QUEUE', 'true') == 'true',
+    queue_size=int(os.environ.get('LOG_QUEUE_SIZE', 10000)),
+    drop_policy=os.environ.get('LOG_DROP_POLICY', 'new'),
+    log_format=os.environ.get('LOG_FORMAT', 'text'),
+    rotate=os.environ.get('LOG_ROTATE') or None,
+    max_bytes=int(os.environ.get('LOG_MAX_BYTES', 100 * 1024 * 1024)),
+    rotate_when=os.environ.get('LOG_ROTATE_WHEN', 'midnight'),
+    backup_count=int(os.environ.get('LOG_BACKUP_COUNT', 7)),
+    sample_rates=sample_rates)
+logging = flask_logger.get()
+
+# 退出前写完队列中的日志；fork 出的子进程需要重新启动日志线程
+atexit.register(flask_logger.stop)
+os.register_at_fork(after_in_child=flask_logger.restart_after_fork)
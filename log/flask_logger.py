@@ -1,29 +1,256 @@
+import json
 import logging
+import logging.handlers
 import os
+import queue
+import random
+
+try:
+    from eventlet import patcher
+    # 日志线程必须是真正的系统线程，否则写文件仍会阻塞 eventlet hub
+    _threading = patcher.original('threading')
+    _queue = patcher.original('queue')
+except ImportError:
+    _queue = queue
+    import threading as _threading
+
+# 原始 queue 模块的副本有自己的异常类
+_FULL = (queue.Full, _queue.Full)
+_EMPTY = (queue.Empty, _queue.Empty)
+
+
+def parse_level(name, default=logging.INFO):
+    """
+    Turn a level name such as "info" or "WARNING" into its logging level,
+    falling back to ``default`` for empty or unknown names.
+    """
+    level = getattr(logging, str(name or '').strip().upper(), None)
+    return level if isinstance(level, int) else default
+
+
+class JsonFormatter(logging.Formatter):
+    """
+    Formats each record as one JSON object per line.
+    """
+
+    def __init__(self, component_name):
+        super().__init__()
+        self.component_name = component_name
+
+    def format(self, record):
+        entry = {
+            'time': self.formatTime(record),
+            'level': record.levelname,
+            'logger': self.component_name,
+            'pid': record.process,
+            'func': record.funcName,
+            'line': record.lineno,
+            'message': record.getMessage(),
+        }
+        if record.exc_info:
+            entry['exc_info'] = self.formatException(record.exc_info)
+        return json.dumps(entry, ensure_ascii=False, default=str)
+
+
+class SamplingFilter(logging.Filter):
+    """
+    Keeps only a fraction of the records of each level, e.g.
+    ``{logging.DEBUG: 0.01}`` keeps about one debug record in a hundred.
+    Levels that are not listed are always kept.
+    """
+
+    def __init__(self, rates):
+        super().__init__()
+        self.rates = rates
+
+    def filter(self, record):
+        rate = self.rates.get(record.levelno, 1.0)
+        return rate >= 1.0 or random.random() < rate
+
+
+class DropQueueHandler(logging.handlers.QueueHandler):
+    """
+    QueueHandler over a bounded queue that never blocks the caller.
+
+    When the queue is full the record is dropped (``drop_policy='new'``) or
+    the oldest queued record is dropped to make room (``'oldest'``). The
+    number of dropped records is reported by the next record that fits.
+    """
+
+    def __init__(self, queue, drop_policy='new'):
+        super().__init__(queue)
+        if drop_policy not in ('new', 'oldest'):
+            raise ValueError(f"Unknown log drop policy: {drop_policy}")
+        self.drop_policy = drop_policy
+        self.dropped = 0
+        self._reported = 0
+
+    def enqueue(self, record):
+        if self.dropped > self._reported:
+            missed = self.dropped - self._reported
+            notice = logging.makeLogRecord({
+                'name': record.name,
+                'levelno': logging.WARNING,
+                'levelname': 'WARNING',
+                'msg': f'{missed} log records dropped, queue is full',
+            })
+            # 通知本身放不进队列时不计入丢弃数
+            if self._put(notice, drop_new=False):
+                self._reported += missed
+        self._put(record)
+
+    def _put(self, record, drop_new=True):
+        try:
+            self.queue.put_nowait(record)
+            return True
+        except _FULL:
+            pass
+        if not drop_new:
+            return False
+        if self.drop_policy == 'oldest':
+            try:
+                self.queue.get_nowait()
+                self.queue.put_nowait(record)
+                self.dropped += 1
+                return True
+            except _EMPTY + _FULL:
+                pass
+        self.dropped += 1
+        return False
+
+
+class _QueueListener(logging.handlers.QueueListener):
+
+    def start(self):
+        self._thread = _threading.Thread(target=self._monitor,
+                                         name='log-listener',
+                                         daemon=True)
+        self._thread.start()
+
 
 class Flask_Logger:
+    """
+    Configures the ``component_name`` logger.
+
+    In queue mode (the default) the logging call only formats the message
+    and puts the record on a bounded queue; a background thread writes it to
+    stdout and the log file, so slow disks no longer add request latency.
+
+    Constructing it again for the same component replaces the handlers added
+    by the previous instance instead of adding duplicates.
+    """
 
     def __init__(self,
                  component_name,
                  logging_level=logging.DEBUG,
-                 log_folder=''):
+                 log_folder='',
+                 use_queue=True,
+                 queue_size=10000,
+                 drop_policy='new',
+                 log_format='text',
+                 rotate=None,
+                 max_bytes=100 * 1024 * 1024,
+                 rotate_when='midnight',
+                 backup_count=7,
+                 sample_rates=None):
         self.log_folder = log_folder
         self.logger = logging.getLogger(f"{component_name}")
         self.logging_level = logging_level
+        self.use_queue = use_queue
+        self.queue_size = queue_size
+        self.drop_policy = drop_policy
+        self.log_format = log_format
+        self.rotate = rotate
+        self.max_bytes = max_bytes
+        self.rotate_when = rotate_when
+        self.backup_count = backup_count
+        self.sample_rates = sample_rates or {}
+        self.queue_handler = None
+        self.listener = None
         self.set_format(self.logging_level)
 
     def set_format(self, logging_level):
-        formatter = logging.Formatter(
-            f"[{self.logger.name}] %(asctime)s - %(levelname)s - [%(funcName)s] [%(lineno)d]: %(message)s"
-        )
+        self._remove_previous()
+        if self.log_format == 'json':
+            formatter = JsonFormatter(self.logger.name)
+        else:
+            formatter = logging.Formatter(
+                f"[{self.logger.name}] %(asctime)s - %(levelname)s - [%(funcName)s] [%(lineno)d]: %(message)s"
+            )
         handler = logging.StreamHandler()
-        log_file_name = os.path.join(self.log_folder, f"flask_app.log")
-        file_handler = logging.FileHandler(log_file_name)
+        file_handler = self._file_handler()
         handler.setFormatter(formatter)
         file_handler.setFormatter(formatter)
-        self.logger.addHandler(handler)
-        self.logger.addHandler(file_handler)
+
+        if self.use_queue:
+            self.queue_handler = DropQueueHandler(
+                _queue.Queue(self.queue_size), self.drop_policy)
+            self.listener = _QueueListener(self.queue_handler.queue, handler,
+                                           file_handler)
+            self.listener.start()
+            handlers = [self.queue_handler]
+        else:
+            handlers = [handler, file_handler]
+
+        for h in handlers:
+            if self.sample_rates:
+                h.addFilter(SamplingFilter(self.sample_rates))
+            h._flask_logger = self
+            self.logger.addHandler(h)
         self.logger.setLevel(logging_level)
 
+    def stop(self):
+        """
+        Write out the queued records and stop the background thread.
+        """
+        if self.listener is not None and self.listener._thread is not None:
+            self.listener.stop()
+
+    def restart_after_fork(self):
+        """
+        Threads do not survive fork, so a forked child needs its own queue
+        and listener thread.
+        """
+        if self.listener is None:
+            return
+        self.queue_handler.queue = _queue.Queue(self.queue_size)
+        self.listener = _QueueListener(self.queue_handler.queue,
+                                       *self.listener.handlers)
+        self.listener.start()
+
+    def stats(self):
+        return {
+            'queued':
+            self.queue_handler.queue.qsize() if self.queue_handler else 0,
+            'dropped': self.queue_handler.dropped if self.queue_handler else 0,
+        }
+
     def get(self):
         return self.logger
+
+    def _file_handler(self):
+        log_file_name = os.path.join(self.log_folder, f"flask_app.log")
+        if self.rotate == 'size':
+            return logging.handlers.RotatingFileHandler(
+                log_file_name,
+                maxBytes=self.max_bytes,
+                backupCount=self.backup_count)
+        if self.rotate == 'time':
+            return logging.handlers.TimedRotatingFileHandler(
+                log_file_name,
+                when=self.rotate_when,
+                backupCount=self.backup_count)
+        return logging.FileHandler(log_file_name)
+
+    def _remove_previous(self):
+        for h in list(self.logger.handlers):
+            previous = getattr(h, '_flask_logger', None)
+            if previous is None:
+                continue
+            self.logger.removeHandler(h)
+            if previous.listener is not None:
+                previous.stop()
+                for inner in previous.listener.handlers:
+                    inner.close()
+            else:
+                h.close()
@@ -0,0 +1,129 @@
+import json
+import logging
+import logging.handlers
+import os
+import queue
+import tempfile
+import unittest
+from log.flask_logger import DropQueueHandler, Flask_Logger, parse_level
+
+
+class FlaskLoggerTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.folder = tempfile.mkdtemp()
+        self.loggers = []
+
+    def tearDown(self):
+        for flask_logger in self.loggers:
+            flask_logger.stop()
+            for h in list(flask_logger.logger.handlers):
+                flask_logger.logger.removeHandler(h)
+                h.close()
+            if flask_logger.listener is not None:
+                for h in flask_logger.listener.handlers:
+                    h.close()
+        for name in os.listdir(self.folder):
+            os.remove(os.path.join(self.folder, name))
+        os.rmdir(self.folder)
+
+    def _logger(self, name, **kwargs):
+        flask_logger = Flask_Logger(name,
+                                    logging_level=logging.DEBUG,
+                                    log_folder=self.folder,
+                                    **kwargs)
+        self.loggers.append(flask_logger)
+        return flask_logger
+
+    def _lines(self):
+        with open(os.path.join(self.folder, 'flask_app.log')) as f:
+            return f.read().splitlines()
+
+    def test_parse_level_is_case_insensitive_with_fallback(self):
+        self.assertEqual(parse_level('info'), logging.INFO)
+        self.assertEqual(parse_level(' Debug '), logging.DEBUG)
+        self.assertEqual(parse_level('verbose'), logging.INFO)
+        self.assertEqual(parse_level('BASIC_FORMAT'), logging.INFO)
+        self.assertEqual(parse_level(None), logging.INFO)
+
+    def test_constructing_twice_does_not_duplicate_handlers(self):
+        self._logger('test_duplicate')
+        flask_logger = self._logger('test_duplicate')
+
+        self.assertEqual(len(flask_logger.logger.handlers), 1)
+
+    def test_queue_mode_writes_json_lines(self):
+        flask_logger = self._logger('test_json', log_format='json')
+
+        flask_logger.get().info('user %s logged in', 'alice')
+        flask_logger.stop()
+
+        entry = json.loads(self._lines()[0])
+        self.assertEqual(entry['level'], 'INFO')
+        self.assertEqual(entry['message'], 'user alice logged in')
+        self.assertEqual(entry['func'], 'test_queue_mode_writes_json_lines')
+
+    def test_sampling_drops_records_of_sampled_levels(self):
+        flask_logger = self._logger('test_sampling',
+                                    use_queue=False,
+                                    sample_rates={logging.DEBUG: 0.0})
+
+        flask_logger.get().debug('noisy')
+        flask_logger.get().info('kept')
+
+        lines = self._lines()
+        self.assertEqual(len(lines), 1)
+        self.assertIn('kept', lines[0])
+
+    def test_size_rotation(self):
+        flask_logger = self._logger('test_rotation',
+                                    use_queue=False,
+                                    rotate='size',
+                                    max_bytes=200,
+                                    backup_count=2)
+
+        for i in range(20):
+            flask_logger.get().info(f'message {i}')
+
+        self.assertIn('flask_app.log.1', os.listdir(self.folder))
+
+
+class DropQueueHandlerTestCase(unittest.TestCase):
+
+    def _record(self, message):
+        return logging.makeLogRecord({'msg': message,
+                                      'levelno': logging.INFO})
+
+    def test_drop_new_keeps_queued_records(self):
+        handler = DropQueueHandler(queue.Queue(1), drop_policy='new')
+
+        for message in ('a', 'b', 'c'):
+            handler.emit(self._record(message))
+
+        self.assertEqual(handler.dropped, 2)
+        self.assertEqual(handler.queue.get_nowait().msg, 'a')
+
+    def test_drop_oldest_keeps_latest_record(self):
+        handler = DropQueueHandler(queue.Queue(1), drop_policy='oldest')
+
+        for message in ('a', 'b', 'c'):
+            handler.emit(self._record(message))
+
+        self.assertEqual(handler.dropped, 2)
+        self.assertEqual(handler.queue.get_nowait().msg, 'c')
+
+    def test_dropped_records_are_reported(self):
+        handler = DropQueueHandler(queue.Queue(1), drop_policy='new')
+        handler.emit(self._record('a'))
+        handler.emit(self._record('b'))
+        handler.queue.get_nowait()
+
+        handler.emit(self._record('c'))
+
+        notice = handler.queue.get_nowait()
+        self.assertEqual(notice.levelno, logging.WARNING)
+        self.assertIn('1 log records dropped', notice.msg)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,47 @@
+from metrics.registry import Registry, MultiProcessCollector, render
+
+registry = Registry()
+
+# 请求
+request_latency = registry.histogram(
+    'http_request_duration_seconds', 'Request latency by endpoint.',
+    ['method', 'endpoint'])
+requests_total = registry.counter('http_requests_total',
+                                  'Responses by endpoint and status code.',
+                                  ['method', 'endpoint', 'status'])
+request_db_queries = registry.histogram(
+    'http_request_db_queries', 'Database queries executed per request.',
+    ['endpoint'],
+    buckets=(0, 1, 2, 3, 5, 10, 20, 50, 100))
+request_db_seconds = registry.histogram(
+    'http_request_db_seconds', 'Seconds spent in the database per request.',
+    ['endpoint'])
+
+# 认证
+token_verifications = registry.counter(
+    'auth_token_verifications_total',
+    'Access-token checks by outcome (cache_hit, cache_miss, stateless, '
+    'failure).', ['result'])
+login_attempts = registry.counter('auth_login_attempts_total',
+                                  'Login attempts by outcome.', ['result'])
+login_throttled = registry.counter(
+    'auth_login_throttled_total',
+    'Login attempts refused by the rate limit, by scope (user, ip).',
+    ['scope'])
+
+# 准入控制
+admission_queue_seconds = registry.histogram(
+    'admission_queue_seconds',
+    'Seconds requests waited for a concurrency slot, by request class.',
+    ['class'],
+    buckets=(0.001, 0.005, 0.01, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5))
+admission_rejections = registry.counter(
+    'admission_rejections_total',
+    'Requests shed with 503, by request class and reason (queue_full, '
+    'timeout).', ['class', 'reason'])
+
+# 数据库
+replica_ejections = registry.counter(
+    'db_replica_ejections_total',
+    'Times a read replica was taken out of rotation after an error.',
+    ['replica'])
@@ -0,0 +1,165 @@
+import threading
+import time
+from flask import g, request
+
+from auth.password_hasher import password_hasher
+from database.pool import pool_stats
+from database.session import request_stats
+from metrics import (registry, MultiProcessCollector, render, request_latency,
+                     requests_total, request_db_queries, request_db_seconds)
+from metrics.registry import MetricFamily
+
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+
+def init_metrics(app, db):
+    """
+    Record request metrics and serve them at ``METRICS_PATH``.
+
+    Must be called before the other ``before_request`` hooks are registered,
+    so the latency also covers token validation. When ``METRICS_DIR`` is set,
+    every worker process writes its metrics there and a scrape of any worker
+    returns the sum over all of them.
+    """
+    if not app.config.get('METRICS_ENABLED', True):
+        return None
+
+    with app.app_context():
+        engines = dict(db.engines)
+
+    collectors = [
+        lambda: _pool_families(engines),
+        _password_hasher_families,
+        lambda: _token_cache_families(app.config['AUTH_SERVICE']),
+        lambda: _admission_families(app.extensions.get('admission')),
+    ]
+
+    def collect_local():
+        return registry.collect(collectors)
+
+    collect = collect_local
+    metrics_dir = app.config.get('METRICS_DIR')
+    if metrics_dir:
+        multiprocess = MultiProcessCollector(collect_local, metrics_dir)
+        collect = multiprocess.collect
+        _start_flusher(multiprocess, app.config.get('METRICS_FLUSH_INTERVAL',
+                                                    5))
+
+    @app.before_request
+    def start_timer():
+        g.request_start = time.perf_counter()
+
+    @app.after_request
+    def record_request(response):
+        start = g.pop('request_start', None)
+        if start is None:
+            return response
+        endpoint = request.endpoint or 'unmatched'
+        request_latency.observe(time.perf_counter() - start,
+                                method=request.method,
+                                endpoint=endpoint)
+        requests_total.inc(method=request.method,
+                           endpoint=endpoint,
+                           status=response.status_code)
+        stats = request_stats()
+        request_db_queries.observe(stats['queries'], endpoint=endpoint)
+        request_db_seconds.observe(stats['db_time'], endpoint=endpoint)
+        return response
+
+    def metrics_view():
+        return app.response_class(render(collect()), mimetype=CONTENT_TYPE)
+
+    app.add_url_rule(app.config.get('METRICS_PATH', '/metrics'), 'metrics',
+                     metrics_view)
+    return collect
+
+
+def _start_flusher(multiprocess, interval):
+    # 定期写入本进程快照，其他进程被抓取时才能看到本进程的数据
+    def flush():
+        while True:
+            time.sleep(interval)
+            try:
+                multiprocess.write_snapshot()
+            except OSError:
+                pass
+
+    threading.Thread(target=flush, name='metrics-flusher', daemon=True).start()
+
+
+def _family(name, metric_type, documentation, samples):
+    return MetricFamily(name, metric_type, documentation,
+                        [(name, labels, value) for labels, value in samples])
+
+
+def _pool_families(engines):
+    stats = {bind or 'default': pool_stats(engine)
+             for bind, engine in engines.items()}
+    families = []
+    for key, metric_type, name, documentation in (
+        ('size', 'gauge', 'db_pool_size', 'Configured pool size.'),
+        ('in_use', 'gauge', 'db_pool_in_use', 'Connections checked out.'),
+        ('checked_in', 'gauge', 'db_pool_checked_in', 'Idle connections.'),
+        ('overflow', 'gauge', 'db_pool_overflow', 'Overflow connections.'),
+        ('checkouts', 'counter', 'db_pool_checkouts_total',
+         'Connection checkouts.'),
+        ('checkout_timeouts', 'counter', 'db_pool_checkout_timeouts_total',
+         'Checkouts that timed out waiting for a connection.'),
+        ('checkout_wait_total', 'counter',
+         'db_pool_checkout_wait_seconds_total',
+         'Seconds spent waiting for a connection.'),
+    ):
+        samples = [({'bind': bind}, values[key])
+                   for bind, values in stats.items() if key in values]
+        if samples:
+            families.append(_family(name, metric_type, documentation,
+                                    samples))
+    return families
+
+
+def _password_hasher_families():
+    stats = password_hasher.stats()
+    return [
+        _family('password_hash_in_flight', 'gauge',
+                'Password hashes running or queued.',
+                [({}, stats['in_flight'])]),
+        _family('password_hash_queue_depth', 'gauge',
+                'Password hashes waiting for a worker thread.',
+                [({}, stats['queue_depth'])]),
+        _family('password_hash_calls_total', 'counter',
+                'Password hashes computed.', [({}, stats['calls'])]),
+        _family('password_hash_seconds_total', 'counter',
+                'Seconds spent hashing passwords, including queueing.',
+                [({}, stats['hash_seconds_total'])]),
+    ]
+
+
+def _token_cache_families(auth_service):
+    stats = auth_service.token_cache.stats()
+    return [
+        _family('token_cache_size', 'gauge', 'Access tokens in the cache.',
+                [({}, stats['size'])]),
+        _family('token_cache_hits_total', 'counter', 'Token cache hits.',
+                [({}, stats['hits'])]),
+        _family('token_cache_misses_total', 'counter', 'Token cache misses.',
+                [({}, stats['misses'])]),
+        _family('token_cache_evictions_total', 'counter',
+                'Token cache evictions.', [({}, stats['evictions'])]),
+    ]
+
+
+def _admission_families(admission):
+    if admission is None:
+        return []
+    stats = admission.stats()
+    return [
+        _family(name, 'gauge', documentation,
+                [({'class': budget}, values[key])
+                 for budget, values in stats.items()])
+        for key, name, documentation in (
+            ('limit', 'admission_limit', 'Concurrent requests allowed.'),
+            ('in_flight', 'admission_in_flight', 'Requests running.'),
+            ('waiting', 'admission_waiting',
+             'Requests waiting for a concurrency slot.'),
+        )
+    ]
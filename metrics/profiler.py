@@ -0,0 +1,221 @@
+import cProfile
+import hmac
+import json
+import os
+import pstats
+import random
+import threading
+import time
+from flask import g, request
+
+from database.session import request_stats
+from log import logging
+
+# 累计耗时按这些函数统计
+HASH_FUNCTIONS = {'_run'}
+HASH_FILES = ('password_hasher.py', )
+SERIALIZATION_FUNCTIONS = {'jsonify', 'to_dict'}
+
+
+class RequestProfiler:
+    """
+    Profiles selected requests with cProfile.
+
+    A request is profiled when it matches one of the ``endpoints``, is picked
+    by the ``sample_rate`` lottery, or carries ``header`` set to
+    ``header_secret``. The header is only honoured after authentication (see
+    ``start_on_header``), so anonymous clients cannot force profiles and fill
+    the disk. Each profile
+    is written to ``folder`` as ``<time>-<endpoint>-<pid>.prof`` (pstats) or
+    ``.collapsed`` (flamegraph.pl input), next to a ``.json`` summary with
+    the wall, database, password hashing and serialization times.
+
+    cProfile sees every greenlet running in the thread, so only one request
+    per process is profiled at a time.
+    """
+
+    def __init__(self,
+                 folder,
+                 sample_rate=0.0,
+                 header=None,
+                 header_secret=None,
+                 endpoints=(),
+                 output_format='pstats'):
+        if output_format not in ('pstats', 'collapsed'):
+            raise ValueError(f"Unknown profile format: {output_format}")
+        self.folder = folder
+        self.sample_rate = sample_rate
+        self.header = header
+        self.header_secret = header_secret
+        self.endpoints = set(endpoints)
+        self.output_format = output_format
+        self._lock = threading.Lock()
+        os.makedirs(folder, exist_ok=True)
+
+    def should_profile(self):
+        if request.endpoint in self.endpoints:
+            return True
+        return self.sample_rate > 0 and random.random() < self.sample_rate
+
+    def header_requested(self):
+        if not self.header or not self.header_secret:
+            return False
+        value = request.headers.get(self.header, '')
+        return hmac.compare_digest(value.encode('utf-8'),
+                                   self.header_secret.encode('utf-8'))
+
+    def start(self):
+        if self.should_profile():
+            self._start()
+
+    def start_on_header(self):
+        """
+        Hook for requests that ask for a profile with the header; register
+        it after the token check so only authenticated requests get one.
+        """
+        if 'profile' not in g and self.header_requested():
+            self._start()
+
+    def _start(self):
+        if not self._lock.acquire(blocking=False):
+            return
+        profile = cProfile.Profile()
+        g.profile = (profile, time.perf_counter())
+        profile.enable()
+
+    def stop(self, response):
+        started = g.pop('profile', None)
+        if started is None:
+            return response
+        profile, start = started
+        profile.disable()
+        wall_time = time.perf_counter() - start
+        self._lock.release()
+        try:
+            self.write(profile, wall_time, response.status_code)
+        except Exception as e:
+            logging.error(f'write profile error: {e}')
+        return response
+
+    def teardown(self, exc):
+        # after_request 没有执行时（例如其中抛出异常）也要释放锁
+        started = g.pop('profile', None)
+        if started is not None:
+            started[0].disable()
+            self._lock.release()
+
+    def write(self, profile, wall_time, status_code):
+        stats = pstats.Stats(profile)
+        endpoint = (request.endpoint or 'unmatched').replace('.', '_')
+        base = os.path.join(
+            self.folder, f'{time.strftime("%Y%m%d-%H%M%S")}-'
+            f'{int(time.time() * 1000) % 1000:03d}-{endpoint}-{os.getpid()}')
+        if self.output_format == 'pstats':
+            stats.dump_stats(f'{base}.prof')
+        else:
+            with open(f'{base}.collapsed', 'w') as f:
+                for stack, value in collapsed_stacks(stats):
+                    f.write(f'{stack} {value}\n')
+
+        db_stats = request_stats()
+        summary = {
+            'method': request.method,
+            'path': request.path,
+            'endpoint': request.endpoint,
+            'status': status_code,
+            'wall_time': wall_time,
+            'db_time': db_stats['db_time'],
+            'db_queries': db_stats['queries'],
+            'hash_time': _cumulative_time(stats, HASH_FUNCTIONS, HASH_FILES),
+            'serialization_time': _cumulative_time(stats,
+                                                   SERIALIZATION_FUNCTIONS),
+        }
+        with open(f'{base}.json', 'w') as f:
+            json.dump(summary, f, indent=2)
+
+
+def _cumulative_time(stats, names, files=None):
+    """
+    Sum the cumulative time of the outermost calls to the named functions.
+    """
+    matches = {
+        func
+        for func in stats.stats
+        if func[2] in names and (files is None or func[0].endswith(files))
+    }
+    total = 0.0
+    for func in matches:
+        _, _, _, cumtime, callers = stats.stats[func]
+        # 被同组函数调用的部分已经算在外层调用里
+        nested = sum(edge[3] for caller, edge in callers.items()
+                     if caller in matches)
+        total += cumtime - nested
+    return total
+
+
+def collapsed_stacks(stats, max_depth=64):
+    """
+    Approximate collapsed stacks (``a;b;c <microseconds>``) from the pstats
+    call graph: the time of each function is split between its callees in
+    proportion to the caller/callee edges, as flamegraph tools for cProfile
+    do.
+    """
+    children = {}
+    for func, (_, _, _, _, callers) in stats.stats.items():
+        for caller, edge in callers.items():
+            children.setdefault(caller, []).append((func, edge[3]))
+
+    roots = [func for func, entry in stats.stats.items() if not entry[4]]
+    totals = {}
+
+    def walk(func, path, inclusive):
+        if inclusive < 1e-6:
+            return
+        _, _, tottime, cumtime, _ = stats.stats[func]
+        path = path + [_label(func)]
+        share = inclusive / cumtime if cumtime else 0.0
+        own = tottime * share
+        if own > 0:
+            key = ';'.join(path)
+            totals[key] = totals.get(key, 0.0) + own
+        if len(path) >= max_depth:
+            return
+        for child, edge_time in children.get(func, ()):
+            if _label(child) in path:
+                continue
+            walk(child, path, edge_time * share)
+
+    for root in roots:
+        walk(root, [], stats.stats[root][3])
+
+    return [(stack, int(value * 1e6)) for stack, value in totals.items()
+            if int(value * 1e6) > 0]
+
+
+def _label(func):
+    filename, line, name = func
+    if filename == '~':
+        return name
+    return f'{os.path.basename(filename)}:{name}:{line}'
+
+
+def init_profiler(app):
+    """
+    Register the request profiler if ``PROFILE_ENABLED`` is set. When it is
+    not, no hook is registered and requests pay nothing. The header trigger
+    is not registered here: the caller adds ``profiler.start_on_header``
+    after its authentication hook.
+    """
+    if not app.config.get('PROFILE_ENABLED'):
+        return None
+    profiler = RequestProfiler(
+        app.config['PROFILE_FOLDER'],
+        sample_rate=app.config.get('PROFILE_SAMPLE_RATE', 0.0),
+        header=app.config.get('PROFILE_HEADER'),
+        header_secret=app.config.get('PROFILE_SECRET'),
+        endpoints=app.config.get('PROFILE_ENDPOINTS', ()),
+        output_format=app.config.get('PROFILE_FORMAT', 'pstats'))
+    app.before_request(profiler.start)
+    app.after_request(profiler.stop)
+    app.teardown_request(profiler.teardown)
+    return profiler
@@ -0,0 +1,265 @@
+import json
+import math
+import os
+import threading
+from collections import namedtuple
+
+MetricFamily = namedtuple('MetricFamily', ['name', 'type', 'help', 'samples'])
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.075, 0.1, 0.25, 0.5, 0.75, 1.0,
+                   2.5, 5.0, 7.5, 10.0)
+
+
+class _Metric:
+    type = None
+
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+
+    def _key(self, labels):
+        if set(labels) != set(self.labelnames):
+            raise ValueError(f'{self.name} expects labels {self.labelnames}, '
+                             f'got {tuple(labels)}')
+        return tuple(str(labels[name]) for name in self.labelnames)
+
+    def _labels(self, key):
+        return dict(zip(self.labelnames, key))
+
+
+class Counter(_Metric):
+    type = 'counter'
+
+    def __init__(self, name, documentation, labelnames=()):
+        super().__init__(name, documentation, labelnames)
+        self._values = {}
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def value(self, **labels):
+        return self._values.get(self._key(labels), 0)
+
+    def collect(self):
+        samples = [(self.name, self._labels(key), value)
+                   for key, value in list(self._values.items())]
+        return MetricFamily(self.name, self.type, self.documentation, samples)
+
+
+class Gauge(Counter):
+    type = 'gauge'
+
+    def set(self, value, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = value
+
+    def dec(self, amount=1, **labels):
+        self.inc(-amount, **labels)
+
+
+class Histogram(_Metric):
+    type = 'histogram'
+
+    def __init__(self,
+                 name,
+                 documentation,
+                 labelnames=(),
+                 buckets=DEFAULT_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets)) + (math.inf, )
+        self._values = {}    # key -> [bucket counts..., sum, count]
+
+    def observe(self, value, **labels):
+        key = self._key(labels)
+        with self._lock:
+            values = self._values.get(key)
+            if values is None:
+                values = self._values[key] = [0] * (len(self.buckets) + 2)
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    values[i] += 1
+                    break
+            values[-2] += value
+            values[-1] += 1
+
+    def collect(self):
+        samples = []
+        for key, values in list(self._values.items()):
+            labels = self._labels(key)
+            cumulative = 0
+            for bound, count in zip(self.buckets, values):
+                cumulative += count
+                samples.append((f'{self.name}_bucket',
+                                dict(labels, le=_format_value(bound)),
+                                cumulative))
+            samples.append((f'{self.name}_sum', labels, values[-2]))
+            samples.append((f'{self.name}_count', labels, values[-1]))
+        return MetricFamily(self.name, self.type, self.documentation, samples)
+
+
+class Registry:
+    """
+    Process-local metric registry.
+
+    Metrics are created through ``counter``/``gauge``/``histogram``. Values
+    that already live elsewhere (pool state, cache counters) are read at
+    collection time by the collectors passed to ``collect``.
+    """
+
+    def __init__(self):
+        self._metrics = []
+
+    def counter(self, name, documentation, labelnames=()):
+        return self._register(Counter(name, documentation, labelnames))
+
+    def gauge(self, name, documentation, labelnames=()):
+        return self._register(Gauge(name, documentation, labelnames))
+
+    def histogram(self,
+                  name,
+                  documentation,
+                  labelnames=(),
+                  buckets=DEFAULT_BUCKETS):
+        return self._register(
+            Histogram(name, documentation, labelnames, buckets))
+
+    def _register(self, metric):
+        self._metrics.append(metric)
+        return metric
+
+    def collect(self, collectors=()):
+        families = [metric.collect() for metric in self._metrics]
+        for collector in collectors:
+            families.extend(collector())
+        return families
+
+
+def render(families):
+    """
+    Render metric families in the Prometheus text exposition format.
+    """
+    lines = []
+    for family in families:
+        lines.append(f'# HELP {family.name} {family.help}')
+        lines.append(f'# TYPE {family.name} {family.type}')
+        for name, labels, value in family.samples:
+            lines.append(f'{name}{_format_labels(labels)} '
+                         f'{_format_value(value)}')
+    return '\n'.join(lines) + '\n'
+
+
+def _format_labels(labels):
+    if not labels:
+        return ''
+    pairs = ','.join(f'{key}="{_escape(value)}"'
+                     for key, value in sorted(labels.items()))
+    return '{' + pairs + '}'
+
+
+def _escape(value):
+    return str(value).replace('\\', r'\\').replace('\n', r'\n').replace(
+        '"', r'\"')
+
+
+def _format_value(value):
+    if value == math.inf:
+        return '+Inf'
+    if isinstance(value, float) and value.is_integer():
+        return str(int(value)) if abs(value) < 1e15 else repr(value)
+    return str(value)
+
+
+class MultiProcessCollector:
+    """
+    Shares metrics between worker processes through files in ``path``.
+
+    ``collect_local`` returns the families of the current process. Every
+    process periodically writes its own snapshot to ``<pid>.json``;
+    a scrape merges all snapshots. Counters and histograms are summed over
+    every file, so values from exited workers are kept; gauges are only
+    summed over processes that are still alive.
+    """
+
+    def __init__(self, collect_local, path):
+        self.collect_local = collect_local
+        self.path = path
+        os.makedirs(path, exist_ok=True)
+
+    def write_snapshot(self):
+        snapshot = {
+            'pid': os.getpid(),
+            'families': [family._asdict() for family in self.collect_local()]
+        }
+        target = os.path.join(self.path, f'{os.getpid()}.json')
+        tmp = f'{target}.tmp'
+        with open(tmp, 'w') as f:
+            json.dump(snapshot, f, default=_json_default)
+        os.replace(tmp, target)
+
+    def collect(self):
+        self.write_snapshot()
+        merged = {}
+        order = []
+        for filename in sorted(os.listdir(self.path)):
+            if not filename.endswith('.json'):
+                continue
+            try:
+                with open(os.path.join(self.path, filename)) as f:
+                    snapshot = json.load(f)
+            except (OSError, ValueError):
+                continue
+            alive = _pid_alive(snapshot['pid'])
+            for family in snapshot['families']:
+                if family['type'] == 'gauge' and not alive:
+                    continue
+                if family['name'] not in merged:
+                    merged[family['name']] = (family, {})
+                    order.append(family['name'])
+                samples = merged[family['name']][1]
+                for name, labels, value in family['samples']:
+                    key = (name, tuple(sorted(labels.items())))
+                    samples[key] = samples.get(key, 0) + _json_value(value)
+
+        return [
+            MetricFamily(name, merged[name][0]['type'],
+                         merged[name][0]['help'],
+                         [(sample, dict(labels), value)
+                          for (sample, labels), value in merged[name][1].items()])
+            for name in order
+        ]
+
+    @staticmethod
+    def reset(path):
+        """
+        Remove snapshots left by a previous run of the service.
+        """
+        if not os.path.isdir(path):
+            return
+        for filename in os.listdir(path):
+            if filename.endswith('.json'):
+                os.remove(os.path.join(path, filename))
+
+
+def _pid_alive(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+def _json_default(value):
+    if value == math.inf:
+        return '+Inf'
+    raise TypeError(f'{value!r} is not JSON serializable')
+
+
+def _json_value(value):
+    return math.inf if value == '+Inf' else value
@@ -0,0 +1,239 @@
+import json
+import os
+import tempfile
+import unittest
+from flask import Flask, jsonify
+from auth.auth_service import AuthService
+from config import TestingConfig
+from database import setup_db
+from database.models import db, User
+from metrics import requests_total
+from metrics.flask_metrics import init_metrics
+from metrics.profiler import init_profiler
+from metrics.registry import MultiProcessCollector, Registry, render
+
+
+class RegistryTestCase(unittest.TestCase):
+
+    def test_render_counter_and_histogram(self):
+        registry = Registry()
+        counter = registry.counter('jobs_total', 'Jobs.', ['result'])
+        histogram = registry.histogram('job_seconds',
+                                       'Job time.',
+                                       buckets=(0.1, 1))
+        counter.inc(result='ok')
+        counter.inc(2, result='ok')
+        histogram.observe(0.05)
+        histogram.observe(0.5)
+        histogram.observe(5)
+
+        text = render(registry.collect())
+
+        self.assertIn('# TYPE jobs_total counter', text)
+        self.assertIn('jobs_total{result="ok"} 3', text)
+        self.assertIn('job_seconds_bucket{le="0.1"} 1', text)
+        self.assertIn('job_seconds_bucket{le="1"} 2', text)
+        self.assertIn('job_seconds_bucket{le="+Inf"} 3', text)
+        self.assertIn('job_seconds_count 3', text)
+
+    def test_wrong_labels_are_rejected(self):
+        counter = Registry().counter('jobs_total', 'Jobs.', ['result'])
+
+        with self.assertRaises(ValueError):
+            counter.inc(status='ok')
+
+
+class MultiProcessCollectorTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.path = tempfile.mkdtemp()
+        registry = Registry()
+        self.counter = registry.counter('jobs_total', 'Jobs.')
+        self.gauge = registry.gauge('jobs_running', 'Running jobs.')
+        self.collector = MultiProcessCollector(registry.collect, self.path)
+
+    def tearDown(self):
+        MultiProcessCollector.reset(self.path)
+        os.rmdir(self.path)
+
+    def _write_worker(self, pid, jobs, running):
+        snapshot = {
+            'pid': pid,
+            'families': [{
+                'name': 'jobs_total',
+                'type': 'counter',
+                'help': 'Jobs.',
+                'samples': [['jobs_total', {}, jobs]]
+            }, {
+                'name': 'jobs_running',
+                'type': 'gauge',
+                'help': 'Running jobs.',
+                'samples': [['jobs_running', {}, running]]
+            }]
+        }
+        with open(os.path.join(self.path, f'{pid}.json'), 'w') as f:
+            json.dump(snapshot, f)
+
+    def test_snapshots_are_summed(self):
+        self.counter.inc(2)
+        self.gauge.set(1)
+        # 父进程仍存活，模拟另一个工作进程
+        self._write_worker(os.getppid(), jobs=3, running=4)
+
+        text = render(self.collector.collect())
+
+        self.assertIn('jobs_total 5', text)
+        self.assertIn('jobs_running 5', text)
+
+    def test_gauges_of_exited_workers_are_dropped(self):
+        self.counter.inc(2)
+        self.gauge.set(1)
+        self._write_worker(2**22 + 1, jobs=3, running=4)
+
+        text = render(self.collector.collect())
+
+        self.assertIn('jobs_total 5', text)
+        self.assertIn('jobs_running 1', text)
+
+
+class MetricsEndpointTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.app = Flask(__name__)
+        self.app.config.from_object(TestingConfig)
+        self.app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite://'
+        self.app.config['AUTH_SERVICE'] = AuthService(
+            self.app.config['AUTH_CONFIG'])
+        setup_db(self.app)
+
+        @self.app.route('/count')
+        def count():
+            return {'count': User.query.count()}
+
+        init_metrics(self.app, db)
+        self.client = self.app.test_client()
+
+    def tearDown(self):
+        with self.app.app_context():
+            db.drop_all()
+
+    def test_requests_are_recorded(self):
+        before = requests_total.value(method='GET',
+                                      endpoint='count',
+                                      status='200')
+
+        self.client.get('/count')
+        response = self.client.get('/metrics')
+
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.content_type.startswith('text/plain'))
+        self.assertEqual(
+            requests_total.value(method='GET', endpoint='count',
+                                 status='200'), before + 1)
+        text = response.get_data(as_text=True)
+        self.assertIn('http_request_duration_seconds_bucket{endpoint="count"',
+                      text)
+        self.assertIn('http_request_db_queries_bucket{endpoint="count"', text)
+        self.assertIn('token_cache_size', text)
+        self.assertIn('password_hash_calls_total', text)
+
+
+class ProfilerTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.folder = tempfile.mkdtemp()
+        self.app = Flask(__name__)
+        self.app.config.from_object(TestingConfig)
+        self.app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite://'
+        self.app.config.update(PROFILE_ENABLED=True,
+                               PROFILE_FOLDER=self.folder,
+                               PROFILE_ENDPOINTS=['count'])
+        setup_db(self.app)
+
+        @self.app.route('/count')
+        def count():
+            return jsonify({'count': User.query.count()})
+
+        @self.app.route('/ping')
+        def ping():
+            return 'pong'
+
+        self.client = self.app.test_client()
+
+    def tearDown(self):
+        with self.app.app_context():
+            db.drop_all()
+        for name in os.listdir(self.folder):
+            os.remove(os.path.join(self.folder, name))
+        os.rmdir(self.folder)
+
+    def _profiles(self, suffix):
+        return [
+            os.path.join(self.folder, name)
+            for name in sorted(os.listdir(self.folder))
+            if name.endswith(suffix)
+        ]
+
+    def test_disabled_profiler_registers_no_hooks(self):
+        app = Flask(__name__)
+
+        self.assertIsNone(init_profiler(app))
+        self.assertEqual(app.before_request_funcs, {})
+
+    def test_matching_endpoint_is_profiled(self):
+        init_profiler(self.app)
+
+        self.client.get('/count')
+        self.client.get('/ping')
+
+        self.assertEqual(len(self._profiles('.prof')), 1)
+        with open(self._profiles('.json')[0]) as f:
+            summary = json.load(f)
+        self.assertEqual(summary['endpoint'], 'count')
+        self.assertEqual(summary['db_queries'], 1)
+        self.assertGreater(summary['serialization_time'], 0)
+
+    def test_header_selects_request_and_collapsed_format(self):
+        self.app.config.update(PROFILE_FORMAT='collapsed',
+                               PROFILE_HEADER='X-Profile',
+                               PROFILE_SECRET='s3cret')
+        profiler = init_profiler(self.app)
+        self.app.before_request(profiler.start_on_header)
+
+        self.client.get('/ping', headers={'X-Profile': 'guess'})
+        self.assertEqual(self._profiles('.collapsed'), [])
+
+        self.client.get('/ping', headers={'X-Profile': 's3cret'})
+
+        with open(self._profiles('.collapsed')[0]) as f:
+            lines = f.read().splitlines()
+        self.assertTrue(lines)
+        stack, value = lines[0].rsplit(' ', 1)
+        self.assertGreater(int(value), 0)
+
+    def test_header_is_ignored_for_rejected_requests(self):
+        self.app.config.update(PROFILE_HEADER='X-Profile',
+                               PROFILE_SECRET='s3cret')
+        profiler = init_profiler(self.app)
+        # 模拟令牌校验：拒绝的请求不会走到按请求头触发的采样
+        self.app.before_request(lambda: ('unauthorized', 401))
+        self.app.before_request(profiler.start_on_header)
+
+        response = self.client.get('/ping', headers={'X-Profile': 's3cret'})
+
+        self.assertEqual(response.status_code, 401)
+        self.assertEqual(os.listdir(self.folder), [])
+
+    def test_header_without_secret_is_disabled(self):
+        self.app.config['PROFILE_HEADER'] = 'X-Profile'
+        profiler = init_profiler(self.app)
+        self.app.before_request(profiler.start_on_header)
+
+        self.client.get('/ping', headers={'X-Profile': ''})
+        self.client.get('/ping', headers={'X-Profile': '1'})
+
+        self.assertEqual(os.listdir(self.folder), [])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,277 @@
+import os
+import signal
+
+import eventlet
+from eventlet import patcher, wsgi
+
+from log import flask_logger, logging
+
+# 主进程不能启动 eventlet hub，否则 fork 出的子进程会共享同一个 epoll 实例
+_time = patcher.original('time')
+_select = patcher.original('select')
+
+
+class _DrainingProtocol(wsgi.HttpProtocol):
+    """
+    Marks a connection busy while it handles a request. eventlet 0.33
+    leaves every connection "idle", so stopping ``wsgi.server`` would also
+    cut off the requests in flight instead of only the idle keep-alive
+    connections.
+    """
+
+    def _read_request_line(self):
+        line = super()._read_request_line()
+        if line and self.conn_state[2] == wsgi.STATE_IDLE:
+            self.conn_state[2] = wsgi.STATE_REQUEST
+        return line
+
+    def handle_one_request(self):
+        try:
+            super().handle_one_request()
+        finally:
+            if self.conn_state[2] == wsgi.STATE_REQUEST:
+                self.conn_state[2] = wsgi.STATE_IDLE
+
+
+class PreforkServer:
+    """
+    Pre-fork eventlet server.
+
+    The master process never builds the app; every worker calls
+    ``app_factory()`` after fork (so workers share no connection pools),
+    binds its own SO_REUSEPORT socket on ``address`` and lets the kernel
+    spread connections between them.
+
+    Signals handled by the master:
+    - SIGHUP: rolling reload, one worker at a time; the new worker must be
+      ready before the old one is stopped
+    - SIGTERM / SIGINT: graceful shutdown of all workers
+
+    The master keeps ``workers`` processes running: workers that die
+    unexpectedly, or that could not be started, are (re)spawned from the
+    main loop, waiting ``restart_delay`` seconds after a crash and backing
+    off exponentially (up to ``max_backoff``) while spawning keeps failing.
+    """
+
+    def __init__(self,
+                 app_factory,
+                 address,
+                 workers=2,
+                 backlog=1024,
+                 keepalive=True,
+                 max_green_threads=1024,
+                 graceful_timeout=30,
+                 ready_timeout=60,
+                 restart_delay=1,
+                 max_backoff=30):
+        self.app_factory = app_factory
+        self.address = address
+        self.num_workers = workers
+        self.backlog = backlog
+        self.keepalive = keepalive
+        self.max_green_threads = max_green_threads
+        self.graceful_timeout = graceful_timeout
+        self.ready_timeout = ready_timeout
+        self.restart_delay = restart_delay
+        self.max_backoff = max_backoff
+        self.workers = set()
+        # 重载时主动停止的进程，退出后不补充
+        self._retiring = set()
+        self._spawn_failures = 0
+        self._next_spawn_at = 0
+        self._pending_signals = []
+        self._stopping = False
+
+    def run(self):
+        for sig in (signal.SIGHUP, signal.SIGTERM, signal.SIGINT):
+            signal.signal(sig, self._queue_signal)
+
+        logging.info(f'prefork master {os.getpid()} starting '
+                     f'{self.num_workers} workers on {self.address}')
+        for _ in range(self.num_workers):
+            if self.spawn_worker() is None:
+                self.stop()
+                raise RuntimeError('prefork worker failed to start')
+
+        while self.workers or not self._stopping:
+            self._reap_workers()
+            while self._pending_signals:
+                sig = self._pending_signals.pop(0)
+                if sig == signal.SIGHUP and not self._stopping:
+                    self.reload()
+                elif sig in (signal.SIGTERM, signal.SIGINT):
+                    self.stop()
+            self._maintain_workers()
+            _time.sleep(0.2)
+
+        logging.info(f'prefork master {os.getpid()} exited')
+
+    def spawn_worker(self):
+        """
+        Fork a worker and wait until it has built the app and is listening.
+        Returns the worker pid, or None if it failed to become ready.
+        """
+        read_fd, write_fd = os.pipe()
+        pid = os.fork()
+        if pid == 0:
+            os.close(read_fd)
+            status = 0
+            try:
+                self._run_worker(write_fd)
+            except BaseException as e:
+                logging.error(f'prefork worker {os.getpid()} error: {e}')
+                status = 1
+            finally:
+                # os._exit 不会执行 atexit，先写完队列中的日志
+                flask_logger.stop()
+                os._exit(status)
+
+        os.close(write_fd)
+        self.workers.add(pid)
+        ready, _, _ = _select.select([read_fd], [], [], self.ready_timeout)
+        is_ready = bool(ready) and os.read(read_fd, 1) == b'1'
+        os.close(read_fd)
+        if not is_ready:
+            logging.error(f'prefork worker {pid} failed to start')
+            # 未就绪的进程可能仍在运行（如卡在初始化），直接杀掉并回收
+            self.workers.discard(pid)
+            self._kill(pid, signal.SIGKILL)
+            self._wait_exit(pid)
+            self._spawn_failed()
+            return None
+        self._spawn_failures = 0
+        logging.info(f'prefork worker {pid} ready')
+        return pid
+
+    def reload(self):
+        """
+        Replace every worker with a fresh one, one at a time. If a new worker
+        fails to start the reload stops there; the remaining old workers keep
+        serving and are still restarted if they die.
+        """
+        old_workers = list(self.workers - self._retiring)
+        logging.info(f'prefork reloading {len(old_workers)} workers')
+        for pid in old_workers:
+            if pid not in self.workers:
+                # 重载期间已退出，由 _maintain_workers 补充
+                continue
+            if self.spawn_worker() is None:
+                # 新进程起不来时保留旧进程，避免把服务全部停掉
+                logging.error('prefork reload aborted')
+                return
+            self._retiring.add(pid)
+            self._kill(pid, signal.SIGTERM)
+            self._wait_worker(pid)
+
+    def stop(self):
+        self._stopping = True
+        for pid in list(self.workers):
+            self._kill(pid, signal.SIGTERM)
+        deadline = _time.monotonic() + self.graceful_timeout
+        while self.workers and _time.monotonic() < deadline:
+            self._reap_workers()
+            _time.sleep(0.1)
+        for pid in list(self.workers):
+            self._kill(pid, signal.SIGKILL)
+        while self.workers:
+            self._reap_workers()
+            _time.sleep(0.1)
+
+    def _queue_signal(self, sig, frame):
+        self._pending_signals.append(sig)
+
+    def _kill(self, pid, sig):
+        try:
+            os.kill(pid, sig)
+        except ProcessLookupError:
+            pass
+
+    def _wait_exit(self, pid):
+        # 使用 WNOHANG 轮询：绿化后的 os.waitpid 会在主进程中启动 hub
+        while True:
+            try:
+                done, _ = os.waitpid(pid, os.WNOHANG)
+            except ChildProcessError:
+                return
+            if done:
+                return
+            _time.sleep(0.05)
+
+    def _wait_worker(self, pid):
+        deadline = _time.monotonic() + self.graceful_timeout + 5
+        while pid in self.workers and _time.monotonic() < deadline:
+            self._reap_workers()
+            _time.sleep(0.1)
+        if pid in self.workers:
+            # 超过排空时间仍未退出，强制结束，名额才能释放
+            self._kill(pid, signal.SIGKILL)
+
+    def _spawn_failed(self):
+        self._spawn_failures += 1
+        delay = min(self.max_backoff,
+                    self.restart_delay * 2**(self._spawn_failures - 1))
+        self._next_spawn_at = max(self._next_spawn_at,
+                                  _time.monotonic() + delay)
+
+    def _maintain_workers(self):
+        """
+        Spawn workers until the pool is back at ``num_workers``, respecting
+        the restart delay and the backoff after failed spawns.
+        """
+        while (not self._stopping and
+               len(self.workers - self._retiring) < self.num_workers and
+               _time.monotonic() >= self._next_spawn_at):
+            if self.spawn_worker() is None:
+                return
+
+    def _reap_workers(self):
+        while True:
+            try:
+                pid, status = os.waitpid(-1, os.WNOHANG)
+            except ChildProcessError:
+                return
+            if pid == 0:
+                return
+            if pid not in self.workers:
+                continue
+            self.workers.discard(pid)
+            logging.info(f'prefork worker {pid} exited with status {status}')
+            if pid in self._retiring:
+                self._retiring.discard(pid)
+            elif not self._stopping:
+                # 意外退出的进程稍后由 _maintain_workers 补充，避免崩溃循环
+                self._next_spawn_at = max(
+                    self._next_spawn_at,
+                    _time.monotonic() + self.restart_delay)
+
+    def _run_worker(self, ready_fd):
+        signal.signal(signal.SIGHUP, signal.SIG_IGN)
+        signal.signal(signal.SIGINT, signal.SIG_IGN)
+        stopping = []
+        signal.signal(signal.SIGTERM, lambda sig, frame: stopping.append(sig))
+
+        # 先创建应用再监听，避免内核把连接分给尚未就绪的进程
+        app = self.app_factory()
+        sock = eventlet.listen(self.address,
+                               backlog=self.backlog,
+                               reuse_port=True)
+        server = eventlet.spawn(wsgi.server,
+                                sock,
+                                app,
+                                max_size=self.max_green_threads,
+                                keepalive=self.keepalive,
+                                protocol=_DrainingProtocol)
+        os.write(ready_fd, b'1')
+        os.close(ready_fd)
+
+        while not stopping and not server.dead:
+            eventlet.sleep(0.5)
+
+        # 结束 accept 循环后立即关闭监听套接字，使其退出 SO_REUSEPORT 组，
+        # 内核不再把新连接分给本进程；wsgi.server 自己要等处理中的请求
+        # 全部完成后才关闭它
+        server.kill(SystemExit)
+        sock.close()
+        # 再等待处理中的请求完成
+        with eventlet.Timeout(self.graceful_timeout, False):
+            server.wait()
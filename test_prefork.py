@@ -0,0 +1,183 @@
+import os
+import signal
+import socket
+import subprocess
+import sys
+import tempfile
+import textwrap
+import time
+import unittest
+import urllib.request
+
+MASTER = textwrap.dedent('''
+    import os
+    import sys
+    from prefork import PreforkServer
+
+    failures_file, started_file = sys.argv[1], sys.argv[2]
+    port = int(sys.argv[3])
+
+
+    def app_factory():
+        # 文件中每有一行，就让一次启动失败
+        with open(failures_file) as f:
+            pending = f.read().splitlines()
+        if pending:
+            with open(failures_file, 'w') as f:
+                f.write('\\n'.join(pending[1:]))
+            raise RuntimeError('cannot reach the database')
+        with open(started_file, 'a') as f:
+            f.write(f'{os.getpid()}\\n')
+
+        def app(environ, start_response):
+            start_response('200 OK', [('Content-Type', 'text/plain')])
+            return [str(os.getpid()).encode()]
+
+        return app
+
+
+    PreforkServer(app_factory, ('127.0.0.1', port),
+                  workers=2,
+                  graceful_timeout=2,
+                  ready_timeout=5,
+                  restart_delay=0.2,
+                  max_backoff=0.5).run()
+''')
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+def children(pid):
+    """
+    Pids of the live (non-zombie) child processes of ``pid``.
+    """
+    pids = set()
+    for name in os.listdir('/proc'):
+        if not name.isdigit():
+            continue
+        try:
+            with open(f'/proc/{name}/stat') as f:
+                fields = f.read().rsplit(')', 1)[1].split()
+        except OSError:
+            continue
+        if int(fields[1]) == pid and fields[0] != 'Z':
+            pids.add(int(name))
+    return pids
+
+
+@unittest.skipUnless(sys.platform.startswith('linux'),
+                     'needs SO_REUSEPORT and /proc')
+class PreforkServerTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.folder = tempfile.mkdtemp()
+        self.failures = os.path.join(self.folder, 'failures')
+        self.started = os.path.join(self.folder, 'started')
+        script = os.path.join(self.folder, 'master.py')
+        with open(script, 'w') as f:
+            f.write(MASTER)
+        open(self.failures, 'w').close()
+        open(self.started, 'w').close()
+        self.port = free_port()
+        self.master = subprocess.Popen(
+            [sys.executable, script, self.failures, self.started,
+             str(self.port)],
+            cwd=self.folder,
+            env=dict(os.environ,
+                     PYTHONPATH=os.path.dirname(os.path.abspath(__file__)),
+                     LOG_FOLDER=self.folder,
+                     LOG_QUEUE='false'),
+            stdout=subprocess.DEVNULL,
+            stderr=subprocess.DEVNULL)
+        self.addCleanup(self._stop_master)
+        self.workers = self.wait_for(self.serving)
+
+    def _stop_master(self):
+        if self.master.poll() is None:
+            self.master.send_signal(signal.SIGTERM)
+            try:
+                self.master.wait(10)
+            except subprocess.TimeoutExpired:
+                self.master.kill()
+                self.master.wait()
+        for name in os.listdir(self.folder):
+            os.remove(os.path.join(self.folder, name))
+        os.rmdir(self.folder)
+
+    def wait_for(self, condition, timeout=15):
+        deadline = time.monotonic() + timeout
+        while time.monotonic() < deadline:
+            result = condition()
+            if result:
+                return result
+            time.sleep(0.1)
+        self.fail('condition not reached in time')
+
+    def serving(self):
+        """
+        The live workers that built the app, once there are exactly two.
+        Workers that are still failing to start are not counted.
+        """
+        with open(self.started) as f:
+            started = {int(pid) for pid in f.read().split()}
+        workers = children(self.master.pid) & started
+        return workers if len(workers) == 2 else None
+
+    def replaced(self, pid):
+        workers = self.serving()
+        if workers and pid not in workers:
+            return workers
+        return None
+
+    def get(self):
+        url = f'http://127.0.0.1:{self.port}/'
+        with urllib.request.urlopen(url, timeout=5) as response:
+            return int(response.read())
+
+    def test_crashed_worker_is_replaced_even_if_a_restart_fails(self):
+        with open(self.failures, 'w') as f:
+            f.write('fail\nfail\n')
+        crashed = sorted(self.workers)[0]
+
+        os.kill(crashed, signal.SIGKILL)
+
+        workers = self.wait_for(lambda: self.replaced(crashed))
+        with open(self.failures) as f:
+            self.assertEqual(f.read(), '')
+        self.assertIn(self.get(), workers)
+
+    def test_sighup_replaces_every_worker_without_failed_requests(self):
+        self.master.send_signal(signal.SIGHUP)
+
+        deadline = time.monotonic() + 15
+        while time.monotonic() < deadline:
+            # 重载期间每个请求都必须成功
+            self.get()
+            workers = self.serving()
+            if workers and not workers & self.workers:
+                break
+            time.sleep(0.05)
+        else:
+            self.fail('workers were not replaced')
+        self.assertIn(self.get(), workers)
+
+    def test_aborted_reload_keeps_old_workers_restartable(self):
+        with open(self.failures, 'w') as f:
+            f.write('fail\n')
+        self.master.send_signal(signal.SIGHUP)
+        # 重载失败后旧进程保持不变
+        self.wait_for(lambda: not open(self.failures).read())
+        self.assertEqual(self.serving(), self.workers)
+
+        crashed = sorted(self.workers)[0]
+        os.kill(crashed, signal.SIGKILL)
+
+        self.wait_for(lambda: self.replaced(crashed))
+
+
+if __name__ == '__main__':
+    unittest.main()
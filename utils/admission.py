@@ -0,0 +1,190 @@
+import threading
+import time
+
+from metrics import admission_queue_seconds, admission_rejections
+from utils.json_provider import dumps_bytes
+from utils.utils import STATUS_CODES
+
+
+class Budget:
+    """
+    Concurrency budget of one request class: at most ``limit`` requests run
+    at once, at most ``queue_size`` more wait for a slot, each for at most
+    ``timeout`` seconds.
+    """
+
+    def __init__(self, name, limit, queue_size, timeout):
+        self.name = name
+        self.limit = limit
+        self.queue_size = queue_size
+        self.timeout = timeout
+        self.in_flight = 0
+        self.waiting = 0
+        self._slots = threading.BoundedSemaphore(limit)
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        """
+        Take a slot. Returns None on success, otherwise the reason the
+        request is rejected ('queue_full' or 'timeout').
+        """
+        start = time.perf_counter()
+        admitted = self._slots.acquire(blocking=False)
+        if not admitted:
+            with self._lock:
+                if self.waiting >= self.queue_size:
+                    return 'queue_full'
+                self.waiting += 1
+            try:
+                admitted = self._slots.acquire(timeout=self.timeout)
+            finally:
+                with self._lock:
+                    self.waiting -= 1
+        # 排队时间包含超时被拒绝的请求
+        admission_queue_seconds.observe(time.perf_counter() - start,
+                                        **{'class': self.name})
+        if not admitted:
+            return 'timeout'
+        with self._lock:
+            self.in_flight += 1
+        return None
+
+    def release(self):
+        with self._lock:
+            self.in_flight -= 1
+        self._slots.release()
+
+
+class AdmissionMiddleware:
+    """
+    WSGI middleware that sheds load before Flask does any work.
+
+    Requests are classified by path prefix into budgets (e.g. an expensive
+    one for login and bulk writes, whose PBKDF2 hashing dominates CPU, and
+    a default one for everything else). A request that cannot get a slot
+    before its deadline, or finds the wait queue full, gets an immediate
+    503 with Retry-After. The slot is held until the response has been
+    sent, so streamed responses count for their whole duration.
+    """
+
+    def __init__(self,
+                 wsgi_app,
+                 budgets,
+                 routes=(),
+                 exempt=(),
+                 retry_after=1):
+        self.wsgi_app = wsgi_app
+        self.budgets = budgets
+        # 前缀越长越优先匹配
+        self.routes = sorted(routes, key=lambda route: -len(route[0]))
+        self.exempt = tuple(exempt)
+        self.retry_after = str(retry_after)
+        self._body = dumps_bytes({'data': None, 'message': STATUS_CODES[503]})
+
+    def classify(self, path):
+        if self.exempt and path.startswith(self.exempt):
+            return None
+        for prefix, name in self.routes:
+            if path.startswith(prefix):
+                return self.budgets[name]
+        return self.budgets['default']
+
+    def __call__(self, environ, start_response):
+        budget = self.classify(environ.get('PATH_INFO', ''))
+        if budget is None:
+            return self.wsgi_app(environ, start_response)
+
+        reason = budget.acquire()
+        if reason is not None:
+            admission_rejections.inc(**{
+                'class': budget.name,
+                'reason': reason
+            })
+            start_response('503 SERVICE UNAVAILABLE', [
+                ('Content-Type', 'application/json'),
+                ('Content-Length', str(len(self._body))),
+                ('Retry-After', self.retry_after),
+            ])
+            return [self._body]
+
+        try:
+            response = self.wsgi_app(environ, start_response)
+        except BaseException:
+            budget.release()
+            raise
+        return _ReleaseOnClose(response, budget.release)
+
+    def stats(self):
+        return {
+            name: {
+                'limit': budget.limit,
+                'in_flight': budget.in_flight,
+                'waiting': budget.waiting,
+            }
+            for name, budget in self.budgets.items()
+        }
+
+
+class _ReleaseOnClose:
+    """
+    Wraps a WSGI response iterable and calls ``release`` exactly once: when
+    the iterable is exhausted or when it is closed, whichever comes first.
+    A client that reads the body without closing it (e.g. the test client)
+    therefore does not keep the slot.
+    """
+
+    def __init__(self, iterable, release):
+        self.iterable = iterable
+        self._release = release
+
+    def __iter__(self):
+        try:
+            yield from self.iterable
+        finally:
+            self._release_once()
+
+    def close(self):
+        try:
+            close = getattr(self.iterable, 'close', None)
+            if close is not None:
+                close()
+        finally:
+            self._release_once()
+
+    def _release_once(self):
+        release, self._release = self._release, None
+        if release is not None:
+            release()
+
+
+def init_admission(app):
+    """
+    Wrap ``app.wsgi_app`` in the admission middleware configured by the
+    ADMISSION_* settings. The metrics path is never limited, so the service
+    can still be observed while it sheds load.
+    """
+    config = app.config
+    if not config.get('ADMISSION_ENABLED', True):
+        return None
+
+    timeout = config['ADMISSION_QUEUE_TIMEOUT']
+    budgets = {
+        'expensive':
+            Budget('expensive', config['ADMISSION_EXPENSIVE_LIMIT'],
+                   config['ADMISSION_EXPENSIVE_QUEUE'], timeout),
+        'default':
+            Budget('default', config['ADMISSION_DEFAULT_LIMIT'],
+                   config['ADMISSION_DEFAULT_QUEUE'], timeout),
+    }
+    routes = [(prefix, 'expensive')
+              for prefix in config['ADMISSION_EXPENSIVE_PATHS']]
+    exempt = [config.get('METRICS_PATH', '/metrics')]
+    middleware = AdmissionMiddleware(
+        app.wsgi_app,
+        budgets,
+        routes=routes,
+        exempt=exempt,
+        retry_after=config['ADMISSION_RETRY_AFTER'])
+    app.wsgi_app = middleware
+    app.extensions['admission'] = middleware
+    return middleware
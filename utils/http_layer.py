@@ -0,0 +1,107 @@
+import gzip
+import hashlib
+from flask import request
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+COMPRESSIBLE_MIMETYPES = {'application/json', 'text/plain', 'text/html'}
+
+
+def etag_matches(etag):
+    """
+    True if the request's If-None-Match contains ``etag``, also when the
+    client sends back the tag of a compressed representation
+    (``"<etag>-gzip"`` or ``"<etag>-br"``).
+    """
+    if_none_match = request.if_none_match
+    if if_none_match.star_tag:
+        return True
+    return any(tag == etag or tag.startswith(f'{etag}-')
+               for tag in if_none_match.as_set(include_weak=True))
+
+
+def not_modified(app, response):
+    """
+    Build the 304 for ``response``, keeping the validator and caching
+    headers but not the body.
+    """
+    resp = app.response_class(status=304)
+    del resp.headers['Content-Type']
+    for key in ('ETag', 'Cache-Control', 'Expires', 'Vary', 'Set-Cookie'):
+        for value in response.headers.getlist(key):
+            resp.headers.add(key, value)
+    return resp
+
+
+def conditional_response(app, response):
+    """
+    Give successful GET responses a strong ETag (the one set by the view,
+    or a hash of the body) and answer a matching If-None-Match with 304.
+    """
+    if request.method not in ('GET', 'HEAD') or response.status_code != 200 \
+            or response.direct_passthrough or response.is_streamed:
+        return response
+    etag, _ = response.get_etag()
+    if etag is None:
+        etag = hashlib.blake2b(response.get_data(),
+                               digest_size=16).hexdigest()
+        response.set_etag(etag)
+    if etag_matches(etag):
+        return not_modified(app, response)
+    return response
+
+
+def compress_response(config, response):
+    """
+    Compress the body with the best encoding the client accepts (brotli if
+    installed, otherwise gzip) once it reaches COMPRESS_MIN_SIZE bytes.
+    """
+    if response.status_code < 200 or response.status_code in (204, 304) \
+            or response.direct_passthrough or response.is_streamed \
+            or 'Content-Encoding' in response.headers \
+            or response.mimetype not in COMPRESSIBLE_MIMETYPES:
+        return response
+    data = response.get_data()
+    if len(data) < config['COMPRESS_MIN_SIZE']:
+        return response
+
+    response.vary.add('Accept-Encoding')
+    encodings = ['br', 'gzip'] if brotli is not None else ['gzip']
+    encoding = request.accept_encodings.best_match(encodings)
+    if encoding == 'br':
+        data = brotli.compress(data, quality=config['COMPRESS_BR_LEVEL'])
+    elif encoding == 'gzip':
+        data = gzip.compress(data,
+                             compresslevel=config['COMPRESS_LEVEL'],
+                             mtime=0)
+    else:
+        return response
+
+    response.set_data(data)
+    response.headers['Content-Encoding'] = encoding
+    # 压缩后的内容是另一种表示，强 ETag 需要区分
+    etag, weak = response.get_etag()
+    if etag is not None:
+        response.set_etag(f'{etag}-{encoding}', weak)
+    return response
+
+
+def init_http_layer(app):
+    """
+    Register conditional GET (ETag/304) and response compression for every
+    response of ``app``.
+
+    Register it after ``init_metrics`` so the metrics see the final status
+    code (Flask runs ``after_request`` hooks in reverse order).
+    """
+
+    @app.after_request
+    def finalize_response(response):
+        if app.config.get('ETAG_ENABLED', True):
+            response = conditional_response(app, response)
+        if app.config.get('COMPRESS_ENABLED', True):
+            response = compress_response(app.config, response)
+        return response
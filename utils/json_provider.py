@@ -0,0 +1,68 @@
+import dataclasses
+import datetime
+import decimal
+import json
+import uuid
+from flask.json.provider import DefaultJSONProvider
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+
+def _default(o):
+    # orjson 原生支持 datetime 和 UUID，这里只在标准库回退时用到它们
+    if isinstance(o, (datetime.date, datetime.time)):
+        return o.isoformat()
+    if isinstance(o, (uuid.UUID, decimal.Decimal)):
+        return str(o)
+    if dataclasses.is_dataclass(o):
+        return dataclasses.asdict(o)
+    if hasattr(o, '__html__'):
+        return str(o.__html__())
+    raise TypeError(f'Object of type {type(o).__name__} is not JSON '
+                    'serializable')
+
+
+def dumps_bytes(obj):
+    """
+    Serialize ``obj`` to compact UTF-8 JSON bytes, with orjson if it is
+    installed. Datetimes are written in ISO 8601.
+    """
+    if orjson is not None:
+        return orjson.dumps(obj,
+                            default=_default,
+                            option=orjson.OPT_NON_STR_KEYS)
+    return json.dumps(obj,
+                      default=_default,
+                      ensure_ascii=False,
+                      separators=(',', ':')).encode('utf-8')
+
+
+class JSONProvider(DefaultJSONProvider):
+    """
+    Flask JSON provider backed by orjson, falling back to the standard
+    library when orjson is not installed.
+
+    Unlike Flask's default it does not sort keys, always writes compact
+    JSON and encodes datetimes as ISO 8601 instead of HTTP dates.
+    """
+
+    default = staticmethod(_default)
+    sort_keys = False
+
+    def dumps(self, obj, **kwargs):
+        if orjson is not None and not kwargs:
+            return dumps_bytes(obj).decode('utf-8')
+        return super().dumps(obj, **kwargs)
+
+    def loads(self, s, **kwargs):
+        if orjson is not None and not kwargs:
+            return orjson.loads(s)
+        return super().loads(s, **kwargs)
+
+    def response(self, *args, **kwargs):
+        obj = self._prepare_response_obj(args, kwargs)
+        return self._app.response_class(dumps_bytes(obj),
+                                        mimetype=self.mimetype)
@@ -0,0 +1,40 @@
+import csv
+import datetime
+import io
+from utils.json_provider import dumps_bytes
+
+
+def ndjson_chunks(batches):
+    """
+    Turn batches of dicts into NDJSON chunks, one chunk per batch.
+    """
+    for batch in batches:
+        yield b''.join(dumps_bytes(row) + b'\n' for row in batch)
+
+
+def csv_chunks(batches, columns):
+    """
+    Turn batches of dicts into CSV chunks: the header first, then one chunk
+    per batch. Datetimes are written in ISO 8601, None as an empty field.
+    """
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(columns)
+    yield _drain(buffer)
+    for batch in batches:
+        writer.writerows([_csv_value(row.get(column)) for column in columns]
+                         for row in batch)
+        yield _drain(buffer)
+
+
+def _csv_value(value):
+    if isinstance(value, (datetime.date, datetime.time)):
+        return value.isoformat()
+    return value
+
+
+def _drain(buffer):
+    data = buffer.getvalue().encode('utf-8')
+    buffer.seek(0)
+    buffer.truncate()
+    return data
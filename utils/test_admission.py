@@ -0,0 +1,116 @@
+import threading
+import unittest
+from flask import Flask
+from config import TestingConfig
+from utils.admission import AdmissionMiddleware, Budget, init_admission
+
+
+def hello_app(environ, start_response):
+    start_response('200 OK', [('Content-Type', 'text/plain')])
+    return [b'hello']
+
+
+def call(app, path):
+    status = []
+    body = app({'PATH_INFO': path},
+               lambda code, headers: status.append((code, dict(headers))))
+    return status[0][0], status[0][1], body
+
+
+class BudgetTestCase(unittest.TestCase):
+
+    def test_waiter_times_out(self):
+        budget = Budget('test', limit=1, queue_size=1, timeout=0.05)
+        self.assertIsNone(budget.acquire())
+
+        self.assertEqual(budget.acquire(), 'timeout')
+        self.assertEqual(budget.waiting, 0)
+
+    def test_full_queue_rejects_immediately(self):
+        budget = Budget('test', limit=1, queue_size=0, timeout=5)
+        budget.acquire()
+
+        self.assertEqual(budget.acquire(), 'queue_full')
+
+    def test_waiter_is_admitted_on_release(self):
+        budget = Budget('test', limit=1, queue_size=1, timeout=5)
+        budget.acquire()
+        results = []
+        waiter = threading.Thread(
+            target=lambda: results.append(budget.acquire()))
+        waiter.start()
+
+        budget.release()
+        waiter.join()
+
+        self.assertEqual(results, [None])
+        self.assertEqual(budget.in_flight, 1)
+
+
+class AdmissionMiddlewareTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.app = AdmissionMiddleware(
+            hello_app, {
+                'expensive': Budget('expensive', 1, 0, 0.01),
+                'default': Budget('default', 2, 0, 0.01),
+            },
+            routes=[('/api/user/login', 'expensive')],
+            exempt=['/metrics'],
+            retry_after=3)
+
+    def test_sheds_expensive_requests_with_503(self):
+        status, _, first = call(self.app, '/api/user/login')
+        self.assertEqual(status, '200 OK')
+
+        status, headers, body = call(self.app, '/api/user/login')
+        self.assertTrue(status.startswith('503'))
+        self.assertEqual(headers['Retry-After'], '3')
+        self.assertIn(b'Service Unavailable', b''.join(body))
+
+        # 其他接口使用独立的预算
+        self.assertEqual(call(self.app, '/api/user/user')[0], '200 OK')
+
+        first.close()
+        self.assertEqual(call(self.app, '/api/user/login')[0], '200 OK')
+
+    def test_slot_is_released_once_when_body_is_read(self):
+        _, _, body = call(self.app, '/api/user/login')
+        self.assertEqual(b''.join(body), b'hello')
+        body.close()
+
+        budget = self.app.budgets['expensive']
+        self.assertEqual(budget.in_flight, 0)
+        _, _, body = call(self.app, '/api/user/login')
+        self.assertEqual(budget.in_flight, 1)
+        body.close()
+        self.assertEqual(budget.in_flight, 0)
+
+    def test_exempt_path_is_never_limited(self):
+        call(self.app, '/api/user/user')
+        call(self.app, '/api/user/user')
+
+        self.assertTrue(call(self.app, '/api/user/user')[0].startswith('503'))
+        self.assertEqual(call(self.app, '/metrics')[0], '200 OK')
+
+    def test_init_admission_wraps_flask_app(self):
+        app = Flask(__name__)
+        app.config.from_object(TestingConfig)
+        app.config['ADMISSION_DEFAULT_LIMIT'] = 1
+        app.config['ADMISSION_DEFAULT_QUEUE'] = 0
+
+        @app.route('/ping')
+        def ping():
+            return 'pong'
+
+        middleware = init_admission(app)
+        client = app.test_client()
+        for _ in range(3):
+            # 读完响应体即释放名额，无需显式关闭
+            self.assertEqual(client.get('/ping').data, b'pong')
+
+        self.assertEqual(middleware.stats()['default']['in_flight'], 0)
+
+
+if __name__ == '__main__':
+    unittest.main()
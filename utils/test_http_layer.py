@@ -0,0 +1,98 @@
+import gzip
+import unittest
+from flask import Flask, jsonify
+from config import TestingConfig
+from utils.http_layer import etag_matches, init_http_layer
+
+
+class HttpLayerTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.app = Flask(__name__)
+        self.app.config.from_object(TestingConfig)
+        self.app.config['COMPRESS_MIN_SIZE'] = 100
+        self.calls = []
+
+        @self.app.route('/items')
+        def items():
+            self.calls.append('items')
+            return jsonify([{'id': i, 'name': f'item {i}'} for i in range(50)])
+
+        @self.app.route('/small')
+        def small():
+            return jsonify({'ok': True})
+
+        @self.app.route('/versioned')
+        def versioned():
+            if etag_matches('v1'):
+                return self.app.response_class(status=304)
+            self.calls.append('versioned')
+            response = jsonify([i for i in range(100)])
+            response.set_etag('v1')
+            return response
+
+        @self.app.route('/items', methods=['POST'])
+        def create_item():
+            return jsonify([i for i in range(100)])
+
+        init_http_layer(self.app)
+        self.client = self.app.test_client()
+
+    def test_unchanged_resource_returns_304(self):
+        first = self.client.get('/items')
+        etag = first.headers['ETag']
+
+        second = self.client.get('/items', headers={'If-None-Match': etag})
+
+        self.assertEqual(first.status_code, 200)
+        self.assertEqual(second.status_code, 304)
+        self.assertEqual(second.data, b'')
+        self.assertEqual(second.headers['ETag'], etag)
+
+    def test_changed_etag_returns_body(self):
+        response = self.client.get('/items',
+                                   headers={'If-None-Match': '"stale"'})
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.json), 50)
+
+    def test_gzip_when_accepted_and_large_enough(self):
+        plain = self.client.get('/items')
+        compressed = self.client.get('/items',
+                                     headers={'Accept-Encoding': 'gzip'})
+
+        self.assertNotIn('Content-Encoding', plain.headers)
+        self.assertEqual(compressed.headers['Content-Encoding'], 'gzip')
+        self.assertIn('Accept-Encoding', compressed.headers['Vary'])
+        self.assertEqual(gzip.decompress(compressed.data), plain.data)
+        self.assertEqual(compressed.headers['ETag'],
+                         plain.headers['ETag'][:-1] + '-gzip"')
+
+    def test_small_responses_are_not_compressed(self):
+        response = self.client.get('/small',
+                                   headers={'Accept-Encoding': 'gzip'})
+
+        self.assertNotIn('Content-Encoding', response.headers)
+
+    def test_compressed_etag_is_accepted_by_view(self):
+        first = self.client.get('/versioned',
+                                headers={'Accept-Encoding': 'gzip'})
+
+        second = self.client.get('/versioned',
+                                 headers={
+                                     'Accept-Encoding': 'gzip',
+                                     'If-None-Match': first.headers['ETag']
+                                 })
+
+        self.assertEqual(first.headers['ETag'], '"v1-gzip"')
+        self.assertEqual(second.status_code, 304)
+        self.assertEqual(self.calls, ['versioned'])
+
+    def test_non_get_requests_get_no_etag(self):
+        response = self.client.post('/items')
+
+        self.assertNotIn('ETag', response.headers)
+
+
+if __name__ == '__main__':
+    unittest.main()
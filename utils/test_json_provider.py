@@ -0,0 +1,64 @@
+import datetime
+import json
+import unittest
+import uuid
+from unittest import mock
+from flask import Flask, jsonify
+from utils import json_provider
+from utils.json_provider import JSONProvider, dumps_bytes
+from utils.utils import make_static_response
+
+
+class JSONProviderTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.app = Flask(__name__)
+        self.app.json = JSONProvider(self.app)
+        self.value = {
+            'id': uuid.UUID('12345678-1234-5678-1234-567812345678'),
+            'created_at': datetime.datetime(2023, 5, 1, 12, 30, 15, 250000),
+            'name': '用户',
+        }
+        self.expected = {
+            'id': '12345678-1234-5678-1234-567812345678',
+            'created_at': '2023-05-01T12:30:15.250000',
+            'name': '用户',
+        }
+
+    def test_datetimes_and_uuids_are_encoded_natively(self):
+        with self.app.app_context():
+            response = jsonify(self.value)
+
+        self.assertEqual(response.mimetype, 'application/json')
+        self.assertEqual(json.loads(response.get_data()), self.expected)
+
+    def test_stdlib_fallback_matches_orjson(self):
+        with mock.patch.object(json_provider, 'orjson', None):
+            body = dumps_bytes(self.value)
+            with self.app.app_context():
+                response = jsonify(self.value)
+
+        self.assertEqual(json.loads(body), self.expected)
+        self.assertEqual(json.loads(response.get_data()), self.expected)
+
+    def test_static_response_reuses_serialized_body(self):
+        with self.app.app_context():
+            first, code = make_static_response(
+                401,
+                message='login has expired.',
+                headers=[('Set-Cookie', 'access_token=; Max-Age=-1')])
+            second, _ = make_static_response(401,
+                                             message='login has expired.')
+
+        self.assertEqual(code, 401)
+        self.assertEqual(first.status_code, 401)
+        self.assertEqual(first.json, {
+            'data': None,
+            'message': 'login has expired.'
+        })
+        self.assertIn('Set-Cookie', first.headers)
+        self.assertIs(first.response[0], second.response[0])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,32 @@
+import datetime
+import json
+import unittest
+from utils.streaming import csv_chunks, ndjson_chunks
+
+BATCHES = [
+    [{'id': 'a', 'created_at': datetime.datetime(2024, 1, 2, 3, 4, 5)}],
+    [],
+    [{'id': 'b', 'created_at': None}],
+]
+
+
+class StreamingTestCase(unittest.TestCase):
+
+    def test_ndjson_one_chunk_per_batch(self):
+        chunks = list(ndjson_chunks(BATCHES))
+
+        self.assertEqual(len(chunks), 3)
+        rows = [json.loads(line) for line in b''.join(chunks).splitlines()]
+        self.assertEqual(rows[0]['created_at'], '2024-01-02T03:04:05')
+        self.assertIsNone(rows[1]['created_at'])
+
+    def test_csv_header_then_rows(self):
+        chunks = list(csv_chunks(BATCHES, ['id', 'created_at']))
+
+        self.assertEqual(chunks[0], b'id,created_at\r\n')
+        self.assertEqual(b''.join(chunks[1:]),
+                         b'a,2024-01-02T03:04:05\r\nb,\r\n')
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -1,4 +1,8 @@
-from flask import jsonify
+import time
+from contextlib import contextmanager
+from functools import lru_cache
+from flask import current_app, jsonify
+from utils.json_provider import dumps_bytes
 
 STATUS_CODES = {
     200:
@@ -22,6 +26,8 @@ STATUS_CODES = {
     408:
     'Request Timeout - The server did not receive a complete request message within the time that it was '
     'prepared to wait.',
+    429:
+    'Too Many Requests - The user has sent too many requests in a given amount of time.',
     500:
     'Internal Server Error - The server encountered an unexpected condition that prevented it from fulfilling '
     'the request.',
@@ -80,3 +86,43 @@ def make_response(code, data=None, message=None):
     if message is None:
         message = STATUS_CODES.get(code, '')
     return jsonify({'data': data, 'message': message}), code
+
+
+@lru_cache(maxsize=256)
+def _static_body(message):
+    return dumps_bytes({'data': None, 'message': message})
+
+
+def make_static_response(code, message=None, headers=None):
+    """
+    Like ``make_response`` for responses without data, but the body for each
+    message is serialized only once and then reused. Meant for the fixed
+    error bodies on hot paths, such as the 401s sent by token validation.
+
+    Parameters:
+       code (int): The status code of the response.
+       message (Optional[str]): The message to include in the response.
+       headers (Optional[List[Tuple[str, str]]]): Extra response headers.
+
+    Returns:
+       Tuple[Response, int]: The response object and the status code.
+    """
+    if message is None:
+        message = STATUS_CODES.get(code, '')
+    response = current_app.response_class(_static_body(message),
+                                          status=code,
+                                          headers=headers,
+                                          mimetype='application/json')
+    return response, code
+
+
+@contextmanager
+def timed(timings, phase):
+    """
+    Add the seconds spent in the ``with`` block to ``timings[phase]``.
+    """
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        timings[phase] = timings.get(phase, 0.0) + time.perf_counter() - start
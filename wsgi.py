@@ -1,87 +1,123 @@
+import eventlet
+
+if __name__ == '__main__':
+    # 必须在导入其他模块之前打补丁，连接池等待等线程原语才会让出协程
+    eventlet.monkey_patch()
+
+# config 和 log 在导入时读取环境变量，.env 必须在它们之前加载
+import load_env  # noqa: F401
 import os
+import time
 from eventlet import wsgi
-import eventlet
-from flask import Flask, g, request, current_app
+from flask import Flask, request, current_app
 from flask_cors import CORS
+from werkzeug.http import dump_cookie
 
 
 from apis import blueprint as api
 from config import ProductionConfig
-from database import db, setup_db
+from database import setup_db
+from database.models import db
+from database.replicas import replica_reads
+from database.green import make_psycopg2_green
+from database.session import request_stats
 from log import logging
+from metrics import MultiProcessCollector
+from metrics.flask_metrics import init_metrics
+from metrics.profiler import init_profiler
 from auth.auth_service import AuthService
-from utils.utils import make_response
-import load_env
+from auth.password_hasher import password_hasher
+from prefork import PreforkServer
+from utils.admission import init_admission
+from utils.http_layer import init_http_layer
+from utils.json_provider import JSONProvider
+from utils.utils import make_response, make_static_response, timed
+
+# 登录失效时清除 cookie 的响应头只生成一次
+EXPIRED_LOGIN_COOKIES = [
+    ('Set-Cookie',
+     dump_cookie(key, '', max_age=-1, expires=0, path='/', httponly=httponly))
+    for key, httponly in (('access_token', True), ('refresh_token', True),
+                          ('logged_in', False))
+]
+
 
 def validate_token(request, current_app):
     try:
-        if not request.endpoint.endswith('login'):
+        if not request.endpoint.endswith('login') and \
+                request.endpoint != 'metrics':
             access_token = request.cookies.get('access_token')
-            resp = None
+            is_valid = False
             if access_token is not None:
-                is_valid, _ = current_app.config[
-                    'AUTH_SERVICE'].verify_token_expiration(access_token)
-                if not is_valid:
-                    resp = make_response(401,
-                                         data=None,
-                                         message=f'login has expired.')
-
-            else:
-                resp = make_response(401,
-                                     data=None,
-                                     message=f'login has expired.')
-            if resp is not None:
-                resp[0].set_cookie('access_token',
-                                   "",
-                                   max_age=-1,
-                                   path='/',
-                                   secure=False,
-                                   httponly=True)
-                resp[0].set_cookie('refresh_token',
-                                   "",
-                                   max_age=-1,
-                                   path='/',
-                                   secure=False,
-                                   httponly=True)
-                resp[0].set_cookie('logged_in',
-                                   '',
-                                   max_age=-1,
-                                   path='/',
-                                   secure=False,
-                                   httponly=False)
-                return resp
+                # 令牌查询只读，写请求也可以走副本
+                with replica_reads():
+                    is_valid, _ = current_app.config[
+                        'AUTH_SERVICE'].verify_token_expiration(access_token)
+            if not is_valid:
+                return make_static_response(401,
+                                            message='login has expired.',
+                                            headers=EXPIRED_LOGIN_COOKIES)
     except Exception as e:
-        return make_response(401, data=None, message=f'{str(e)}')
+        # 异常信息各不相同，不经过静态响应体的缓存
+        return make_response(401, message=f'{str(e)}')
 
 
 def before_request():
     response = validate_token(request, current_app)
     if response is not None:
         return response
-    g.db = db.session()
 
 
 def after_request(response):
-    db_session = g.pop('db', None)
-
-    if db_session is not None:
-        db_session.close()
-
+    stats = request_stats()
+    # 惰性格式化：INFO 级别下每个请求不必拼接这条日志
+    logging.debug('%s %s db sessions:%s queries:%s db time:%.4fs',
+                  request.method, request.path, stats['sessions'],
+                  stats['queries'], stats['db_time'])
     return response
 
 
-def create_app():
-    backend_app = Flask(__name__)
-    CORS(backend_app, resources={r"/*": {"origins": "*"}})
-    backend_app.config.from_object(ProductionConfig)
-    backend_app.config['AUTH_SERVICE'] = AuthService(
-        backend_app.config['AUTH_CONFIG'], )
-
-    setup_db(backend_app)
-    backend_app.register_blueprint(api)
-    backend_app.before_request(before_request)
-    backend_app.after_request(after_request)
-
+def create_app(settings=None):
+    """
+    Build the app from ProductionConfig; ``settings`` overrides individual
+    config keys (e.g. SQLALCHEMY_DATABASE_URI for benchmarks).
+    """
+    start = time.perf_counter()
+    timings = {}
+    with timed(timings, 'config'):
+        backend_app = Flask(__name__)
+        CORS(backend_app, resources={r"/*": {"origins": "*"}})
+        backend_app.config.from_object(ProductionConfig)
+        if settings:
+            backend_app.config.update(settings)
+        backend_app.json = JSONProvider(backend_app)
+        backend_app.extensions['startup_timings'] = timings
+    with timed(timings, 'auth_service'):
+        password_hasher.configure(
+            pool_size=backend_app.config['PASSWORD_HASH_POOL_SIZE'],
+            backend=backend_app.config['PASSWORD_HASH_BACKEND'])
+        backend_app.config['AUTH_SERVICE'] = AuthService(
+            backend_app.config['AUTH_CONFIG'], )
+
+    timings.update(setup_db(backend_app))
+    with timed(timings, 'routes'):
+        backend_app.register_blueprint(api)
+        # 需要在令牌校验之前注册，请求耗时才包含校验时间
+        profiler = init_profiler(backend_app)
+        init_metrics(backend_app, db)
+        init_http_layer(backend_app)
+        backend_app.before_request(before_request)
+        if profiler is not None:
+            # 按请求头触发的采样只对通过令牌校验的请求生效
+            backend_app.before_request(profiler.start_on_header)
+        backend_app.after_request(after_request)
+        # 在 Flask 处理请求之前按并发预算拒绝过载请求
+        init_admission(backend_app)
+
+    phases = ' '.join(f'{phase}={seconds:.3f}s'
+                      for phase, seconds in timings.items())
+    logging.info(f'startup finished in {time.perf_counter() - start:.3f}s '
+                 f'({phases})')
     return backend_app
 
 
@@ -89,6 +125,37 @@ if __name__ == '__main__':
     SERVER_IP = os.environ.get('SERVER_IP', '0.0.0.0')
     SERVER_PORT = int(os.environ.get('SERVER_PORT', 8000))
 
-    app = create_app()
-    logging.info('SRT App is running...')
-    wsgi.server(eventlet.listen((SERVER_IP, SERVER_PORT)), app)
+    # 清理上次运行留下的指标快照
+    if ProductionConfig.METRICS_DIR:
+        MultiProcessCollector.reset(ProductionConfig.METRICS_DIR)
+
+    # 在创建第一个数据库连接之前设置
+    if ProductionConfig.DB_GREEN_PSYCOPG2:
+        make_psycopg2_green()
+
+    if ProductionConfig.SERVER_WORKERS > 1:
+        auth_config = ProductionConfig.AUTH_CONFIG
+        if auth_config['STATELESS_ACCESS_TOKENS'] and \
+                auth_config['REVOCATION_BACKEND'] == 'memory':
+            # 进程内撤销列表只在注销所在的 worker 生效，其他 worker 仍会接受
+            # 已注销的令牌直到其过期
+            raise SystemExit('STATELESS_ACCESS_TOKENS with SERVER_WORKERS > 1 '
+                             'requires REVOCATION_BACKEND=redis')
+        if not ProductionConfig.METRICS_DIR:
+            logging.warning('METRICS_DIR is not set, /metrics only reports '
+                            'the worker that serves the scrape')
+        PreforkServer(create_app, (SERVER_IP, SERVER_PORT),
+                      workers=ProductionConfig.SERVER_WORKERS,
+                      backlog=ProductionConfig.SERVER_BACKLOG,
+                      keepalive=ProductionConfig.SERVER_KEEPALIVE,
+                      max_green_threads=ProductionConfig.SERVER_MAX_GREEN_THREADS,
+                      graceful_timeout=ProductionConfig.SERVER_GRACEFUL_TIMEOUT
+                     ).run()
+    else:
+        app = create_app()
+        logging.info('SRT App is running...')
+        wsgi.server(eventlet.listen((SERVER_IP, SERVER_PORT),
+                                    backlog=ProductionConfig.SERVER_BACKLOG),
+                    app,
+                    max_size=ProductionConfig.SERVER_MAX_GREEN_THREADS,
+                    keepalive=ProductionConfig.SERVER_KEEPALIVE)